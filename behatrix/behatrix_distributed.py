@@ -0,0 +1,408 @@
+"""
+Behatrix
+Behavioral sequences analysis with permutations test
+
+Copyright 2017-2026 Olivier Friard
+
+This file is part of Behatrix.
+
+  Behatrix is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 3 of the License, or
+  any later version.
+
+  Behatrix is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not see <http://www.gnu.org/licenses/>.
+
+
+Permutations test distributed on several computers
+
+A worker (behatrix worker --listen host:port) waits for a coordinator (the command line utility
+with the --workers option). The coordinator pushes the encoded sequences once, then sends the chunks
+of permutations (number of permutations and seed) and merges the count matrices.
+The worker only executes the permutations test (no function is sent by the coordinator).
+
+Messages (tuples sent with multiprocessing.connection, authenticated with the authkey that is
+always required):
+
+    coordinator -> worker: ("data", dict)   sequences and options of the permutations test
+    worker -> coordinator: ("ready", int)   number of processes of the worker
+    coordinator -> worker: ("task", int, int, int, tuple)   task id, number of permutations,
+                                                              entropy and spawn key of the seed
+    worker -> coordinator: ("result", int, result) or ("error", int, str)
+    worker -> coordinator: ("alive",)               every HEARTBEAT_INTERVAL seconds when running tasks
+    coordinator -> worker: ("close",)
+"""
+
+import argparse
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from . import behatrix_functions
+
+# delay (in seconds) between 2 checks of the connection and of the running tasks
+POLL_INTERVAL = 0.05
+
+# delay (in seconds) between 2 messages of a worker running tasks
+HEARTBEAT_INTERVAL = 5
+
+# a worker running tasks is considered lost after this delay (in seconds) without message
+WORKER_TIMEOUT = 60
+
+
+def parse_address(address: str) -> tuple:
+    """
+    parse an address in the host:port format
+
+    Args:
+        address (str): address (host:port)
+
+    Returns:
+        tuple: (host, port)
+    """
+    host, _, port = address.strip().rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"The address {address} is not valid (host:port)")
+    return host.strip("[]"), int(port)
+
+
+def permutations_data(
+    corpus: behatrix_functions.Corpus,
+    observed_matrix,
+    exclusion_list: dict,
+    block_first: bool,
+    block_last: bool,
+    no_repetition: bool = False,
+    histogram_bins: int = 0,
+    ngram: int = 1,
+    within_sequence: bool = False,
+) -> dict:
+    """
+    data of a permutations test pushed to the workers
+
+    Args:
+        see behatrix_functions.share_permutations_data
+
+    Returns:
+        dict: sequences and options of the permutations test
+    """
+    return {
+        "codes": corpus.codes,
+        "offsets": corpus.offsets,
+        "behaviours": list(corpus.behaviours),
+        "observed_matrix": observed_matrix,
+        "exclusion_list": exclusion_list,
+        "block_first": block_first,
+        "block_last": block_last,
+        "no_repetition": no_repetition,
+        "histogram_bins": histogram_bins,
+        "ngram": ngram,
+        "within_sequence": within_sequence,
+    }
+
+
+class Coordinator(concurrent.futures.Executor):
+    """
+    executor distributing the chunks of permutations to remote workers
+
+    The only accepted task is behatrix_functions.shared_permutations_test(nrandom, seed=seed):
+    the number of permutations and the seed are sent to the worker that calls the function
+    on the data pushed at the connection.
+    When a worker disappears its running tasks are submitted again to the other workers.
+    """
+
+    def __init__(self, addresses: list, data: dict, authkey: str):
+        """
+        connect to the workers and push the data of the permutations test
+
+        Args:
+            addresses (list): addresses of the workers ((host, port) tuples)
+            data (dict): data of the permutations test (see permutations_data)
+            authkey (str): authentication key of the workers
+        """
+        self._tasks: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._shutdown = threading.Event()
+        self._threads: list = []
+        self._task_id: int = 0
+        self.capacity: int = 0
+        self.workers: int = 0
+
+        connections = []
+        for address in addresses:
+            try:
+                connection = Client(address, authkey=authkey.encode("utf-8"))
+                connection.send(("data", data))
+                _, n_proc = connection.recv()
+            except (OSError, EOFError, ValueError, AuthenticationError) as exc:
+                logging.warning(
+                    f"Worker {address[0]}:{address[1]} not available: {exc}"
+                )
+                continue
+            connections.append((address, connection, n_proc))
+            self.capacity += n_proc
+
+        if not connections:
+            raise ConnectionError("No worker available")
+
+        self.workers = len(connections)
+        for address, connection, n_proc in connections:
+            thread = threading.Thread(
+                target=self._serve, args=(address, connection, n_proc), daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> concurrent.futures.Future:
+        if fn is not behatrix_functions.shared_permutations_test:
+            raise ValueError("The workers only execute the permutations test")
+        if self._shutdown.is_set():
+            raise RuntimeError("cannot schedule new tasks after shutdown")
+        nrandom = args[0] if args else kwargs["nrandom"]
+        seed = args[1] if len(args) > 1 else kwargs.get("seed")
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._task_id += 1
+            self._tasks.put((self._task_id, future, nrandom, seed))
+            if not self.workers:
+                self._fail_tasks()
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._shutdown.set()
+        if cancel_futures:
+            while True:
+                try:
+                    _, future, *_ = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                future.cancel()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _fail_tasks(self) -> None:
+        """
+        set an exception on the waiting tasks when no worker is connected
+        """
+        while True:
+            try:
+                _, future, *_ = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            if future.running() or future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError("No worker available"))
+
+    def _serve(self, address: tuple, connection, n_proc: int) -> None:
+        """
+        send the tasks to a worker and receive the results until the shutdown
+        """
+        running: dict = {}
+        last_message = time.monotonic()
+        try:
+            while not (self._shutdown.is_set() and not running and self._tasks.empty()):
+                while len(running) < n_proc:
+                    try:
+                        task = self._tasks.get_nowait()
+                    except queue.Empty:
+                        break
+                    task_id, future, nrandom, seed = task
+                    # the tasks of a lost worker are already running
+                    if (
+                        not future.running()
+                        and not future.set_running_or_notify_cancel()
+                    ):
+                        continue
+                    # the delay of the worker is counted from the first task sent after an idle period
+                    if not running:
+                        last_message = time.monotonic()
+                    running[task_id] = task
+                    connection.send(
+                        ("task", task_id, nrandom, seed.entropy, seed.spawn_key)
+                    )
+
+                if not connection.poll(POLL_INTERVAL):
+                    if running and time.monotonic() - last_message > WORKER_TIMEOUT:
+                        raise TimeoutError("no message from the worker")
+                    continue
+                message = connection.recv()
+                last_message = time.monotonic()
+                if message[0] == "alive":
+                    continue
+                _, future, *_ = running.pop(message[1])
+                if message[0] == "result":
+                    future.set_result(message[2])
+                else:
+                    future.set_exception(RuntimeError(message[2]))
+            connection.send(("close",))
+        except (OSError, EOFError) as exc:
+            logging.warning(
+                f"Worker {address[0]}:{address[1]} lost ({type(exc).__name__})"
+            )
+        finally:
+            connection.close()
+
+        with self._lock:
+            # the running tasks are submitted again to the other workers
+            for task in running.values():
+                self._tasks.put(task)
+            self.workers -= 1
+            if not self.workers:
+                self._fail_tasks()
+
+
+def serve_coordinator(connection, n_proc: int) -> None:
+    """
+    execute the tasks of a coordinator
+
+    Args:
+        connection: connection with the coordinator
+        n_proc (int): number of processes
+    """
+    try:
+        _, data = connection.recv()
+    except (OSError, EOFError):
+        return
+    corpus = behatrix_functions.Corpus(
+        data["codes"], data["offsets"], data["behaviours"]
+    )
+    shared_block, handle = behatrix_functions.share_permutations_data(
+        corpus,
+        data["observed_matrix"],
+        data["exclusion_list"],
+        data["block_first"],
+        data["block_last"],
+        data["no_repetition"],
+        data["histogram_bins"],
+        data["ngram"],
+        data["within_sequence"],
+    )
+    running: dict = {}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_proc) as executor:
+            connection.send(("ready", n_proc))
+            last_message = time.monotonic()
+            while True:
+                if connection.poll(POLL_INTERVAL if running else None):
+                    message = connection.recv()
+                    if message[0] == "close":
+                        break
+                    _, task_id, nrandom, entropy, spawn_key = message
+                    running[
+                        executor.submit(
+                            behatrix_functions.shared_permutations_test,
+                            int(nrandom),
+                            handle=handle,
+                            seed=np.random.SeedSequence(
+                                entropy, spawn_key=tuple(spawn_key)
+                            ),
+                        )
+                    ] = task_id
+
+                for future in [future for future in running if future.done()]:
+                    task_id = running.pop(future)
+                    if future.exception() is None:
+                        connection.send(("result", task_id, future.result()))
+                    else:
+                        connection.send(("error", task_id, repr(future.exception())))
+                    last_message = time.monotonic()
+
+                if running and time.monotonic() - last_message > HEARTBEAT_INTERVAL:
+                    connection.send(("alive",))
+                    last_message = time.monotonic()
+    except (OSError, EOFError):
+        logging.warning("Coordinator disconnected")
+    finally:
+        for future in running:
+            future.cancel()
+        shared_block.close()
+        shared_block.unlink()
+
+
+def worker(address: tuple, authkey: str, n_proc: int = 0) -> None:
+    """
+    wait for coordinators and execute their tasks (one coordinator at a time)
+
+    Args:
+        address (tuple): listening address (host, port)
+        authkey (str): authentication key
+        n_proc (int): number of processes (0 for all the available CPU)
+    """
+    n_proc = n_proc if n_proc else os.cpu_count()
+    with Listener(address, authkey=authkey.encode("utf-8")) as listener:
+        print(f"Behatrix worker listening on {address[0]}:{address[1]} ({n_proc} CPU)")
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as exc:
+                # authentication failed or connection aborted
+                logging.warning(f"Connection refused: {exc}")
+                continue
+            print(f"Coordinator connected from {listener.last_accepted}")
+            with connection:
+                serve_coordinator(connection, n_proc)
+            print("Coordinator disconnected")
+
+
+def worker_cli(argv: list) -> None:
+    """
+    command line of the worker: behatrix worker --listen host:port
+    """
+    parser = argparse.ArgumentParser(
+        prog="Behatrix worker",
+        usage="\npython3 -m behatrix worker --listen HOST:PORT [options]",
+        description="Behatrix worker for distributed permutations test",
+    )
+    parser.add_argument(
+        "--listen",
+        action="store",
+        dest="listen",
+        required=True,
+        help="Listening address (HOST:PORT)",
+    )
+    parser.add_argument(
+        "--authkey",
+        action="store",
+        dest="authkey",
+        default=os.environ.get("BEHATRIX_AUTHKEY", ""),
+        help="Authentication key shared with the coordinator (default: BEHATRIX_AUTHKEY environment variable)",
+    )
+    parser.add_argument(
+        "--n-cpu",
+        action="store",
+        dest="n_cpu",
+        help="Number of CPU to use (default: all)",
+        type=int,
+        default=0,
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        address = parse_address(args.listen)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if not args.authkey:
+        parser.error(
+            "An authentication key (--authkey or BEHATRIX_AUTHKEY environment variable) is required"
+        )
+
+    try:
+        worker(address, args.authkey, args.n_cpu)
+    except KeyboardInterrupt:
+        pass
@@ -22,12 +22,192 @@ This file is part of Behatrix.
 """
 
 import collections
+import concurrent.futures
+import functools
+import hashlib
 import itertools
-import random
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
 from typing import Tuple
 
 import numpy as np
 
+# maximum size of a batch of permutations:
+# number of permutations x (events in corpus + cells of the transitions matrix)
+PERMUTATIONS_BATCH_EVENTS = 2**21
+
+# number of permutations between 2 checks of the p-values in adaptive mode
+ADAPTIVE_ROUND_SIZE = 1000
+
+# number of events (number of permutations x events in corpus) in a chunk of permutations
+# distributed to a process
+PERMUTATIONS_CHUNK_EVENTS = 2**23
+
+# maximum number of permutations in a chunk
+PERMUTATIONS_CHUNK_MAX = 10000
+
+# minimum delay (in seconds) between 2 checkpoints of a permutations test
+CHECKPOINT_INTERVAL = 60
+
+# default number of bins of the histograms of the permuted transitions numbers
+HISTOGRAM_BINS = 100
+
+# maximum size of the lookup table of the n-gram transitions (see ngram_lookup)
+NGRAM_LOOKUP_MAX = 2**24
+
+# maximum number of distinct permutations enumerated by the exact permutations test
+EXACT_PERMUTATIONS_MAX = 10**6
+
+# maximum size (in bytes) of the bit vectors of the behaviors packed for the sequences of a tile
+# (see levenshtein_tile)
+LEVENSHTEIN_PACKED_MAX = 2**28
+
+# number of tiles of the distances matrix by process (see distances_tiles)
+DISTANCES_TILES_BY_PROCESS = 4
+
+# maximum number of rows (and columns) of a tile of the distances matrix
+DISTANCES_TILE_MAX = 2048
+
+# maximum width of the diagonal band computed by levenshtein_distance_banded
+# (the bit-parallel computation is faster for the wider bands)
+LEVENSHTEIN_BAND_MAX = 7
+
+# fraction of the pairs of a tile remaining after the rejection of the distant pairs above which
+# all the distances of the tile are computed (see levenshtein_pairs_tile)
+LEVENSHTEIN_PAIRS_DENSE = 0.1
+
+# duration (in seconds) of the task releasing the shared memory in a process of a pool
+# (see detach_pool_worker)
+DETACH_DELAY = 0.05
+
+
+def code_dtype(n_behaviours: int) -> np.dtype:
+    """
+    return the smallest signed integer type able to store the codes of n_behaviours behaviors
+    (the -1 code is reserved for behaviors not in the vocabulary)
+
+    Args:
+        n_behaviours (int): number of behaviors in vocabulary
+
+    Returns:
+        np.dtype: integer type
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_behaviours <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class Corpus:
+    """
+    Integer-encoded corpus of behavioral sequences
+
+    The behaviors are interned to small integer codes (their index in the behaviours list)
+    and all the sequences are stored in one concatenated array of codes.
+    The sequence i is codes[offsets[i]:offsets[i + 1]]
+
+    Attributes:
+        codes (np.ndarray): concatenated codes of all sequences
+        offsets (np.ndarray): start of each sequence in codes (len(offsets) == number of sequences + 1)
+        behaviours (list): vocabulary (the code of a behavior is its index in this list)
+    """
+
+    def __init__(self, codes: np.ndarray, offsets: np.ndarray, behaviours: list):
+        self.codes = codes
+        self.offsets = offsets
+        self.behaviours = list(behaviours)
+
+    @classmethod
+    def from_sequences(
+        cls, sequences: list, behaviours: list | None = None
+    ) -> "Corpus":
+        """
+        encode a list of sequences
+
+        Args:
+            sequences (list): list of sequences (list of behaviors)
+            behaviours (list): vocabulary. If None the sorted list of unique behaviors is used.
+                               Behaviors not in vocabulary are encoded with -1
+
+        Returns:
+            Corpus: encoded sequences
+        """
+        if isinstance(sequences, Corpus):
+            if behaviours is None or list(behaviours) == sequences.behaviours:
+                return sequences
+            sequences = sequences.to_list()
+
+        if behaviours is None:
+            behaviours = sorted(set(itertools.chain.from_iterable(sequences)))
+
+        lengths = np.fromiter(
+            (len(seq) for seq in sequences), dtype=np.int64, count=len(sequences)
+        )
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        index = {behavior: code for code, behavior in enumerate(behaviours)}
+        codes = np.fromiter(
+            (index.get(x, -1) for x in itertools.chain.from_iterable(sequences)),
+            dtype=code_dtype(len(behaviours)),
+            count=int(offsets[-1]),
+        )
+
+        return cls(codes, offsets, behaviours)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """
+        return a view on the codes of sequence i
+        """
+        if i < 0:
+            i += len(self)
+        return self.codes[self.offsets[i] : self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        lengths of sequences
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def n_events(self) -> int:
+        """
+        total number of behaviors in corpus
+        """
+        return len(self.codes)
+
+    def decode(self, i: int) -> list:
+        """
+        return the sequence i as a list of behaviors
+        """
+        return [self.behaviours[code] for code in self[i].tolist()]
+
+    def to_list(self) -> list:
+        """
+        return all sequences as lists of behaviors
+        """
+        return [self.decode(i) for i in range(len(self))]
+
+
+def as_corpus(sequences, behaviours: list | None = None) -> Corpus:
+    """
+    return sequences as a Corpus object (sequences can be a Corpus or a list of sequences)
+    """
+    return Corpus.from_sequences(sequences, behaviours)
+
 
 def remove_comments(s: str) -> str:
     """
@@ -149,19 +329,15 @@ def behavioral_sequence_analysis(
     for node in nodes:
         tot_nodes += nodes[node]
 
-    behaviours = []
-
     # extract unique behaviors
-    for seq in sequences:
-        for c in seq:
-            if c not in behaviours:
-                behaviours.append(c)
+    behaviours = sorted(set(itertools.chain.from_iterable(sequences)))
 
-    behaviours.sort()
+    # integer-encoded sequences
+    corpus = Corpus.from_sequences(sequences, behaviours)
 
     # count n-grams
     out_ngrams: str = ""
-    ngram_transitions: dict = {}
+    transitions_ngrams: dict = {}
     tot_ngrams: list = []
     count_ngram = []
     if ngram > 1:
@@ -179,28 +355,15 @@ def behavioral_sequence_analysis(
         for group in count_ngram:
             out_ngrams += f"{behaviors_separator.join(group)}\t{count_ngram[group] / len(tot_ngrams):.3f}\t{count_ngram[group]} / {len(tot_ngrams)}\n"
 
-        # n-grams transitions
-        for sequence in sequences:
-            for group in count_ngram:
-                count_ngram_transition = collections.Counter(
-                    [
-                        tuple(sequence[i + ngram : i + ngram * 2])
-                        for i in range(len(sequence))
-                        if behaviors_separator.join(sequence).startswith(
-                            behaviors_separator.join(group), i
-                        )
-                        and len(sequence[i + ngram : i + ngram * 2]) == ngram
-                    ]
-                )
-                for ngram_transition in count_ngram_transition:
-                    if (group, ngram_transition) not in ngram_transitions:
-                        ngram_transitions[(group, ngram_transition)] = 0
-                    ngram_transitions[(group, ngram_transition)] += (
-                        count_ngram_transition[ngram_transition]
-                    )
+        # n-grams transitions (n-gram followed by the next n-gram in the same sequence)
+        keys, counts = ngram_transitions(corpus, ngram)
+        transitions_ngrams = dict(
+            zip(decode_ngram_transitions(keys, behaviours, ngram), counts.tolist())
+        )
 
     return {
         "sequences": sequences,
+        "corpus": corpus,
         "transitions": transitions,
         "nodes": nodes,
         "starting_nodes": starting_nodes,
@@ -212,7 +375,7 @@ def behavioral_sequence_analysis(
         "ngrams_total_number": len(tot_ngrams),
         "uniq_ngrams_number": len(count_ngram),
         "ngram_list": list(count_ngram),
-        "ngram_transitions": ngram_transitions,
+        "ngram_transitions": transitions_ngrams,
         "ngram_count": dict(count_ngram),
     }
 
@@ -229,7 +392,7 @@ def check_exclusion_list(
 
     Args:
         exclusion_str (str): exclusion strings (format must be a:bc or a:b|c
-        sequences (list): list of sequences
+        sequences (list): list of sequences or Corpus
         behaviors_separator (str): string to be used to split sequences in behaviors
 
     Returns:
@@ -254,6 +417,19 @@ def check_exclusion_list(
                         exclusion_list[s1] += list(s2)
 
         # test if behavioral sequences do not contain an excluded transition
+        if isinstance(sequences, Corpus):
+            observed_matrix = create_observed_transition_matrix(sequences)
+            for behavior1, behavior2 in excluded_transitions(
+                exclusion_list, sequences.behaviours
+            ):
+                if observed_matrix[behavior1, behavior2]:
+                    return {
+                        "error_code": 1,
+                        "message": f"The behavioral sequences contain an excluded transition: {sequences.behaviours[behavior1]} -> {sequences.behaviours[behavior2]}",
+                        "exclusion_list": {},
+                    }
+            sequences = []
+
         for seq in sequences:
             for i in range(len(seq) - 1):
                 if seq[i] in exclusion_list and seq[i + 1] in exclusion_list[seq[i]]:
@@ -266,6 +442,28 @@ def check_exclusion_list(
     return {"error_code": 0, "exclusion_list": exclusion_list}
 
 
+def excluded_transitions(exclusion_list: dict, behaviours: list) -> list:
+    """
+    return the excluded transitions as pairs of behavior codes
+    (behaviors not in behaviours are ignored)
+
+    Args:
+        exclusion_list (dict): dict of excluded behaviors (see check_exclusion_list)
+        behaviours (list): list of behaviours
+
+    Returns:
+        list: list of (code1, code2) tuples
+    """
+    index = {behavior: code for code, behavior in enumerate(behaviours)}
+    return [
+        (index[behavior1], index[behavior2])
+        for behavior1 in exclusion_list
+        if behavior1 in index
+        for behavior2 in exclusion_list[behavior1]
+        if behavior2 in index
+    ]
+
+
 def draw_diagram(
     cutoff_all,
     cutoff_behavior,
@@ -286,6 +484,9 @@ def draw_diagram(
     """
     create code for GraphViz
     return string containing graphviz code
+
+    significativity: matrix of p-values indexed by behaviors
+                     or dict of p-values indexed by transitions (see ngram_significativity)
     """
 
     def f_edge_label(
@@ -327,6 +528,16 @@ def draw_diagram(
         else:
             return 1
 
+    def p_value(transition: tuple) -> float:
+        """
+        return the significativity of a transition
+        """
+        if isinstance(significativity, dict):
+            return significativity.get(transition, 1)
+        return significativity[
+            behaviors.index(transition[0]), behaviors.index(transition[1])
+        ]
+
     header_out = "digraph G {\n"
 
     nodes_out = "/* node properties */\n"
@@ -381,11 +592,7 @@ legend [shape=none, margin=0, label=<
                 nodes_list.append(node1)
                 nodes_list.append(node2)
 
-                pen_width = (
-                    width(significativity[behaviors.index(i[0]), behaviors.index(i[1])])
-                    if significativity is not None
-                    else 1
-                )
+                pen_width = width(p_value(i)) if significativity is not None else 1
 
                 edges_out += f_edge_label(
                     edge_label,
@@ -418,11 +625,7 @@ legend [shape=none, margin=0, label=<
                 nodes_list.append(node1)
                 nodes_list.append(node2)
 
-                pen_width = (
-                    width(significativity[behaviors.index(i[0]), behaviors.index(i[1])])
-                    if significativity is not None
-                    else 1
-                )
+                pen_width = width(p_value(i)) if significativity is not None else 1
 
                 edges_out += f_edge_label(
                     edge_label,
@@ -451,11 +654,7 @@ legend [shape=none, margin=0, label=<
             nodes_list.append(node1)
             nodes_list.append(node2)
 
-            pen_width = (
-                width(significativity[behaviors.index(i[0]), behaviors.index(i[1])])
-                if significativity is not None
-                else 1
-            )
+            pen_width = width(p_value(i)) if significativity is not None else 1
 
             edges_out += f_edge_label(
                 edge_label,
@@ -491,299 +690,2240 @@ legend [shape=none, margin=0, label=<
     )
 
 
-def create_observed_transition_matrix(sequences: list, behaviours: list) -> np.ndarray:
+def ngram_diagram_data(results: dict, behaviors_separator: str = "") -> dict:
     """
-    create the matrix of observed transitions
+    arguments of draw_diagram for the n-gram transitions
+
+    Args:
+        results (dict): results of behavioral_sequence_analysis (with ngram > 1)
+        behaviors_separator (str): separator used to join the behaviors of the n-grams
+
+    Returns:
+        dict: unique_transitions, nodes, tot_nodes, tot_trans and tot_trans_after_node
+    """
+    unique_transitions = {
+        tuple(behaviors_separator.join(x) for x in transition): n
+        for transition, n in results["ngram_transitions"].items()
+    }
+    tot_trans_after_node: dict = {}
+    for transition, n in unique_transitions.items():
+        tot_trans_after_node[transition[0]] = (
+            tot_trans_after_node.get(transition[0], 0) + n
+        )
+
+    return {
+        "unique_transitions": unique_transitions,
+        "nodes": {
+            behaviors_separator.join(group): n
+            for group, n in results["ngram_count"].items()
+        },
+        "tot_nodes": results["ngrams_total_number"],
+        "tot_trans": sum(unique_transitions.values()),
+        "tot_trans_after_node": tot_trans_after_node,
+    }
+
+
+def ngram_significativity(
+    keys: np.ndarray,
+    p_values: np.ndarray,
+    behaviours: list,
+    ngram: int,
+    behaviors_separator: str = "",
+) -> dict:
     """
-    observed_matrix = np.zeros((len(behaviours), len(behaviours)))
+    p-values of the n-gram transitions indexed by transition (significativity argument of draw_diagram)
 
-    for seq in sequences:
-        for i in range(len(seq) - 1):
-            if seq[i] in behaviours and seq[i + 1] in behaviours:
-                observed_matrix[
-                    behaviours.index(seq[i]), behaviours.index(seq[i + 1])
-                ] += 1
+    Args:
+        keys (np.ndarray): codes of the tested transitions (see ngram_transitions)
+        p_values (np.ndarray): p-values of the transitions (same order than keys)
+        behaviours (list): vocabulary
+        ngram (int): number of behaviors of the n-grams
+        behaviors_separator (str): separator used to join the behaviors of the n-grams
 
-    return observed_matrix
+    Returns:
+        dict: {(n-gram, n-gram): p-value}
+    """
+    return {
+        (
+            behaviors_separator.join(ngram1),
+            behaviors_separator.join(ngram2),
+        ): p_value
+        for (ngram1, ngram2), p_value in zip(
+            decode_ngram_transitions(keys, behaviours, ngram),
+            np.asarray(p_values).tolist(),
+        )
+    }
 
 
-def permutations_test(
-    nrandom: int,
-    sequences,
-    behaviours,
-    exclusion_list,
-    block_first,
-    block_last,
-    observed_matrix: np.array,
-    no_repetition: bool = False,
-) -> Tuple[int, np.ndarray]:
+def transition_counts(
+    codes: np.ndarray,
+    offsets: np.ndarray,
+    n_behaviours: int,
+    pairs_buffer: np.ndarray | None = None,
+) -> np.ndarray:
     """
-    permutations test
+    count the transitions between behaviors of integer-encoded sequences
+
+    The pairs of successive codes are converted in a single pair code (code1 * n_behaviours + code2)
+    and counted with np.bincount. The pairs crossing the boundary between 2 sequences
+    and the pairs containing a behavior not in vocabulary (code -1) are masked
+    (they are counted in an extra bin that is discarded).
+
+    codes can be a 2D array containing a batch of corpora sharing the same offsets (one corpus by row):
+    in this case the transitions of all the batch are counted in one pass.
+
+    If pairs_buffer is given the pair codes are computed in this buffer: the same buffer can be reused
+    for all the batches of a permutations test.
 
     Args:
-        nrandom (int): number of random permutations
-        sequences (list): list of sequences
-        behaviours (list): list of unique observed behaviours
-        block_first (bool): avoid that 1st behavior be permuted
-        block_last (bool): avoid that last behavior be permuted
-        observed_matrix (np.array): matrix of observed transitions number
+        codes (np.ndarray): concatenated codes of sequences (1D) or batch of concatenated codes (2D)
+        offsets (np.ndarray): start of each sequence in codes (see Corpus)
+        n_behaviours (int): number of behaviors in vocabulary
+        pairs_buffer (np.ndarray): 1D int64 buffer of at least batch size x (length of codes - 1) elements
 
     Returns:
-        count_tot
-        risu (numpy array)
+        np.ndarray: matrix (n_behaviours x n_behaviours) of transitions number
+                    or array (batch size x n_behaviours x n_behaviours) if codes is 2D
     """
 
-    # region strings_permutation function
+    batch = codes.reshape(-1, codes.shape[-1])
+    n_cells = n_behaviours * n_behaviours
 
-    def strings_permutation(
-        space: list,
-        sequences: list,
-        exclusion_list: list,
-        block_first: bool,
-        block_last: bool,
-        no_repetition: bool = False,
-    ) -> list:
-        """
-        create permutations of sequences following exclusions list, block first/last behavior
+    if batch.shape[1] < 2:
+        counts = np.zeros((batch.shape[0], n_behaviours, n_behaviours), dtype=np.int64)
+        return counts if codes.ndim == 2 else counts[0]
 
-        Args:
-            space (list): list of all behaviors occurences
-            sequences (list): list of behavioral sequences
-            exclusion_list (dict): dict of excluded behaviors
-            block_first (bool):
+    # pair codes (shifted by row to count all the batch with one bincount)
+    if pairs_buffer is None:
+        pairs = batch[:, :-1].astype(np.int64)
+    else:
+        pairs = pairs_buffer[: batch.shape[0] * (batch.shape[1] - 1)].reshape(
+            batch.shape[0], batch.shape[1] - 1
+        )
+        pairs[...] = batch[:, :-1]
+    pairs *= n_behaviours
+    pairs += batch[:, 1:]
+    pairs += (np.arange(batch.shape[0], dtype=np.int64) * n_cells)[:, None]
 
-        Returns:
+    masked = batch.shape[0] * n_cells
+    if batch.min() < 0:
+        np.copyto(pairs, masked, where=(batch[:, :-1] < 0) | (batch[:, 1:] < 0))
+    # last position of each sequence (the pair with the first behavior of the next sequence)
+    ends = offsets[1:-1]
+    ends = ends[(ends > 0) & (ends < batch.shape[1])]
+    pairs[:, ends - 1] = masked
 
-            list: permuted sequences
-        """
+    counts = np.bincount(pairs.ravel(), minlength=masked + 1)
+    counts = counts[:masked].reshape(batch.shape[0], n_behaviours, n_behaviours)
 
-        space = list(space)
-        perm_sequences: list = []
+    return counts if codes.ndim == 2 else counts[0]
 
-        for seq in sequences:
-            if block_first:
-                newseq: list = [seq[0]]
-                element = seq[0]
-            else:
-                newseq: list = []
-                element: str = ""
-
-            for c in seq[int(block_first) : len(seq) - int(block_last)]:
-                if element in exclusion_list:
-                    space3 = list(space)
-                    # remove element that are not permitted
-                    for i in exclusion_list[element]:
-                        # remove all excluded behaviors
-                        space3 = list([x for x in space3 if x != i])
-
-                    space2 = list(space3)
-                else:
-                    space2 = list(space)
 
-                if space2:
-                    new_element = random.choice(space2)
+def ngram_positions(offsets: np.ndarray, ngram: int) -> np.ndarray:
+    """
+    return the start positions (in the concatenated codes) of the n-gram transitions:
+    windows of 2 x ngram successive behaviors of the same sequence
 
-                    # remove extracted behavior
-                    space.remove(new_element)
+    Args:
+        offsets (np.ndarray): start of each sequence in codes (see Corpus)
+        ngram (int): number of behaviors of the n-grams
 
-                else:
-                    return []
+    Returns:
+        np.ndarray: start positions of the windows
+    """
+    lengths = np.diff(offsets)
+    # end of the sequence of each position
+    ends = np.repeat(offsets[1:], lengths)
+    return np.flatnonzero(np.arange(int(offsets[-1])) + 2 * ngram <= ends)
 
-                # check penultimate element
-                if (
-                    block_last and len(newseq) == len(seq) - 2
-                ):  # DO NOT REPEAT LAST BEHAVIOUR
-                    while (new_element in exclusion_list) and (
-                        seq[-1] in exclusion_list[new_element]
-                    ):
-                        if space2:
-                            new_element = random.choice(space2)
-                        else:
-                            return []
 
-                        # remove last behaviour choosen and last behaviour from original string
-                        space2 = list(space)
+def ngram_transition_codes(
+    codes: np.ndarray, offsets: np.ndarray, n_behaviours: int, ngram: int
+) -> np.ndarray:
+    """
+    encode the n-gram transitions of integer-encoded sequences
 
-                        if element in space2:
-                            space2 = list([x for x in space2 if x != element])
+    The codes of the 2 x ngram behaviors of a transition (n-gram -> following n-gram)
+    are converted in a single integer (digits in base n_behaviours).
 
-                        if seq[-1] in space2:
-                            space2 = list([x for x in space2 if x != seq[-1]])
+    Args:
+        codes (np.ndarray): concatenated codes of sequences (1D) or batch of concatenated codes (2D)
+        offsets (np.ndarray): start of each sequence in codes (see Corpus)
+        n_behaviours (int): number of behaviors in vocabulary
+        ngram (int): number of behaviors of the n-grams
 
-                newseq.append(new_element)
-                element = new_element
+    Returns:
+        np.ndarray: codes of the n-gram transitions (-1 for transitions containing a behavior not in vocabulary)
+    """
+    if max(n_behaviours, 2) ** (2 * ngram) > np.iinfo(np.int64).max:
+        raise ValueError(
+            f"Too many behaviors ({n_behaviours}) to encode the {ngram}-gram transitions"
+        )
 
-            if block_last:
-                newseq.append(seq[-1])
+    positions = ngram_positions(offsets, ngram)
+    batch = codes.reshape(-1, codes.shape[-1])
+    transitions = np.zeros((batch.shape[0], len(positions)), dtype=np.int64)
+    for k in range(2 * ngram):
+        transitions *= n_behaviours
+        transitions += batch[:, positions + k]
+    if len(positions) and batch.min() < 0:
+        unknown = np.zeros(transitions.shape, dtype=bool)
+        for k in range(2 * ngram):
+            unknown |= batch[:, positions + k] < 0
+        transitions[unknown] = -1
 
-            perm_sequences.append(newseq)
+    return transitions if codes.ndim == 2 else transitions[0]
 
-        return perm_sequences
 
-    # endregion
+def ngram_transitions(corpus: Corpus, ngram: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    observed n-gram transitions of the corpus (sparse: only the transitions observed at least once)
 
-    space: list = []
-    for sequence in sequences:
-        space += sequence[int(block_first) : len(sequence) - int(block_last)]
+    Args:
+        corpus (Corpus): encoded sequences
+        ngram (int): number of behaviors of the n-grams
 
-    # modify exclusions list to avoid repetitions
-    if no_repetition:
-        for behavior in behaviours:
-            if behavior not in exclusion_list:
-                exclusion_list[behavior] = []
-            if behavior not in exclusion_list[behavior]:
-                exclusion_list[behavior].append(behavior)
+    Returns:
+        np.ndarray: sorted codes of the observed transitions (see ngram_transition_codes)
+        np.ndarray: number of each observed transition
+    """
+    transitions = ngram_transition_codes(
+        corpus.codes, corpus.offsets, len(corpus.behaviours), ngram
+    )
+    return np.unique(transitions[transitions >= 0], return_counts=True)
 
-    count: int = 0
-    count_tot: int = 0
 
-    results = np.zeros((len(behaviours), len(behaviours)))
+def decode_ngram_transitions(keys: np.ndarray, behaviours: list, ngram: int) -> list:
+    """
+    decode the codes of n-gram transitions
+
+    Args:
+        keys (np.ndarray): codes of the transitions (see ngram_transition_codes)
+        behaviours (list): vocabulary
+        ngram (int): number of behaviors of the n-grams
 
-    while True:
-        permuted_sequences = strings_permutation(
-            space, sequences, exclusion_list, block_first, block_last
+    Returns:
+        list: list of transitions (tuple of behaviors, tuple of behaviors)
+    """
+    digits = np.empty((len(keys), 2 * ngram), dtype=np.int64)
+    remainder = np.array(keys, dtype=np.int64)
+    for k in range(2 * ngram - 1, -1, -1):
+        remainder, digits[:, k] = np.divmod(remainder, len(behaviours))
+
+    return [
+        (
+            tuple(behaviours[code] for code in row[:ngram]),
+            tuple(behaviours[code] for code in row[ngram:]),
         )
+        for row in digits.tolist()
+    ]
 
-        count_tot += 1
 
-        if permuted_sequences:
-            count += 1
+def ngram_lookup(keys: np.ndarray, n_behaviours: int, ngram: int) -> np.ndarray | None:
+    """
+    lookup table of the index of the n-gram transitions in keys (faster than a binary search)
 
-            # analysis
-            permuted_transitions_matrix = np.zeros((len(behaviours), len(behaviours)))
+    Args:
+        keys (np.ndarray): sorted codes of the transitions (see ngram_transitions)
+        n_behaviours (int): number of behaviors in vocabulary
+        ngram (int): number of behaviors of the n-grams
 
-            for seq in permuted_sequences:
-                for i in range(len(seq) - 1):
-                    permuted_transitions_matrix[
-                        behaviours.index(seq[i]), behaviours.index(seq[i + 1])
-                    ] += 1
+    Returns:
+        np.ndarray: index of each possible transition code in keys (len(keys) if not in keys,
+                    the last element is used for the code -1)
+                    None if there are too many possible transitions (more than NGRAM_LOOKUP_MAX)
+    """
+    if n_behaviours ** (2 * ngram) > NGRAM_LOOKUP_MAX:
+        return None
+    lookup = np.full(n_behaviours ** (2 * ngram) + 1, len(keys), dtype=np.int64)
+    lookup[keys] = np.arange(len(keys))
+    return lookup
+
+
+def ngram_transition_counts(
+    codes: np.ndarray,
+    offsets: np.ndarray,
+    n_behaviours: int,
+    ngram: int,
+    keys: np.ndarray,
+    lookup: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    count the n-gram transitions of integer-encoded sequences (sparse version of transition_counts)
 
-            results = results + (permuted_transitions_matrix >= observed_matrix)
+    Only the transitions in keys are counted: the n-gram alphabet grows too fast
+    to count all the possible transitions. The other transitions are counted in an extra bin
+    that is discarded.
 
-            """
-            print("observed_matrix\n", observed_matrix)
-            print()
+    Args:
+        codes (np.ndarray): concatenated codes of sequences (1D) or batch of concatenated codes (2D)
+        offsets (np.ndarray): start of each sequence in codes (see Corpus)
+        n_behaviours (int): number of behaviors in vocabulary
+        ngram (int): number of behaviors of the n-grams
+        keys (np.ndarray): sorted codes of the transitions to count (see ngram_transitions)
+        lookup (np.ndarray): lookup table of keys (see ngram_lookup). If None a binary search is used
 
-            print("permuted_transitions_matrix\n", permuted_transitions_matrix)
-            print()
-            print("permuted_transitions_matrix >= observed_matrix\n", permuted_transitions_matrix >= observed_matrix)
+    Returns:
+        np.ndarray: number of each transition of keys (batch size x len(keys) if codes is 2D)
+    """
+    transitions = ngram_transition_codes(
+        codes.reshape(-1, codes.shape[-1]), offsets, n_behaviours, ngram
+    )
+    n_keys = len(keys)
+    masked = transitions.shape[0] * n_keys
 
-            print()
-            print("results\n", results)
-            print("=====")
-            """
+    if lookup is not None:
+        index = lookup[transitions]
+        found = index < n_keys
+    else:
+        index = np.searchsorted(keys, transitions)
+        np.minimum(index, max(n_keys - 1, 0), out=index)
+        found = (
+            keys[index] == transitions if n_keys else np.zeros(index.shape, dtype=bool)
+        )
+    index += (np.arange(transitions.shape[0], dtype=np.int64) * n_keys)[:, None]
+    np.copyto(index, masked, where=~found)
 
-        if count == nrandom:
-            break
+    counts = np.bincount(index.ravel(), minlength=masked + 1)
+    counts = counts[:masked].reshape(transitions.shape[0], n_keys)
 
-    return count, results
+    return counts if codes.ndim == 2 else counts[0]
 
 
-def levenshtein_distance(seq1: list, seq2: list) -> int:
+def sequence_index(offsets: np.ndarray) -> np.ndarray:
     """
-    calculate the Levenshtein distance between the 2 sequences
+    return the index of the sequence of each position of the concatenated codes
+
+    Args:
+        offsets (np.ndarray): start of each sequence in codes (see Corpus)
+
+    Returns:
+        np.ndarray: index of the sequence of each position
     """
-    size_x = len(seq1) + 1
-    size_y = len(seq2) + 1
-    matrix = np.zeros((size_x, size_y))
-    for x in range(size_x):
-        matrix[x, 0] = x
-    for y in range(size_y):
-        matrix[0, y] = y
-
-    for x in range(1, size_x):
-        for y in range(1, size_y):
-            if seq1[x - 1] == seq2[y - 1]:
-                matrix[x, y] = min(
-                    matrix[x - 1, y] + 1, matrix[x - 1, y - 1], matrix[x, y - 1] + 1
-                )
-            else:
-                matrix[x, y] = min(
-                    matrix[x - 1, y] + 1, matrix[x - 1, y - 1] + 1, matrix[x, y - 1] + 1
-                )
-    return matrix[matrix.shape[0] - 1, matrix.shape[1] - 1]
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
 
 
-def levenshtein_distance_seq_list(seq_list: list) -> np.ndarray:
+def free_positions(
+    offsets: np.ndarray, block_first: bool = False, block_last: bool = False
+) -> np.ndarray:
     """
-    calculate Levenshtein distances for all combinations of 2 sequences in list
+    return the positions (in the concatenated codes) of the behaviors that can be permuted
 
     Args:
-        seq_list (list): list of sequences
+        offsets (np.ndarray): start of each sequence in codes (see Corpus)
+        block_first (bool): the first behavior of each sequence is not permuted
+        block_last (bool): the last behavior of each sequence is not permuted
 
     Returns:
-        numpy array: Levenshtein distances
+        np.ndarray: positions of behaviors to permute
+    """
+    mask = np.ones(int(offsets[-1]), dtype=bool)
+    not_empty = np.diff(offsets) > 0
+    if block_first:
+        mask[offsets[:-1][not_empty]] = False
+    if block_last:
+        mask[offsets[1:][not_empty] - 1] = False
+    return np.flatnonzero(mask)
+
+
+def permuted_corpora(
+    corpus: Corpus,
+    n: int,
+    rng: np.random.Generator,
+    block_first: bool = False,
+    block_last: bool = False,
+    out: np.ndarray | None = None,
+    within_sequence: bool = False,
+) -> np.ndarray:
     """
+    create n random permutations of the behaviors of the corpus
+    (without exclusions all the permutable behaviors are shuffled between all sequences)
 
-    results = np.zeros((len(seq_list), len(seq_list)))
-    for p in itertools.combinations(enumerate(seq_list), 2):
-        results[p[0][0], p[1][0]] = levenshtein_distance(p[0][1], p[1][1])
-        results[p[1][0], p[0][0]] = results[p[0][0], p[1][0]]
-    return results
+    In within-sequence mode each sequence is shuffled independently: the permutable positions
+    are sorted by random keys grouped by sequence (sequence index + random number in [0, 1)).
 
+    Args:
+        corpus (Corpus): encoded sequences
+        n (int): number of permutations
+        rng (np.random.Generator): random generator
+        block_first (bool): the first behavior of each sequence is not permuted
+        block_last (bool): the last behavior of each sequence is not permuted
+        out (np.ndarray): array (at least n x number of events) reused for the permutations
+        within_sequence (bool): the behaviors are shuffled only within their sequence
 
-def needleman_wunsch_identity(seq1: list, seq2: list) -> dict:
-    """
-    calculate the Needleman-Wunsch identity between the 2 sequences
+    Returns:
+        np.ndarray: array (n x number of events) of permuted codes (same offsets than corpus)
     """
+    batch = (
+        np.empty((n, corpus.n_events), dtype=corpus.codes.dtype)
+        if out is None
+        else out[:n]
+    )
+    positions = free_positions(corpus.offsets, block_first, block_last)
+    if len(positions) < corpus.n_events:
+        batch[:] = corpus.codes
+    if within_sequence:
+        keys = rng.random((n, len(positions)))
+        keys += sequence_index(corpus.offsets)[positions]
+        batch[:, positions] = corpus.codes[positions][np.argsort(keys, axis=1)]
+    else:
+        batch[:, positions] = rng.permuted(
+            np.broadcast_to(corpus.codes[positions], (n, len(positions))), axis=1
+        )
+    return batch
 
-    match_award = 1
-    mismatch_penalty = -1
-    gap_penalty = -1  # both for opening and extanding
 
-    def match_score(alpha, beta):
-        if alpha == beta:
-            return match_award
-        elif alpha == "-" or beta == "-":
-            return gap_penalty
-        else:
-            return mismatch_penalty
+def create_observed_transition_matrix(
+    sequences: list, behaviours: list | None = None
+) -> np.ndarray:
+    """
+    create the matrix of observed transitions
 
-    def finalize(align1, align2):
-        align1 = align1[::-1]  # reverse sequence 1
-        align2 = align2[::-1]  # reverse sequence 2
+    Args:
+        sequences (list): list of sequences or Corpus
+        behaviours (list): list of behaviours (if None the vocabulary of the Corpus is used)
 
-        i, j = 0, 0
+    Returns:
+        np.ndarray: matrix of observed transitions number (integer)
+    """
+    corpus = as_corpus(sequences, behaviours)
 
-        # calculate identity, score and aligned sequences
-        symbol = []
-        found = 0
-        score = 0
-        identity = 0
-        for i in range(0, len(align1)):
-            if align1[i] == align2[i]:
-                symbol.append(align1[i])
-                identity = identity + 1
-                score += match_score(align1[i], align2[i])
+    return transition_counts(corpus.codes, corpus.offsets, len(corpus.behaviours))
 
-            elif align1[i] != align2[i] and align1[i] != "-" and align2[i] != "-":
-                score += match_score(align1[i], align2[i])
-                symbol.append(" ")
-                found = 0
 
-            elif align1[i] == "-" or align2[i] == "-":
-                symbol.append(" ")
-                score += gap_penalty
+def allowed_transitions_matrix(exclusion_list: dict, behaviours: list) -> np.ndarray:
+    """
+    return the matrix of allowed transitions
 
-        identity = float(identity) / len(align1) * 100
+    Args:
+        exclusion_list (dict): dict of excluded behaviors (see check_exclusion_list)
+        behaviours (list): list of behaviours
 
-        return {
-            "identity": identity,
-            "score": score,
-            "align1": align1,
-            "align2": align2,
-            "symbol": symbol,
-        }
+    Returns:
+        np.ndarray: boolean matrix (allowed[code1, code2] is False if code1 -> code2 is excluded)
+    """
+    allowed = np.ones((len(behaviours), len(behaviours)), dtype=bool)
+    for code1, code2 in excluded_transitions(exclusion_list, behaviours):
+        allowed[code1, code2] = False
+    return allowed
+
+
+def permutations_space_size(
+    corpus: Corpus,
+    block_first: bool = False,
+    block_last: bool = False,
+    within_sequence: bool = False,
+    limit: int = EXACT_PERMUTATIONS_MAX,
+) -> int | None:
+    """
+    number of distinct permutations of the behaviors of the corpus (permutations of a multiset)
 
-    m, n = len(seq1), len(seq2)  # length of two sequences
+    The size is first estimated with the logarithm of the multinomial coefficients
+    and computed exactly only if it is not greater than limit.
 
-    # Generate DP table and traceback path pointer matrix
-    score = np.zeros((m + 1, n + 1))
+    Args:
+        corpus (Corpus): encoded sequences
+        block_first (bool): the first behavior of each sequence is not permuted
+        block_last (bool): the last behavior of each sequence is not permuted
+        within_sequence (bool): the behaviors are permuted only within their sequence
+        limit (int): maximum size
 
-    # Calculate DP table
-    for i in range(0, m + 1):
-        score[i][0] = gap_penalty * i
-    for j in range(0, n + 1):
+    Returns:
+        int: number of distinct permutations or None if greater than limit
+    """
+    if limit < 1:
+        return None
+    positions = free_positions(corpus.offsets, block_first, block_last)
+    if within_sequence:
+        groups = sequence_index(corpus.offsets)[positions]
+    else:
+        groups = np.zeros(len(positions), dtype=np.int64)
+    # counts of each behavior by group of permuted positions
+    _, counts = np.unique(
+        np.stack((groups, corpus.codes[positions].astype(np.int64))),
+        axis=1,
+        return_counts=True,
+    )
+    _, group_sizes = np.unique(groups, return_counts=True)
+
+    log_size = sum(math.lgamma(n + 1) for n in group_sizes.tolist()) - sum(
+        math.lgamma(n + 1) for n in counts.tolist()
+    )
+    if log_size > math.log(limit) + 1:
+        return None
+
+    size = 1
+    for n in group_sizes.tolist():
+        size *= math.factorial(n)
+    for n in counts.tolist():
+        size //= math.factorial(n)
+
+    return size if size <= limit else None
+
+
+def multiset_permutations(codes: np.ndarray) -> np.ndarray:
+    """
+    enumerate the distinct permutations of codes (in lexicographic order)
+
+    The permutations are built position by position for all the prefixes at once:
+    each prefix is extended with every code that remains in its multiset.
+
+    Args:
+        codes (np.ndarray): codes to permute
+
+    Returns:
+        np.ndarray: array (number of distinct permutations x len(codes))
+    """
+    values, counts = np.unique(codes, return_counts=True)
+    permutations = np.empty((1, 0), dtype=codes.dtype)
+    remaining = counts[np.newaxis, :]
+    for _ in range(len(codes)):
+        prefixes, choices = np.nonzero(remaining)
+        permutations = np.concatenate(
+            (permutations[prefixes], values[choices][:, np.newaxis]), axis=1
+        )
+        remaining = remaining[prefixes]
+        remaining[np.arange(len(prefixes)), choices] -= 1
+
+    return permutations
+
+
+def enumerate_permutations(
+    corpus: Corpus,
+    block_first: bool = False,
+    block_last: bool = False,
+    within_sequence: bool = False,
+) -> np.ndarray:
+    """
+    enumerate all the distinct permutations of the behaviors of the corpus
+
+    Under random shuffling every distinct permutation of a multiset has the same multiplicity
+    (product of the factorials of the counts of behaviors) so each one has the same weight
+    in the exact test. In within-sequence mode the distinct permutations of the corpus are
+    the cartesian product of the distinct permutations of each sequence.
+
+    Check the size of the permutations space before (see permutations_space_size).
+
+    Args:
+        corpus (Corpus): encoded sequences
+        block_first (bool): the first behavior of each sequence is not permuted
+        block_last (bool): the last behavior of each sequence is not permuted
+        within_sequence (bool): the behaviors are permuted only within their sequence
+
+    Returns:
+        np.ndarray: array (number of distinct permutations x number of events) of permuted codes
+                    (same offsets than corpus)
+    """
+    positions = free_positions(corpus.offsets, block_first, block_last)
+    if within_sequence:
+        groups = np.split(
+            positions,
+            np.flatnonzero(np.diff(sequence_index(corpus.offsets)[positions])) + 1,
+        )
+    else:
+        groups = [positions]
+
+    permutations = corpus.codes[np.newaxis, :].copy()
+    for group in groups:
+        if not len(group):
+            continue
+        group_permutations = multiset_permutations(corpus.codes[group])
+        # cartesian product with the permutations of the previous groups
+        permutations = np.repeat(permutations, len(group_permutations), axis=0)
+        permutations[:, group] = np.tile(
+            group_permutations, (len(permutations) // len(group_permutations), 1)
+        )
+
+    return permutations
+
+
+def exact_permutations_size(
+    nrandom: int,
+    corpus: Corpus,
+    exclusion_list: dict,
+    block_first: bool,
+    block_last: bool,
+    no_repetition: bool = False,
+    within_sequence: bool = False,
+) -> int | None:
+    """
+    number of permutations of the exact permutations test if it replaces the random permutations
+
+    The exact test is used when there are no excluded transitions and the number of distinct permutations
+    is not greater than the number of random permutations (and EXACT_PERMUTATIONS_MAX).
+
+    Args:
+        nrandom (int): number of random permutations
+        corpus (Corpus): encoded sequences
+        exclusion_list (dict): dict of excluded behaviors (see check_exclusion_list)
+        block_first (bool): avoid that 1st behavior be permuted
+        block_last (bool): avoid that last behavior be permuted
+        no_repetition (bool): exclude the repetitions of behaviors
+        within_sequence (bool): the behaviors are permuted only within their sequence
+
+    Returns:
+        int: number of distinct permutations or None if the permutations must be random
+    """
+    if (
+        no_repetition
+        or not allowed_transitions_matrix(exclusion_list, corpus.behaviours).all()
+    ):
+        return None
+    return permutations_space_size(
+        corpus,
+        block_first,
+        block_last,
+        within_sequence,
+        limit=min(nrandom, EXACT_PERMUTATIONS_MAX),
+    )
+
+
+def constrained_permutation(
+    corpus: Corpus,
+    allowed: np.ndarray,
+    rng: np.random.Generator,
+    block_first: bool = False,
+    block_last: bool = False,
+    within_sequence: bool = False,
+) -> np.ndarray | None:
+    """
+    create a random permutation of the behaviors of the corpus following the allowed transitions
+
+    The remaining behaviors are kept as counts by behavior. At each position the next behavior is drawn
+    by weighted sampling (weights: remaining counts) over the behaviors allowed after the previous one.
+    If the last behavior is blocked, the penultimate behavior must also be allowed before the last one.
+    In within-sequence mode the remaining counts are the counts of the behaviors of the current sequence.
+
+    Args:
+        corpus (Corpus): encoded sequences
+        allowed (np.ndarray): matrix of allowed transitions (see allowed_transitions_matrix)
+        rng (np.random.Generator): random generator
+        block_first (bool): the first behavior of each sequence is not permuted
+        block_last (bool): the last behavior of each sequence is not permuted
+        within_sequence (bool): the behaviors are drawn only within their sequence
+
+    Returns:
+        np.ndarray: permuted codes (same offsets than corpus) or None if no allowed behavior remains
+    """
+    n_behaviours = len(corpus.behaviours)
+    allowed_after = allowed.tolist()
+    allowed_before = allowed.T.tolist()
+    all_allowed = [True] * n_behaviours
+
+    permuted = corpus.codes.copy()
+    positions = free_positions(corpus.offsets, block_first, block_last)
+    if within_sequence:
+        # counts of the permutable behaviors by sequence
+        sequence_counts = np.zeros((len(corpus), n_behaviours), dtype=np.int64)
+        np.add.at(
+            sequence_counts,
+            (sequence_index(corpus.offsets)[positions], corpus.codes[positions]),
+            1,
+        )
+        sequence_counts = sequence_counts.tolist()
+    else:
+        remaining = np.bincount(
+            corpus.codes[positions], minlength=n_behaviours
+        ).tolist()
+    random_values = rng.random(len(permuted)).tolist()
+
+    offsets = corpus.offsets.tolist()
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        if start == end:
+            continue
+        if within_sequence:
+            remaining = sequence_counts[i]
+        previous = int(permuted[start]) if block_first else -1
+        last = int(permuted[end - 1])
+        for position in range(start + int(block_first), end - int(block_last)):
+            allowed_row = allowed_after[previous] if previous >= 0 else all_allowed
+            if block_last and position == end - 2:
+                weights = [
+                    n if (a and b) else 0
+                    for n, a, b in zip(remaining, allowed_row, allowed_before[last])
+                ]
+            else:
+                weights = [n if a else 0 for n, a in zip(remaining, allowed_row)]
+
+            total = sum(weights)
+            if not total:
+                return None
+
+            target = min(int(random_values[position] * total), total - 1)
+            for code, weight in enumerate(weights):
+                target -= weight
+                if target < 0:
+                    break
+
+            permuted[position] = code
+            remaining[code] -= 1
+            previous = code
+
+    return permuted
+
+
+def spawn_seeds(seed: int | None, n: int, start: int = 0) -> Tuple[int, list]:
+    """
+    derive n independent (non overlapping) random streams from a seed
+
+    The i-th stream depends only on the seed and on i: a run split in tasks is reproducible
+    with the same seed.
+
+    Args:
+        seed (int): seed (if None a random seed is generated)
+        n (int): number of streams
+        start (int): index of the first stream
+
+    Returns:
+        int: the seed (to be reported for reproducing the results)
+        list: list of n np.random.SeedSequence to be used as seed of permutations_test
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    return entropy, [
+        np.random.SeedSequence(entropy, spawn_key=(i,)) for i in range(start, start + n)
+    ]
+
+
+def permutations_chunks(nrandom: int, n_events: int) -> list:
+    """
+    split the permutations in chunks to be distributed dynamically to the processes
+
+    The size of the chunks depends only on the size of the corpus (not on the number of processes):
+    with the random streams derived from the chunk index (see spawn_seeds) the results
+    do not depend on the number of processes.
+
+    Args:
+        nrandom (int): number of permutations
+        n_events (int): number of events in corpus
+
+    Returns:
+        list: number of permutations of each chunk (the sum is nrandom)
+    """
+    chunk_size = max(
+        1, min(PERMUTATIONS_CHUNK_MAX, PERMUTATIONS_CHUNK_EVENTS // max(1, n_events))
+    )
+    return [chunk_size] * (nrandom // chunk_size) + (
+        [nrandom % chunk_size] if nrandom % chunk_size else []
+    )
+
+
+def permutations_batch_size(nrandom: int, n_events: int, n_cells: int) -> int:
+    """
+    number of permutations processed together by permutations_test (size of the reused buffers)
+
+    Args:
+        nrandom (int): number of permutations
+        n_events (int): number of events in corpus
+        n_cells (int): number of tested transitions
+
+    Returns:
+        int: number of permutations of a batch
+    """
+    return max(1, min(nrandom, PERMUTATIONS_BATCH_EVENTS // (n_events + n_cells)))
+
+
+def scheduled_permutations(
+    executor: concurrent.futures.Executor,
+    task,
+    chunks: list,
+    seed: int,
+    max_pending: int,
+    start: int = 0,
+):
+    """
+    distribute the chunks of permutations dynamically to the executor
+
+    At most max_pending chunks are submitted at the same time: a new chunk is submitted as soon as one
+    is finished, so fast processes do more chunks than slow ones.
+    The results are yielded in the order of the chunks (the chunks finished in advance are kept
+    until the previous ones are finished) to keep the results reproducible when the caller stops early.
+    The pending chunks are cancelled when the generator is closed.
+
+    Args:
+        executor (concurrent.futures.Executor): executor
+        task: function called as task(n, seed=seed) (see permutations_test)
+        chunks (list): number of permutations of each chunk (see permutations_chunks)
+        seed (int): seed of the run (the stream of the chunk i is spawn_seeds(seed, 1, start + i))
+        max_pending (int): maximum number of chunks submitted at the same time
+        start (int): index of the first chunk
+
+    Yields:
+        int: index of chunk
+        result of task
+    """
+    pending: dict = {}
+    finished: dict = {}
+    next_submit: int = 0
+    next_yield: int = 0
+    try:
+        while next_yield < len(chunks):
+            while next_submit < len(chunks) and len(pending) < max_pending:
+                _, seeds = spawn_seeds(seed, 1, start=start + next_submit)
+                pending[executor.submit(task, chunks[next_submit], seed=seeds[0])] = (
+                    next_submit
+                )
+                next_submit += 1
+
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                finished[pending.pop(future)] = future.result()
+
+            while next_yield in finished:
+                yield start + next_yield, finished.pop(next_yield)
+                next_yield += 1
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def permutations_counters(
+    n_behaviours: int, histogram_bins: int = 0, cells: tuple | None = None
+) -> dict:
+    """
+    counters accumulated by the permutations test (one matrix n_behaviours x n_behaviours by counter)
+
+        ge: number of permutations with permuted >= observed
+        le: number of permutations with permuted <= observed
+        sum: sum of the permuted transitions numbers
+        sum_sq: sum of the squares of the permuted transitions numbers
+        histogram: (only if histogram_bins) array n_behaviours x n_behaviours x histogram_bins
+                   of the number of permutations by bin of permuted transitions number
+                   (see histogram_bins_range)
+
+    Args:
+        n_behaviours (int): number of behaviors
+        histogram_bins (int): number of bins of the histograms (0 for no histogram)
+        cells (tuple): shape of the counters if different from n_behaviours x n_behaviours
+                       (e.g. one counter by observed n-gram transition, see ngram_transitions)
+
+    Returns:
+        dict: counters initialized to 0
+    """
+    if cells is None:
+        cells = (n_behaviours, n_behaviours)
+    counters = {
+        counter: np.zeros(cells, dtype=np.int64)
+        for counter in ("ge", "le", "sum", "sum_sq")
+    }
+    if histogram_bins:
+        counters["histogram"] = np.zeros(cells + (histogram_bins,), dtype=np.int64)
+    return counters
+
+
+def histogram_bins_range(corpus: Corpus, histogram_bins: int) -> Tuple:
+    """
+    lower edge and width of the bins of the histograms of the permuted transitions numbers (by cell)
+
+    The permutations do not change the frequencies of the behaviors: the bins of a cell A -> B
+    cover all the possible numbers of transitions, from 0 to min(freq(A), freq(B)), so that the
+    whole distribution (including the tails) is kept.
+
+    Args:
+        corpus (Corpus): encoded sequences
+        histogram_bins (int): number of bins
+
+    Returns:
+        np.ndarray: lower edge of the first bin (n_behaviours x n_behaviours)
+        np.ndarray: width of the bins (n_behaviours x n_behaviours)
+    """
+    codes = corpus.codes[corpus.codes >= 0]
+    frequencies = np.bincount(codes, minlength=len(corpus.behaviours)).astype(np.int64)
+    high = np.minimum.outer(frequencies, frequencies)
+    width = np.maximum(1, -(-(high + 1) // histogram_bins))
+    return np.zeros_like(high), width
+
+
+def save_histograms(
+    file_name: str, counters: dict, count: int, corpus: Corpus, observed_matrix
+) -> None:
+    """
+    save the histograms of the permuted transitions numbers in a .npz file
+
+    The file contains the arrays:
+        histograms: number of permutations by bin (behaviours x behaviours x bins)
+        bin_edges: edges of the bins (behaviours x behaviours x bins + 1)
+        behaviours: behaviors (rows and columns)
+        observed: matrix of observed transitions number
+        permutations: number of permutations
+
+    Args:
+        file_name (str): path of the .npz file
+        counters (dict): counters of the permutations test (see permutations_counters)
+        count (int): number of permutations
+        corpus (Corpus): encoded sequences
+        observed_matrix (np.ndarray): matrix of observed transitions number
+    """
+    histograms = counters["histogram"]
+    lower, width = histogram_bins_range(corpus, histograms.shape[-1])
+    np.savez_compressed(
+        file_name,
+        histograms=histograms,
+        bin_edges=lower[..., np.newaxis]
+        + np.arange(histograms.shape[-1] + 1) * width[..., np.newaxis],
+        behaviours=np.array(corpus.behaviours),
+        observed=np.asarray(observed_matrix),
+        permutations=count,
+    )
+
+
+def merge_permutations_counters(total: dict, counters: dict) -> dict:
+    """
+    add the counters of a batch of permutations to the total (in place)
+
+    Args:
+        total (dict): counters (see permutations_counters)
+        counters (dict): counters to add
+
+    Returns:
+        dict: total
+    """
+    for counter in total:
+        total[counter] += counters[counter]
+    return total
+
+
+def permutations_statistics(counters: dict, count: int, observed_matrix) -> dict:
+    """
+    p-values and z-scores from the counters of the permutations test
+
+    Args:
+        counters (dict): counters (see permutations_counters)
+        count (int): number of permutations
+        observed_matrix (np.ndarray): matrix of observed transitions number
+
+    Returns:
+        dict: p_upper: upper-tail p-values (permuted >= observed)
+              p_lower: lower-tail p-values (permuted <= observed)
+              z_scores: (observed - mean of permuted) / standard deviation of permuted
+                        (NaN if the standard deviation is 0)
+    """
+    mean = counters["sum"] / count
+    sd = np.sqrt(np.maximum(counters["sum_sq"] / count - mean**2, 0))
+    z_scores = np.full(mean.shape, np.nan)
+    np.divide(observed_matrix - mean, sd, out=z_scores, where=sd > 0)
+
+    return {
+        "p_upper": counters["ge"] / count,
+        "p_lower": counters["le"] / count,
+        "z_scores": z_scores,
+    }
+
+
+def resolved_cells(
+    results: np.ndarray, count: int, alpha: float, confidence: float = 0.99
+) -> np.ndarray:
+    """
+    check if the p-values estimated by permutations are resolved relatively to alpha
+
+    A p-value is resolved when its Wilson score confidence interval does not contain alpha.
+
+    Args:
+        results (np.ndarray): number of permutations with permuted >= observed
+        count (int): number of permutations
+        alpha (float): significance level
+        confidence (float): confidence level of the interval
+
+    Returns:
+        np.ndarray: boolean matrix (True if the p-value is resolved)
+    """
+    if not count:
+        return np.zeros(np.shape(results), dtype=bool)
+
+    z = statistics.NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = np.asarray(results) / count
+    center = (p + z**2 / (2 * count)) / (1 + z**2 / count)
+    half_width = (
+        z * np.sqrt(p * (1 - p) / count + z**2 / (4 * count**2)) / (1 + z**2 / count)
+    )
+
+    return (center + half_width < alpha) | (center - half_width > alpha)
+
+
+def permutations_fingerprint(
+    corpus: Corpus,
+    exclusion_list: dict,
+    block_first: bool,
+    block_last: bool,
+    no_repetition: bool = False,
+    histogram_bins: int = 0,
+    ngram: int = 1,
+    within_sequence: bool = False,
+) -> str:
+    """
+    fingerprint of the input of a permutations test (sequences and options)
+
+    Args:
+        corpus (Corpus): encoded sequences
+        exclusion_list (dict): dict of excluded behaviors (see check_exclusion_list)
+        block_first (bool): avoid that 1st behavior be permuted
+        block_last (bool): avoid that last behavior be permuted
+        no_repetition (bool): exclude the repetitions of behaviors
+        histogram_bins (int): number of bins of the histograms
+        ngram (int): number of behaviors of the n-grams of the tested transitions
+        within_sequence (bool): the behaviors are permuted only within their sequence
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(corpus.codes, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(corpus.offsets, dtype=np.int64).tobytes())
+    digest.update(
+        json.dumps(
+            {
+                "behaviours": list(corpus.behaviours),
+                "exclusion_list": {
+                    behavior: sorted(exclusion_list[behavior])
+                    for behavior in sorted(exclusion_list)
+                },
+                "block_first": bool(block_first),
+                "block_last": bool(block_last),
+                "no_repetition": bool(no_repetition),
+                "histogram_bins": int(histogram_bins),
+                "ngram": int(ngram),
+                "within_sequence": bool(within_sequence),
+            }
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def save_checkpoint(file_name: str, checkpoint: dict) -> None:
+    """
+    save the state of a permutations test
+
+    The file is replaced atomically: an interrupted write does not corrupt the previous checkpoint.
+
+    Args:
+        file_name (str): path of the checkpoint file
+        checkpoint (dict): state of the test: fingerprint, count (number of permutations done),
+                           results (counters, see permutations_counters) and the state of the random generator
+    """
+    checkpoint = dict(
+        checkpoint,
+        results={
+            counter: np.asarray(matrix).tolist()
+            for counter, matrix in checkpoint["results"].items()
+        },
+    )
+    with open(f"{file_name}.tmp", "w", encoding="utf-8") as f_out:
+        json.dump(checkpoint, f_out)
+    os.replace(f"{file_name}.tmp", file_name)
+
+
+def load_checkpoint(file_name: str, fingerprint: str) -> dict:
+    """
+    load the state of a permutations test saved by save_checkpoint
+
+    Args:
+        file_name (str): path of the checkpoint file
+        fingerprint (str): fingerprint of the input of the test to be resumed (see permutations_fingerprint)
+
+    Returns:
+        dict: error_code, message and checkpoint
+    """
+    try:
+        with open(file_name, encoding="utf-8") as f_in:
+            checkpoint = json.load(f_in)
+    except FileNotFoundError:
+        return {"error_code": 1, "message": f"Checkpoint file not found: {file_name}"}
+    except (OSError, ValueError):
+        return {"error_code": 1, "message": f"Checkpoint file not valid: {file_name}"}
+
+    if checkpoint.get("fingerprint") != fingerprint:
+        return {
+            "error_code": 1,
+            "message": (
+                "The checkpoint does not match the sequences or the options of the "
+                "permutations test"
+            ),
+        }
+
+    checkpoint["results"] = {
+        counter: np.array(matrix, dtype=np.int64)
+        for counter, matrix in checkpoint["results"].items()
+    }
+    return {"error_code": 0, "message": "", "checkpoint": checkpoint}
+
+
+def permutations_test(
+    nrandom: int,
+    sequences,
+    behaviours,
+    exclusion_list,
+    block_first,
+    block_last,
+    observed_matrix: np.array,
+    no_repetition: bool = False,
+    seed=None,
+    alpha: float | None = None,
+    confidence: float = 0.99,
+    checkpoint: str | None = None,
+    resume: bool = False,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    histogram_bins: int = 0,
+    ngram: int = 1,
+    within_sequence: bool = False,
+    exact: bool = True,
+) -> Tuple[int, dict]:
+    """
+    permutations test
+
+    Without excluded transitions the permutations are generated and analyzed by batches (see permuted_corpora),
+    otherwise each permutation is created by the constrained sampler (see constrained_permutation).
+    The upper-tail and lower-tail counts and the sums needed for the z-scores are accumulated
+    in the same pass (see permutations_counters and permutations_statistics).
+
+    If the number of distinct permutations is small (see exact_permutations_size) and exact is True,
+    all the distinct permutations are enumerated instead of the random permutations (exact test):
+    the number of permutations done is the number of distinct permutations and the seed is not used.
+
+    With ngram > 1 the transitions between successive n-grams are tested: only the n-gram transitions
+    observed in the sequences are counted (see ngram_transitions) and the counters are vectors
+    in the order of their codes.
+
+    Args:
+        nrandom (int): number of random permutations
+        sequences (list): list of sequences or Corpus
+        behaviours (list): list of unique observed behaviours (if None the vocabulary of the Corpus is used)
+        exclusion_list (dict): dict of excluded behaviors (see check_exclusion_list)
+        block_first (bool): avoid that 1st behavior be permuted
+        block_last (bool): avoid that last behavior be permuted
+        observed_matrix (np.array): matrix of observed transitions number
+                                    (vector of observed n-gram transitions number if ngram > 1)
+        no_repetition (bool): exclude the repetitions of behaviors
+        seed (int or np.random.SeedSequence): seed of the random generator (see spawn_seeds).
+                                              If None the generator is seeded from the OS entropy
+        alpha (float): if not None adaptive mode: the permutations are done by rounds of ADAPTIVE_ROUND_SIZE
+                       and the test is stopped when all the p-values are resolved relatively to alpha
+                       (see resolved_cells). nrandom is the maximum number of permutations
+        confidence (float): confidence level used in adaptive mode
+        checkpoint (str): path of a checkpoint file: the state of the test is saved
+                          every checkpoint_interval seconds and at the end of the test
+        resume (bool): continue the test saved in the checkpoint file (the sequences and the options
+                       must be the same, see permutations_fingerprint)
+        checkpoint_interval (float): minimum delay between 2 checkpoints (in seconds)
+        histogram_bins (int): if not 0 the histograms of the permuted transitions numbers are accumulated
+                              (see permutations_counters and save_histograms)
+        ngram (int): number of behaviors of the n-grams of the tested transitions
+        within_sequence (bool): each sequence is permuted independently (the behaviors do not move
+                                between sequences)
+        exact (bool): enumerate all the distinct permutations if they are not more than nrandom
+
+    Returns:
+        int: number of permutations done
+        dict: counters (see permutations_counters)
+    """
+
+    corpus = as_corpus(sequences, behaviours)
+    behaviours = corpus.behaviours
+
+    exact_size = (
+        exact_permutations_size(
+            nrandom,
+            corpus,
+            exclusion_list,
+            block_first,
+            block_last,
+            no_repetition,
+            within_sequence,
+        )
+        if exact
+        else None
+    )
+    if exact_size is not None:
+        # small permutations space: exact test
+        enumerated = enumerate_permutations(
+            corpus, block_first, block_last, within_sequence
+        )
+        nrandom = exact_size
+        alpha = None
+
+    # modify exclusions list to avoid repetitions
+    if no_repetition:
+        for behavior in behaviours:
+            if behavior not in exclusion_list:
+                exclusion_list[behavior] = []
+            if behavior not in exclusion_list[behavior]:
+                exclusion_list[behavior].append(behavior)
+
+    allowed = allowed_transitions_matrix(exclusion_list, behaviours)
+
+    if ngram > 1:
+        if histogram_bins:
+            raise ValueError("The histograms are not available for n-gram transitions")
+        # sparse counters: only the observed n-gram transitions are tested
+        ngram_keys, _ = ngram_transitions(corpus, ngram)
+        lookup = ngram_lookup(ngram_keys, len(behaviours), ngram)
+        cells = (len(ngram_keys),)
+    else:
+        cells = (len(behaviours), len(behaviours))
+
+    rng = np.random.default_rng(seed)
+    n_cells = int(np.prod(cells))
+    batch_size = permutations_batch_size(nrandom, corpus.n_events, n_cells)
+    results = permutations_counters(len(behaviours), histogram_bins, cells)
+    count: int = 0
+    next_check = ADAPTIVE_ROUND_SIZE
+
+    def checkpoint_state() -> dict:
+        return {
+            "fingerprint": fingerprint,
+            "count": count,
+            "results": results,
+            "next_check": next_check,
+            "rng_state": rng.bit_generator.state,
+        }
+
+    if checkpoint:
+        fingerprint = permutations_fingerprint(
+            corpus,
+            exclusion_list,
+            block_first,
+            block_last,
+            no_repetition,
+            histogram_bins,
+            ngram,
+            within_sequence,
+        )
+        if resume:
+            result = load_checkpoint(checkpoint, fingerprint)
+            if result["error_code"]:
+                raise ValueError(result["message"])
+            results = result["checkpoint"]["results"]
+            count = result["checkpoint"]["count"]
+            next_check = result["checkpoint"]["next_check"]
+            rng.bit_generator.state = result["checkpoint"]["rng_state"]
+        checkpoint_time = time.monotonic()
+
+    # buffers reused by all the batches
+    permuted_buffer = np.empty((batch_size, corpus.n_events), dtype=corpus.codes.dtype)
+    compare_buffer = np.empty((batch_size,) + cells, dtype=bool)
+    cells_sum = np.empty(cells, dtype=np.int64)
+    pairs_buffer = (
+        np.empty(batch_size * max(corpus.n_events - 1, 0), dtype=np.int64)
+        if ngram == 1
+        else None
+    )
+    if histogram_bins:
+        bins_lower, bins_width = histogram_bins_range(corpus, histogram_bins)
+        # position of the first bin of each cell in the flattened histograms
+        histogram_offsets = (np.arange(n_cells) * histogram_bins).reshape(
+            len(behaviours), len(behaviours)
+        )
+        bins_buffer = np.empty(
+            (batch_size, len(behaviours), len(behaviours)), dtype=np.int64
+        )
+
+    while count < nrandom:
+        n = min(batch_size, nrandom - count)
+        if alpha is not None:
+            n = min(n, next_check - count)
+
+        if exact_size is not None:
+            # next batch of the enumerated permutations
+            permuted_batch = enumerated[count : count + n]
+        elif allowed.all():
+            # no excluded transitions: batched permutations
+            permuted_batch = permuted_corpora(
+                corpus,
+                n,
+                rng,
+                block_first,
+                block_last,
+                out=permuted_buffer,
+                within_sequence=within_sequence,
+            )
+        else:
+            permuted_batch = permuted_buffer[:n]
+            i = 0
+            while i < n:
+                permuted = constrained_permutation(
+                    corpus, allowed, rng, block_first, block_last, within_sequence
+                )
+                # retry if the permutation failed
+                if permuted is not None:
+                    permuted_batch[i] = permuted
+                    i += 1
+
+        if ngram > 1:
+            permuted_matrices = ngram_transition_counts(
+                permuted_batch,
+                corpus.offsets,
+                len(behaviours),
+                ngram,
+                ngram_keys,
+                lookup=lookup,
+            )
+        else:
+            permuted_matrices = transition_counts(
+                permuted_batch,
+                corpus.offsets,
+                len(behaviours),
+                pairs_buffer=pairs_buffer,
+            )
+        compare = np.greater_equal(
+            permuted_matrices, observed_matrix, out=compare_buffer[:n]
+        )
+        results["ge"] += np.sum(compare, axis=0, out=cells_sum)
+        np.less_equal(permuted_matrices, observed_matrix, out=compare)
+        results["le"] += np.sum(compare, axis=0, out=cells_sum)
+        results["sum"] += np.sum(permuted_matrices, axis=0, out=cells_sum)
+        if histogram_bins:
+            bins = np.subtract(permuted_matrices, bins_lower, out=bins_buffer[:n])
+            np.floor_divide(bins, bins_width, out=bins)
+            bins += histogram_offsets
+            np.add.at(results["histogram"].reshape(-1), bins.reshape(-1), 1)
+        # the counts are squared in place (last use of the batch)
+        np.multiply(permuted_matrices, permuted_matrices, out=permuted_matrices)
+        results["sum_sq"] += np.sum(permuted_matrices, axis=0, out=cells_sum)
+        count += n
+
+        if alpha is not None and count == next_check:
+            if resolved_cells(results["ge"], count, alpha, confidence).all():
+                break
+            next_check += ADAPTIVE_ROUND_SIZE
+
+        if checkpoint and time.monotonic() - checkpoint_time > checkpoint_interval:
+            save_checkpoint(checkpoint, checkpoint_state())
+            checkpoint_time = time.monotonic()
+
+    if checkpoint:
+        save_checkpoint(checkpoint, checkpoint_state())
+
+    return count, results
+
+
+def share_arrays(arrays: dict) -> Tuple[shared_memory.SharedMemory, dict]:
+    """
+    copy arrays in a new shared memory block
+
+    The owner of the block must close and unlink it when the arrays are no longer used.
+
+    Args:
+        arrays (dict): arrays by name. An array given as a (shape, dtype) tuple is allocated
+                       in the block and filled with zeros
+
+    Returns:
+        shared_memory.SharedMemory: the shared memory block
+        dict: position, dtype and shape of each array in the block (see attach_shared_arrays)
+    """
+    # 8 bytes aligned position of each array in the block
+    layout: dict = {}
+    size = 0
+    for name, array in arrays.items():
+        shape, dtype = (
+            (array.shape, array.dtype)
+            if isinstance(array, np.ndarray)
+            else (tuple(array[0]), np.dtype(array[1]))
+        )
+        layout[name] = (size, dtype.str, shape)
+        size += -(-math.prod(shape) * dtype.itemsize // 8) * 8
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        position, dtype, shape = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=position)[...] = (
+            array if isinstance(array, np.ndarray) else 0
+        )
+
+    return block, layout
+
+
+def share_permutations_data(
+    corpus: Corpus,
+    observed_matrix: np.ndarray,
+    exclusion_list: dict,
+    block_first: bool,
+    block_last: bool,
+    no_repetition: bool = False,
+    histogram_bins: int = 0,
+    ngram: int = 1,
+    within_sequence: bool = False,
+) -> Tuple[shared_memory.SharedMemory, dict]:
+    """
+    copy the encoded corpus and the observed matrix in a shared memory block
+    to be used by the processes of the permutations test without pickling them for each task
+
+    The owner of the block must close and unlink it at the end of the test.
+
+    Args:
+        corpus (Corpus): encoded sequences
+        observed_matrix (np.ndarray): matrix of observed transitions number
+        exclusion_list (dict): dict of excluded behaviors (see check_exclusion_list)
+        block_first (bool): avoid that 1st behavior be permuted
+        block_last (bool): avoid that last behavior be permuted
+        no_repetition (bool): exclude the repetitions of behaviors
+        histogram_bins (int): number of bins of the histograms (see permutations_test)
+        ngram (int): number of behaviors of the n-grams of the tested transitions (see permutations_test)
+        within_sequence (bool): the behaviors are permuted only within their sequence
+
+    Returns:
+        shared_memory.SharedMemory: the shared memory block
+        dict: handle of the data (see shared_permutations_test)
+    """
+    block, layout = share_arrays(
+        {
+            "codes": corpus.codes,
+            "offsets": corpus.offsets,
+            "observed_matrix": np.asarray(observed_matrix),
+            # set by cancel_shared_permutations
+            "cancelled": ((1,), np.uint8),
+        }
+    )
+
+    handle = {
+        "name": block.name,
+        "layout": layout,
+        "behaviours": corpus.behaviours,
+        "exclusion_list": exclusion_list,
+        "block_first": block_first,
+        "block_last": block_last,
+        "no_repetition": no_repetition,
+        "histogram_bins": histogram_bins,
+        "ngram": ngram,
+        "within_sequence": within_sequence,
+    }
+
+    return block, handle
+
+
+# shared memory block attached by the process (see attach_shared_arrays)
+_attached_block: dict = {}
+
+# the process uses its own resource tracker (not the tracker of the owner of the blocks)
+_own_resource_tracker: bool | None = None
+
+
+def attach_shared_arrays(handle: dict) -> dict:
+    """
+    attach the shared memory block created by share_arrays (zero-copy)
+
+    The block stays attached in the process for the next tasks using the same block.
+
+    Args:
+        handle (dict): name of the block ("name") and layout of the arrays ("layout")
+
+    Returns:
+        dict: arrays by name (views on the shared memory)
+    """
+    global _own_resource_tracker
+
+    if _attached_block.get("name") != handle["name"]:
+        detach_shared_arrays()
+
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=handle["name"], track=False)
+        else:
+            # processes started before the creation of the block do not share the
+            # resource tracker of its owner: their own tracker (started by their first
+            # attachment) must not unlink it
+            if _own_resource_tracker is None:
+                _own_resource_tracker = (
+                    getattr(resource_tracker._resource_tracker, "_fd", 0) is None
+                )
+            block = shared_memory.SharedMemory(name=handle["name"])
+            if _own_resource_tracker:
+                resource_tracker.unregister(block._name, "shared_memory")
+
+        _attached_block.update(
+            {
+                "name": handle["name"],
+                "block": block,
+                "arrays": {
+                    name: np.ndarray(
+                        shape, dtype=dtype, buffer=block.buf, offset=position
+                    )
+                    for name, (position, dtype, shape) in handle["layout"].items()
+                },
+            }
+        )
+
+    return _attached_block["arrays"]
+
+
+def detach_shared_arrays(name: str = "") -> None:
+    """
+    close the shared memory block attached by the process (see attach_shared_arrays)
+
+    Args:
+        name (str): close the block only if it is the block of this name (default: any block)
+    """
+    if _attached_block and name in ("", _attached_block["name"]):
+        # release the views before closing the block
+        block = _attached_block["block"]
+        _attached_block.clear()
+        block.close()
+
+
+def detach_pool_worker(name: str) -> None:
+    """
+    task of a pool of processes closing the shared memory block of a finished task in the process.
+    The task lasts DETACH_DELAY seconds: one task submitted for each process of the pool is taken by each
+    idle process
+
+    Args:
+        name (str): name of the block
+    """
+    detach_shared_arrays(name)
+    time.sleep(DETACH_DELAY)
+
+
+def cancel_shared_permutations(block: shared_memory.SharedMemory, handle: dict) -> None:
+    """
+    skip the batches of permutations not yet started on the data shared by share_permutations_data
+    (shared_permutations_test returns empty counters)
+
+    Args:
+        block (shared_memory.SharedMemory): the shared memory block
+        handle (dict): handle of the data (see share_permutations_data)
+    """
+    position, dtype, shape = handle["layout"]["cancelled"]
+    np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=position)[...] = 1
+
+
+def attach_permutations_data(handle: dict) -> Tuple[Corpus, np.ndarray]:
+    """
+    attach the shared memory block created by share_permutations_data (zero-copy)
+
+    Args:
+        handle (dict): handle of the data (see share_permutations_data)
+
+    Returns:
+        Corpus: encoded sequences (view on the shared memory)
+        np.ndarray: matrix of observed transitions number (view on the shared memory)
+    """
+    arrays = attach_shared_arrays(handle)
+    return (
+        Corpus(arrays["codes"], arrays["offsets"], handle["behaviours"]),
+        arrays["observed_matrix"],
+    )
+
+
+def shared_permutations_test(nrandom: int, handle: dict, seed=None) -> Tuple[int, dict]:
+    """
+    permutations test on the data shared by share_permutations_data
+
+    Args:
+        nrandom (int): number of random permutations
+        handle (dict): handle of the data (see share_permutations_data)
+        seed (int or np.random.SeedSequence): seed of the random generator
+
+    Returns:
+        see permutations_test
+    """
+    corpus, observed_matrix = attach_permutations_data(handle)
+    if attach_shared_arrays(handle)["cancelled"][0]:
+        return 0, permutations_counters(
+            len(handle["behaviours"]),
+            handle["histogram_bins"],
+            cells=observed_matrix.shape,
+        )
+
+    return permutations_test(
+        nrandom,
+        corpus,
+        None,
+        {
+            behavior: list(handle["exclusion_list"][behavior])
+            for behavior in handle["exclusion_list"]
+        },
+        handle["block_first"],
+        handle["block_last"],
+        observed_matrix,
+        handle["no_repetition"],
+        seed=seed,
+        histogram_bins=handle["histogram_bins"],
+        ngram=handle["ngram"],
+        within_sequence=handle["within_sequence"],
+    )
+
+
+def sequence_transition_matrices(corpus: Corpus) -> np.ndarray:
+    """
+    count the transitions between behaviors of each sequence
+
+    Args:
+        corpus (Corpus): encoded sequences
+
+    Returns:
+        np.ndarray: array (number of sequences x n_behaviours x n_behaviours) of transitions number
+    """
+    n_behaviours = len(corpus.behaviours)
+    n_cells = n_behaviours * n_behaviours
+    if corpus.n_events < 2:
+        return np.zeros((len(corpus), n_behaviours, n_behaviours), dtype=np.int64)
+
+    # pair codes shifted by sequence (counted with one bincount)
+    codes = corpus.codes.astype(np.int64)
+    pairs = codes[:-1] * n_behaviours + codes[1:]
+    pairs += sequence_index(corpus.offsets)[:-1] * n_cells
+    # pairs crossing the boundary between 2 sequences or containing an unknown behavior
+    masked = len(corpus) * n_cells
+    valid = (codes[:-1] >= 0) & (codes[1:] >= 0)
+    valid[corpus.offsets[1:-1][corpus.offsets[1:-1] > 0] - 1] = False
+    pairs[~valid] = masked
+
+    return np.bincount(pairs, minlength=masked + 1)[:masked].reshape(
+        len(corpus), n_behaviours, n_behaviours
+    )
+
+
+def transition_probabilities(matrices: np.ndarray) -> np.ndarray:
+    """
+    transition probabilities: number of transitions A -> B / number of transitions after A
+
+    Args:
+        matrices (np.ndarray): transitions number (... x n_behaviours x n_behaviours)
+
+    Returns:
+        np.ndarray: transition probabilities (0 for the behaviors not followed by a transition)
+    """
+    totals = matrices.sum(axis=-1, keepdims=True)
+    probabilities = np.zeros(matrices.shape)
+    np.divide(matrices, totals, out=probabilities, where=totals > 0)
+    return probabilities
+
+
+def group_comparison_test(
+    nrandom: int,
+    sequences1,
+    sequences2,
+    behaviours: list | None = None,
+    seed=None,
+) -> dict:
+    """
+    permutations test of the differences of transition probabilities between 2 groups of sequences
+
+    The group labels are permuted between the sequences (the sizes of the groups are kept).
+    The transition matrices of the sequences are computed once: the matrix of a group
+    is the sum of the matrices of its sequences, computed for a batch of permuted labels
+    with one product of the matrix of labels by the matrix of the sequences.
+    The p-value of a transition is the proportion of permutations with an absolute difference
+    greater than or equal to the observed absolute difference (two-sided test).
+
+    Args:
+        nrandom (int): number of random permutations of the group labels
+        sequences1 (list): sequences of group 1 (list of sequences)
+        sequences2 (list): sequences of group 2 (list of sequences)
+        behaviours (list): vocabulary (if None the sorted list of the behaviors of the 2 groups)
+        seed (int or np.random.SeedSequence): seed of the random generator.
+                                              If None the generator is seeded from the OS entropy
+
+    Returns:
+        dict: behaviours: rows and columns of the matrices
+              count: number of permutations done
+              probabilities_1, probabilities_2: transition probabilities of each group
+              difference: probabilities_1 - probabilities_2
+              p_values: p-values of the differences
+    """
+    sequences = list(sequences1) + list(sequences2)
+    corpus = as_corpus(sequences, behaviours)
+    n_behaviours = len(corpus.behaviours)
+    n_cells = n_behaviours * n_behaviours
+
+    matrices = sequence_transition_matrices(corpus).reshape(len(corpus), n_cells)
+    # float64 products are exact for transitions numbers (< 2**53) and use BLAS
+    matrices = matrices.astype(np.float64)
+    total = matrices.sum(axis=0)
+
+    labels = np.zeros(len(corpus), dtype=np.float64)
+    labels[: len(sequences1)] = 1
+
+    def differences(group1: np.ndarray) -> np.ndarray:
+        """
+        differences of transition probabilities from the transitions numbers of group 1
+        """
+        shape = group1.shape[:-1] + (n_behaviours, n_behaviours)
+        return transition_probabilities(
+            group1.reshape(shape)
+        ) - transition_probabilities((total - group1).reshape(shape))
+
+    observed = labels @ matrices
+    observed_difference = differences(observed)
+    # tolerance for the rounding errors of the probabilities
+    threshold = np.abs(observed_difference) - 1e-12
+
+    rng = np.random.default_rng(seed)
+    batch_size = max(
+        1, min(nrandom, PERMUTATIONS_BATCH_EVENTS // (len(corpus) + 4 * n_cells))
+    )
+    greater_equal = np.zeros((n_behaviours, n_behaviours), dtype=np.int64)
+    count: int = 0
+    while count < nrandom:
+        n = min(batch_size, nrandom - count)
+        permuted_labels = rng.permuted(
+            np.broadcast_to(labels, (n, len(corpus))), axis=1
+        )
+        permuted_difference = differences(permuted_labels @ matrices)
+        greater_equal += np.sum(np.abs(permuted_difference) >= threshold, axis=0)
+        count += n
+
+    return {
+        "behaviours": corpus.behaviours,
+        "count": count,
+        "probabilities_1": transition_probabilities(
+            observed.reshape(n_behaviours, n_behaviours)
+        ),
+        "probabilities_2": transition_probabilities(
+            (total - observed).reshape(n_behaviours, n_behaviours)
+        ),
+        "difference": observed_difference,
+        "p_values": greater_equal / count if count else np.ones(greater_equal.shape),
+    }
+
+
+def save_matrix_tsv(file_name: str, matrix, behaviours: list, fmt: str = "%f") -> None:
+    """
+    save a matrix in a TSV file with behaviors as column and row headers
+
+    Args:
+        file_name (str): path of the TSV file
+        matrix (np.ndarray): matrix to save
+        behaviours (list): labels of rows and columns
+        fmt (str): format of values
+    """
+    with open(file_name, mode="w", encoding="utf-8") as f_out:
+        f_out.write("\t" + "\t".join(behaviours) + "\n")
+        for behavior, row in zip(behaviours, matrix):
+            f_out.write(behavior + "\t" + "\t".join(fmt % x for x in row) + "\n")
+
+
+def levenshtein_vectors(peq: dict, mask: int, starts: int, text) -> tuple:
+    """
+    bit-parallel computation of the Levenshtein distance (Myers 1999, Hyyrö 2001)
+
+    The columns of the dynamic programming matrix are encoded as vertical deltas (+1 and -1)
+    in bit vectors (Python int of any width).
+    Several patterns can be packed in the bit vectors: each pattern is followed by a guard bit (0 in mask)
+    that stops the carries and the shifts between patterns.
+
+    Args:
+        peq (dict): bit vector of the positions of each behavior in the pattern(s)
+        mask (int): bits of the pattern(s)
+        starts (int): first bit of each pattern
+        text (iterable): sequence compared to the pattern(s)
+
+    Returns:
+        int: positive vertical deltas of the last column
+        int: negative vertical deltas of the last column
+    """
+    pv, mv = mask, 0
+    for element in text:
+        eq = peq.get(element, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        ph = (ph << 1) | starts
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return pv, mv
+
+
+def levenshtein_distance(seq1: list, seq2: list) -> int:
+    """
+    calculate the Levenshtein distance between the 2 sequences
+
+    The longest sequence is encoded as bit vectors (see levenshtein_vectors)
+    """
+    if len(seq1) < len(seq2):
+        seq1, seq2 = seq2, seq1
+    pv, mv = levenshtein_vectors(
+        levenshtein_pattern(seq1), (1 << len(seq1)) - 1, 1, seq2
+    )
+    return len(seq2) + pv.bit_count() - mv.bit_count()
+
+
+def levenshtein_distance_rows(seq: list, seq_list: list) -> np.ndarray:
+    """
+    calculate the Levenshtein distances between a sequence and all the sequences in list
+
+    The dynamic programming matrix is filled row by row for all the sequences of the list at once:
+    D[i, j] = min(D[i - 1, j] + 1, D[i - 1, j - 1] + cost, D[i, j - 1] + 1)
+    where the last term is resolved with a cumulative minimum over the row.
+
+    Args:
+        seq (list): sequence
+        seq_list (list): list of sequences
+
+    Returns:
+        np.ndarray: Levenshtein distances
+    """
+    corpus = as_corpus([list(seq)] + [list(x) for x in seq_list])
+    lengths = corpus.lengths[1:]
+    # padding with a code that does not match any behavior
+    texts = np.full((len(lengths), int(lengths.max(initial=0))), -2, dtype=np.int64)
+    texts[np.arange(texts.shape[1]) < lengths[:, None]] = corpus.codes[
+        corpus.offsets[1] :
+    ]
+
+    columns = np.arange(texts.shape[1] + 1)
+    row = np.broadcast_to(columns, (len(lengths), len(columns))).copy()
+    candidates = np.empty_like(row)
+    for i, code in enumerate(corpus[0].tolist(), start=1):
+        candidates[:, 0] = i
+        np.minimum(row[:, 1:] + 1, row[:, :-1] + (texts != code), out=candidates[:, 1:])
+        np.minimum.accumulate(candidates - columns, axis=1, out=row)
+        row += columns
+    return row[np.arange(len(lengths)), lengths]
+
+
+def levenshtein_tile(corpus: Corpus, rows: range, cols: range, out: np.ndarray) -> None:
+    """
+    calculate the Levenshtein distances between the sequences of rows and the next sequences of cols
+    (out[i - rows.start, j - cols.start] for i in rows, j in cols and i < j)
+
+    The sequences of rows are packed in the same bit vectors (each sequence is followed by a guard bit)
+    and the distances between a sequence of cols and all the sequences of rows are computed at once
+    (see levenshtein_vectors).
+    When the bit vectors of all the behaviors would exceed LEVENSHTEIN_PACKED_MAX bytes
+    the distances are computed row by row (see levenshtein_distance_rows).
+
+    Args:
+        corpus (Corpus): encoded sequences
+        rows (range): indexes of the first sequences
+        cols (range): indexes of the second sequences
+        out (np.ndarray): distances of the tile (len(rows) x len(cols))
+    """
+    lengths = corpus.lengths[rows.start : rows.stop]
+    codes = corpus.codes[corpus.offsets[rows.start] : corpus.offsets[rows.stop]]
+    symbols = np.unique(codes)
+
+    # first bit of each sequence of rows
+    starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths + 1, out=starts[1:])
+
+    if len(symbols) * int(starts[-1]) // 8 > LEVENSHTEIN_PACKED_MAX:
+        for i in rows:
+            targets = range(max(i + 1, cols.start), cols.stop)
+            if len(targets):
+                out[i - rows.start, targets.start - cols.start :] = (
+                    levenshtein_distance_rows(
+                        corpus[i].tolist(), [corpus[j].tolist() for j in targets]
+                    )
+                )
+        return
+
+    def pack(bits: np.ndarray) -> int:
+        return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+    positions = np.arange(len(codes)) + np.repeat(np.arange(len(lengths)), lengths)
+    bits = np.zeros(int(starts[-1]), dtype=bool)
+    peq = {}
+    for code in symbols.tolist():
+        bits[:] = False
+        bits[positions[codes == code]] = True
+        peq[code] = pack(bits)
+    bits[:] = False
+    bits[positions] = True
+    mask = pack(bits)
+    bits[:] = False
+    bits[starts[:-1][lengths > 0]] = True
+    first_bits = pack(bits)
+
+    for j in cols:
+        # the sequences of rows preceding j are the patterns
+        n_patterns = min(max(j - rows.start, 0), len(lengths))
+        if not n_patterns:
+            continue
+        n_bits = int(starts[n_patterns])
+        prefix = (1 << n_bits) - 1
+        text = corpus[j].tolist()
+        pv, mv = levenshtein_vectors(
+            {code: peq[code] & prefix for code in set(text) if code in peq},
+            mask & prefix,
+            first_bits & prefix,
+            text,
+        )
+        n_bytes = (n_bits + 7) // 8
+        deltas = np.zeros(n_bits + 1, dtype=np.int64)
+        deltas[1:] = np.unpackbits(
+            np.frombuffer(pv.to_bytes(n_bytes, "little"), dtype=np.uint8),
+            count=n_bits,
+            bitorder="little",
+        )
+        deltas[1:] -= np.unpackbits(
+            np.frombuffer(mv.to_bytes(n_bytes, "little"), dtype=np.uint8),
+            count=n_bits,
+            bitorder="little",
+        )
+        np.cumsum(deltas, out=deltas)
+        # distance: length of text + sum of the vertical deltas of the last column of the pattern
+        out[:n_patterns, j - cols.start] = (
+            len(text)
+            + deltas[starts[1 : n_patterns + 1] - 1]
+            - deltas[starts[:n_patterns]]
+        )
+
+
+def levenshtein_distance_seq_list(
+    seq_list: list,
+    n_proc: int = 1,
+    condensed: bool = False,
+    file_name: str = "",
+    max_distance: int | None = None,
+):
+    """
+    calculate Levenshtein distances for all combinations of 2 sequences in list
+
+    Args:
+        seq_list (list): list of sequences or Corpus
+        n_proc (int): number of processes
+        condensed (bool): return the condensed upper triangle (see pairwise_distances)
+        file_name (str): path of the memory-mapped .npy file of the condensed upper triangle
+        max_distance (int): only the pairs of sequences with a distance not greater than max_distance
+                            are returned (see levenshtein_pairs)
+
+    Returns:
+        numpy array: Levenshtein distances
+        or list: (i, j, distance) tuples if max_distance is not None
+    """
+
+    if max_distance is not None:
+        return levenshtein_pairs(seq_list, max_distance, n_proc)
+
+    return pairwise_distances(seq_list, "levenshtein", n_proc, condensed, file_name)
+
+
+def levenshtein_pattern(seq: list) -> dict:
+    """
+    bit vector of the positions of each behavior in the sequence (see levenshtein_vectors)
+    """
+    peq: dict = {}
+    for position, element in enumerate(seq):
+        peq[element] = peq.get(element, 0) | (1 << position)
+    return peq
+
+
+def levenshtein_distance_banded(seq1: list, seq2: list, max_distance: int) -> int:
+    """
+    calculate the Levenshtein distance between the 2 sequences if it is not greater than max_distance
+
+    Only the diagonal band of width 2 * max_distance + 1 of the dynamic programming matrix is computed
+    (a cell outside the band is greater than max_distance) and the computation stops as soon as
+    all the cells of a row of the band are greater than max_distance.
+
+    Returns:
+        int: Levenshtein distance or max_distance + 1 if the distance is greater than max_distance
+    """
+    above = max_distance + 1
+    n = len(seq2)
+    previous = [min(j, above) for j in range(n + 1)]
+    current = [above] * (n + 1)
+    for i, element in enumerate(seq1, start=1):
+        first = max(1, i - max_distance)
+        last = min(n, i + max_distance)
+        current[0] = min(i, above)
+        if first > 1:
+            # left border of the band
+            current[first - 1] = above
+        left = row_min = current[first - 1]
+        for j in range(first, last + 1):
+            left = min(
+                previous[j - 1] + (element != seq2[j - 1]),
+                previous[j] + 1,
+                left + 1,
+                above,
+            )
+            current[j] = left
+            row_min = min(row_min, left)
+        # right border of the band (read by the next row)
+        if last < n:
+            current[last + 1] = above
+        if row_min > max_distance:
+            return above
+        previous, current = current, previous
+
+    return previous[n]
+
+
+def levenshtein_vectors_bounded(
+    peq: dict, m: int, text: list, max_distance: int
+) -> int:
+    """
+    bit-parallel computation of the Levenshtein distance (see levenshtein_vectors) between a pattern
+    of length m and a text that stops as soon as the distance is greater than max_distance:
+    the last row of a column can only decrease by 1 at each next column of the text
+
+    Args:
+        peq (dict): bit vector of the positions of each behavior in the pattern (see levenshtein_pattern)
+        m (int): length of the pattern
+        text (list): sequence compared to the pattern
+        max_distance (int): maximum distance
+
+    Returns:
+        int: Levenshtein distance or max_distance + 1 if the distance is greater than max_distance
+    """
+    above = max_distance + 1
+    if not m:
+        return min(len(text), above)
+    mask = (1 << m) - 1
+    last_row = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    remaining = len(text)
+    for element in text:
+        eq = peq.get(element, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last_row:
+            score += 1
+        elif mh & last_row:
+            score -= 1
+        remaining -= 1
+        if score - remaining > max_distance:
+            return above
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | ~(xv | ph)
+        mv = ph & xv
+    return min(score, above)
+
+
+def levenshtein_distance_bounded(
+    seq1: list, seq2: list, max_distance: int, peq: dict | None = None
+) -> int:
+    """
+    calculate the Levenshtein distance between the 2 sequences if it is not greater than max_distance
+
+    The pairs of sequences with a difference of lengths greater than max_distance are rejected.
+    The distance is computed in the diagonal band of the dynamic programming matrix
+    (see levenshtein_distance_banded) if the band is not wider than LEVENSHTEIN_BAND_MAX,
+    otherwise with bit vectors (see levenshtein_vectors_bounded), faster for the wide bands.
+    Both stop as soon as the distance is known to be greater than max_distance.
+
+    Args:
+        seq1 (list): first sequence
+        seq2 (list): second sequence
+        max_distance (int): maximum distance
+        peq (dict): bit vectors of seq1 (see levenshtein_pattern), computed if None
+
+    Returns:
+        int: Levenshtein distance or max_distance + 1 if the distance is greater than max_distance
+    """
+    if abs(len(seq1) - len(seq2)) > max_distance:
+        return max_distance + 1
+    if 2 * max_distance + 1 <= LEVENSHTEIN_BAND_MAX:
+        return levenshtein_distance_banded(seq1, seq2, max_distance)
+    return levenshtein_vectors_bounded(
+        levenshtein_pattern(seq1) if peq is None else peq,
+        len(seq1),
+        seq2,
+        max_distance,
+    )
+
+
+def levenshtein_pairs_tile(
+    corpus: Corpus, rows: range, cols: range, max_distance: int
+) -> list:
+    """
+    find the pairs of sequences (i in rows, j in cols and i < j) with a Levenshtein distance
+    not greater than max_distance
+
+    The pairs are rejected without computing the distance if the difference of their lengths or of
+    their numbers of each behavior (lower bounds of the distance) is greater than max_distance.
+    The distance of the other pairs is computed by levenshtein_distance_bounded, or by levenshtein_tile
+    for all the pairs of the tile if more than LEVENSHTEIN_PAIRS_DENSE of the pairs remain.
+
+    Args:
+        corpus (Corpus): encoded sequences
+        rows (range): indexes of the first sequences
+        cols (range): indexes of the second sequences
+        max_distance (int): maximum distance
+
+    Returns:
+        list: (i, j, distance) tuples
+    """
+    lengths = corpus.lengths
+
+    def behaviours_counts(sequences: range) -> np.ndarray:
+        # number of each behavior in each sequence (column 0 for the unknown behaviors)
+        n_columns = len(corpus.behaviours) + 1
+        codes = corpus.codes[
+            corpus.offsets[sequences.start] : corpus.offsets[sequences.stop]
+        ].astype(np.int64)
+        index = np.repeat(
+            np.arange(len(sequences)), lengths[sequences.start : sequences.stop]
+        )
+        return np.bincount(
+            index * n_columns + codes + 1, minlength=len(sequences) * n_columns
+        ).reshape(len(sequences), n_columns)
+
+    rows_counts = behaviours_counts(rows)
+    cols_counts = behaviours_counts(cols)
+
+    candidates = {}
+    for i in rows:
+        targets = np.arange(max(i + 1, cols.start), cols.stop)
+        targets = targets[np.abs(lengths[targets] - lengths[i]) <= max_distance]
+        if not len(targets):
+            continue
+        difference = cols_counts[targets - cols.start] - rows_counts[i - rows.start]
+        targets = targets[
+            np.maximum(
+                np.clip(difference, 0, None).sum(axis=1),
+                np.clip(-difference, 0, None).sum(axis=1),
+            )
+            <= max_distance
+        ]
+        if len(targets):
+            candidates[i] = targets
+
+    pairs = []
+    if sum(len(targets) for targets in candidates.values()) > (
+        LEVENSHTEIN_PAIRS_DENSE * len(rows) * len(cols)
+    ):
+        # many candidates: all the distances of the tile are computed with the packed bit vectors
+        distances = np.zeros((len(rows), len(cols)), dtype=np.int64)
+        levenshtein_tile(corpus, rows, cols, distances)
+        for i, targets in candidates.items():
+            for j, distance in zip(
+                targets.tolist(),
+                distances[i - rows.start, targets - cols.start].tolist(),
+            ):
+                if distance <= max_distance:
+                    pairs.append((i, j, distance))
+        return pairs
+
+    for i, targets in candidates.items():
+        seq1 = corpus[i].tolist()
+        peq = levenshtein_pattern(seq1)
+        for j in targets.tolist():
+            distance = levenshtein_distance_bounded(
+                seq1, corpus[j].tolist(), max_distance, peq
+            )
+            if distance <= max_distance:
+                pairs.append((i, j, distance))
+    return pairs
+
+
+def shared_levenshtein_pairs_tile(tile: tuple, handle: dict, max_distance: int) -> list:
+    """
+    find the pairs of sequences of a tile with a Levenshtein distance not greater than max_distance
+    on the sequences shared by share_arrays (see levenshtein_pairs)
+    """
+    arrays = attach_shared_arrays(handle)
+    return levenshtein_pairs_tile(
+        Corpus(arrays["codes"], arrays["offsets"], handle["behaviours"]),
+        *tile,
+        max_distance,
+    )
+
+
+def levenshtein_pairs(seq_list, max_distance: int, n_proc: int = 1) -> list:
+    """
+    find all the pairs of sequences with a Levenshtein distance not greater than max_distance
+
+    The distances greater than max_distance are not computed (see levenshtein_pairs_tile).
+    The upper triangle of the pairs is split in tiles (see distances_tiles) processed
+    in a pool of n_proc processes sharing the sequences.
+
+    Args:
+        seq_list (list): list of sequences or Corpus
+        max_distance (int): maximum distance
+        n_proc (int): number of processes (1: no process is started)
+
+    Returns:
+        list: sorted (i, j, distance) tuples (i < j)
+    """
+    corpus = as_corpus(seq_list)
+    tiles = distances_tiles(len(corpus), n_proc)
+
+    if n_proc <= 1 or len(tiles) <= 1:
+        return sorted(
+            itertools.chain.from_iterable(
+                levenshtein_pairs_tile(corpus, *tile, max_distance) for tile in tiles
+            )
+        )
+
+    block, layout = share_arrays({"codes": corpus.codes, "offsets": corpus.offsets})
+    handle = {"name": block.name, "layout": layout, "behaviours": corpus.behaviours}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_proc) as executor:
+            return sorted(
+                itertools.chain.from_iterable(
+                    executor.map(
+                        functools.partial(
+                            shared_levenshtein_pairs_tile,
+                            handle=handle,
+                            max_distance=max_distance,
+                        ),
+                        tiles,
+                    )
+                )
+            )
+    finally:
+        block.close()
+        block.unlink()
+
+
+def needleman_wunsch_identity(seq1: list, seq2: list) -> dict:
+    """
+    calculate the Needleman-Wunsch identity between the 2 sequences
+    """
+
+    match_award = 1
+    mismatch_penalty = -1
+    gap_penalty = -1  # both for opening and extanding
+
+    def match_score(alpha, beta):
+        if alpha == beta:
+            return match_award
+        elif alpha == "-" or beta == "-":
+            return gap_penalty
+        else:
+            return mismatch_penalty
+
+    def finalize(align1, align2):
+        align1 = align1[::-1]  # reverse sequence 1
+        align2 = align2[::-1]  # reverse sequence 2
+
+        i, j = 0, 0
+
+        # calculate identity, score and aligned sequences
+        symbol = []
+        found = 0
+        score = 0
+        identity = 0
+        for i in range(0, len(align1)):
+            if align1[i] == align2[i]:
+                symbol.append(align1[i])
+                identity = identity + 1
+                score += match_score(align1[i], align2[i])
+
+            elif align1[i] != align2[i] and align1[i] != "-" and align2[i] != "-":
+                score += match_score(align1[i], align2[i])
+                symbol.append(" ")
+                found = 0
+
+            elif align1[i] == "-" or align2[i] == "-":
+                symbol.append(" ")
+                score += gap_penalty
+
+        identity = float(identity) / len(align1) * 100
+
+        return {
+            "identity": identity,
+            "score": score,
+            "align1": align1,
+            "align2": align2,
+            "symbol": symbol,
+        }
+
+    m, n = len(seq1), len(seq2)  # length of two sequences
+
+    # Generate DP table and traceback path pointer matrix
+    score = np.zeros((m + 1, n + 1))
+
+    # Calculate DP table
+    for i in range(0, m + 1):
+        score[i][0] = gap_penalty * i
+    for j in range(0, n + 1):
         score[0][j] = gap_penalty * j
     for i in range(1, m + 1):
         for j in range(1, n + 1):
@@ -827,21 +2967,349 @@ def needleman_wunsch_identity(seq1: list, seq2: list) -> dict:
     return finalize(align1, align2)
 
 
-def needleman_wunsch_identity_seq_list(seq_list: list) -> np.ndarray:
+def needleman_wunsch_tile(
+    corpus: Corpus, rows: range, cols: range, out: np.ndarray
+) -> None:
+    """
+    calculate the Needleman-Wunsch identities between the sequences of rows and the next sequences of cols
+    (out[i - rows.start, j - cols.start] for i in rows, j in cols and i < j)
+
+    Args:
+        corpus (Corpus): encoded sequences
+        rows (range): indexes of the first sequences
+        cols (range): indexes of the second sequences
+        out (np.ndarray): identities of the tile (len(rows) x len(cols))
+    """
+    for i in rows:
+        seq1 = corpus[i].tolist()
+        for j in range(max(i + 1, cols.start), cols.stop):
+            out[i - rows.start, j - cols.start] = needleman_wunsch_identity(
+                seq1, corpus[j].tolist()
+            )["identity"]
+
+
+def needleman_wunsch_identity_seq_list(
+    seq_list: list, n_proc: int = 1, condensed: bool = False, file_name: str = ""
+) -> np.ndarray:
     """
     calculate the Needleman-Wunsch identities for all combinations of 2 sequences in list
 
     Args:
-        seq_list (list): list of sequences
+        seq_list (list): list of sequences or Corpus
+        n_proc (int): number of processes
+        condensed (bool): return the condensed upper triangle (see pairwise_distances)
+        file_name (str): path of the memory-mapped .npy file of the condensed upper triangle
 
     Returns:
         numpy array: Needleman-Wunsch identities
     """
 
-    results = np.zeros((len(seq_list), len(seq_list)))
-    for p in itertools.combinations(enumerate(seq_list), 2):
-        results[p[0][0], p[1][0]] = needleman_wunsch_identity(p[0][1], p[1][1])[
-            "identity"
-        ]
-        results[p[1][0], p[0][0]] = results[p[0][0], p[1][0]]
+    return pairwise_distances(
+        seq_list, "needleman_wunsch", n_proc, condensed, file_name
+    )
+
+
+# functions computing a tile of the distances matrix (see pairwise_distances)
+DISTANCES_TILE_FUNCTIONS = {
+    "levenshtein": levenshtein_tile,
+    "needleman_wunsch": needleman_wunsch_tile,
+}
+
+
+def distances_tiles(n_sequences: int, n_proc: int = 1) -> list:
+    """
+    split the upper triangle of the distances matrix in square tiles
+    (about DISTANCES_TILES_BY_PROCESS tiles by process and at most DISTANCES_TILE_MAX rows by tile)
+
+    Args:
+        n_sequences (int): number of sequences
+        n_proc (int): number of processes
+
+    Returns:
+        list: tiles ((rows, cols) tuples of ranges)
+    """
+    n_blocks = -(-n_sequences // DISTANCES_TILE_MAX)
+    if n_proc > 1:
+        n_blocks = max(
+            n_blocks, math.ceil(math.sqrt(2 * DISTANCES_TILES_BY_PROCESS * n_proc))
+        )
+    size = max(1, -(-n_sequences // max(1, n_blocks)))
+    bounds = range(0, n_sequences, size)
+    return [
+        (range(r, min(r + size, n_sequences)), range(c, min(c + size, n_sequences)))
+        for r in bounds
+        for c in bounds
+        if c >= r
+    ]
+
+
+def distances_dtype(corpus: Corpus, metric: str) -> np.dtype:
+    """
+    smallest dtype of the condensed distances: unsigned integer able to store the length of the longest
+    sequence for the Levenshtein distances, float32 for the Needleman-Wunsch identities
+    """
+    if metric == "levenshtein":
+        return np.min_scalar_type(int(corpus.lengths.max(initial=0)))
+    return np.dtype(np.float32)
+
+
+def condensed_index(i: int, j: int, n_sequences: int) -> int:
+    """
+    index of the distance between the sequences i and j (i < j) in the condensed upper triangle
+    (row by row, as scipy.spatial.distance.squareform)
+    """
+    return n_sequences * i - i * (i + 1) // 2 + j - i - 1
+
+
+def condensed_size(n_values: int) -> int:
+    """
+    number of sequences of a condensed upper triangle of n_values distances
+    """
+    return (1 + math.isqrt(1 + 8 * n_values)) // 2
+
+
+def distances_row(distances: np.ndarray, i: int) -> np.ndarray:
+    """
+    distances between the sequence i and all the sequences
+    (read on demand from a square matrix or from a condensed upper triangle, possibly memory-mapped)
+
+    Args:
+        distances (np.ndarray): square matrix or condensed upper triangle (see pairwise_distances)
+        i (int): index of sequence
+
+    Returns:
+        np.ndarray: row i of the distances matrix
+    """
+    if distances.ndim == 2:
+        return np.asarray(distances[i])
+
+    n_sequences = condensed_size(len(distances))
+    row = np.zeros(n_sequences, dtype=distances.dtype)
+    # distances with the previous sequences: column i of the upper triangle
+    previous = np.arange(i)
+    row[:i] = distances[
+        n_sequences * previous - previous * (previous + 1) // 2 + i - previous - 1
+    ]
+    start = condensed_index(i, i + 1, n_sequences)
+    row[i + 1 :] = distances[start : start + n_sequences - i - 1]
+    return row
+
+
+def save_distances_tsv(
+    file_name: str, distances: np.ndarray, labels: list, fmt: str = "%f"
+) -> None:
+    """
+    save a distances matrix in a TSV file with the labels as header
+    (the rows are streamed from the storage, see distances_row)
+
+    Args:
+        file_name (str): path of the TSV file
+        distances (np.ndarray): square matrix or condensed upper triangle
+        labels (list): labels of rows and columns
+        fmt (str): format of values
+    """
+    with open(file_name, mode="w", encoding="utf-8") as f_out:
+        f_out.write("\t" + "\t".join(labels) + "\n")
+        for i, label in enumerate(labels):
+            f_out.write(
+                label
+                + "\t"
+                + "\t".join(fmt % x for x in distances_row(distances, i).tolist())
+                + "\n"
+            )
+
+
+def store_distances_tile(results: np.ndarray, tile: tuple, values: np.ndarray) -> None:
+    """
+    copy the distances of a tile in the upper triangle of the results
+    (square matrix or condensed upper triangle)
+
+    Args:
+        results (np.ndarray): distances matrix
+        tile (tuple): rows and cols ranges (see distances_tiles)
+        values (np.ndarray): distances of the tile
+    """
+    rows, cols = tile
+    if results.ndim == 2:
+        results[rows.start : rows.stop, cols.start : cols.stop] = values
+        return
+
+    n_sequences = condensed_size(len(results))
+    for i in rows:
+        first = max(i + 1, cols.start)
+        if first < cols.stop:
+            start = condensed_index(i, first, n_sequences)
+            results[start : start + cols.stop - first] = values[
+                i - rows.start, first - cols.start :
+            ]
+
+
+def compute_distances_tile(
+    corpus: Corpus, metric: str, tile: tuple, results: np.ndarray
+) -> None:
+    """
+    compute a tile of the distances matrix and store it in the results
+    """
+    values = np.zeros((len(tile[0]), len(tile[1])), dtype=results.dtype)
+    DISTANCES_TILE_FUNCTIONS[metric](corpus, *tile, values)
+    store_distances_tile(results, tile, values)
+
+
+def share_distances_data(
+    corpus: Corpus, metric: str, condensed: bool = False, file_name: str = ""
+) -> Tuple[shared_memory.SharedMemory, dict]:
+    """
+    copy the encoded corpus in a shared memory block and allocate the distances matrix
+    to be used by the processes computing the tiles without pickling the sequences for each task
+
+    The distances matrix is allocated in the block (square matrix or condensed upper triangle)
+    or in a memory-mapped .npy file (condensed upper triangle) opened by each process.
+    The owner of the block must close and unlink it at the end of the computation.
+
+    Args:
+        corpus (Corpus): encoded sequences
+        metric (str): key of DISTANCES_TILE_FUNCTIONS
+        condensed (bool): condensed upper triangle in the smallest dtype (see distances_dtype)
+        file_name (str): path of the .npy file of the condensed upper triangle
+
+    Returns:
+        shared_memory.SharedMemory: the shared memory block
+        dict: handle of the data (see shared_distances_tile)
+    """
+    n_sequences = len(corpus)
+    arrays = {"codes": corpus.codes, "offsets": corpus.offsets}
+    if file_name:
+        np.lib.format.open_memmap(
+            file_name,
+            mode="w+",
+            dtype=distances_dtype(corpus, metric),
+            shape=(n_sequences * (n_sequences - 1) // 2,),
+        ).flush()
+    elif condensed:
+        arrays["results"] = (
+            (n_sequences * (n_sequences - 1) // 2,),
+            distances_dtype(corpus, metric),
+        )
+    else:
+        arrays["results"] = ((n_sequences, n_sequences), np.float64)
+
+    block, layout = share_arrays(arrays)
+    return block, {
+        "name": block.name,
+        "layout": layout,
+        "behaviours": corpus.behaviours,
+        "metric": metric,
+        "file_name": file_name,
+    }
+
+
+def shared_distances_tile(tile: tuple, handle: dict) -> tuple:
+    """
+    compute a tile of the distances matrix on the data shared by share_distances_data
+    (the results are written in the shared distances matrix or in the memory-mapped file)
+
+    Args:
+        tile (tuple): rows and cols ranges (see distances_tiles)
+        handle (dict): handle of the data (see share_distances_data)
+
+    Returns:
+        tuple: the tile
+    """
+    arrays = attach_shared_arrays(handle)
+    corpus = Corpus(arrays["codes"], arrays["offsets"], handle["behaviours"])
+    if handle["file_name"]:
+        results = np.load(handle["file_name"], mmap_mode="r+")
+        compute_distances_tile(corpus, handle["metric"], tile, results)
+        results.flush()
+    else:
+        compute_distances_tile(corpus, handle["metric"], tile, arrays["results"])
+    return tile
+
+
+def distances_results(handle: dict) -> np.ndarray:
+    """
+    distances computed on the data shared by share_distances_data
+
+    Args:
+        handle (dict): handle of the data (see share_distances_data)
+
+    Returns:
+        np.ndarray: symmetric distances matrix (copy), condensed upper triangle (copy)
+                    or read-only memory-mapped condensed upper triangle
+    """
+    if handle["file_name"]:
+        return np.load(handle["file_name"], mmap_mode="r")
+    results = np.array(attach_shared_arrays(handle)["results"])
+    # the block is released by its owner
+    detach_shared_arrays()
+    if results.ndim == 2:
+        results += results.T
     return results
+
+
+def pairwise_distances(
+    seq_list, metric: str, n_proc: int = 1, condensed: bool = False, file_name: str = ""
+) -> np.ndarray:
+    """
+    calculate the distances for all combinations of 2 sequences
+
+    The upper triangle of the matrix is split in tiles (see distances_tiles) computed
+    in a pool of n_proc processes. The sequences are shared with the processes and each tile is written
+    directly in the distances matrix allocated in the shared memory or in the memory-mapped file
+    (see share_distances_data).
+
+    The distances are returned as a symmetric float64 matrix or as the condensed upper triangle
+    (distance between the sequences i < j at condensed_index(i, j, n)) in the smallest dtype
+    (see distances_dtype). The condensed upper triangle is stored in a memory-mapped .npy file
+    if file_name is given (see distances_row to read the rows on demand).
+
+    Args:
+        seq_list (list): list of sequences or Corpus
+        metric (str): "levenshtein" or "needleman_wunsch"
+        n_proc (int): number of processes (1: no process is started)
+        condensed (bool): return the condensed upper triangle
+        file_name (str): path of the .npy file of the condensed upper triangle
+
+    Returns:
+        np.ndarray: distances matrix or condensed upper triangle (np.memmap if file_name is given)
+    """
+    corpus = as_corpus(seq_list)
+    tiles = distances_tiles(len(corpus), n_proc)
+    n_sequences = len(corpus)
+
+    if n_proc <= 1 or len(tiles) <= 1:
+        if file_name:
+            results = np.lib.format.open_memmap(
+                file_name,
+                mode="w+",
+                dtype=distances_dtype(corpus, metric),
+                shape=(n_sequences * (n_sequences - 1) // 2,),
+            )
+        elif condensed:
+            results = np.zeros(
+                n_sequences * (n_sequences - 1) // 2,
+                dtype=distances_dtype(corpus, metric),
+            )
+        else:
+            results = np.zeros((n_sequences, n_sequences))
+        for tile in tiles:
+            compute_distances_tile(corpus, metric, tile, results)
+        if file_name:
+            results.flush()
+            del results
+            return np.load(file_name, mmap_mode="r")
+        if results.ndim == 2:
+            results += results.T
+        return results
+
+    block, handle = share_distances_data(corpus, metric, condensed, file_name)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_proc) as executor:
+            for _ in executor.map(
+                functools.partial(shared_distances_tile, handle=handle), tiles
+            ):
+                pass
+        return distances_results(handle)
+    finally:
+        block.close()
+        block.unlink()
@@ -22,16 +22,21 @@ This file is part of Behatrix.
 """
 
 import concurrent.futures
+import contextlib
 import datetime as dt
+import functools
+import itertools
 import logging
 import math
 import multiprocessing
+import multiprocessing.pool
 import os
 import platform
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import traceback
 from pathlib import Path
 from shutil import copyfile
@@ -51,7 +56,13 @@ from PySide6.QtWidgets import (
     QTableWidgetItem,
 )
 
-from . import behatrix_functions, behatrix_qrc, version
+from . import (
+    behatrix_distributed,
+    behatrix_functions,
+    behatrix_index,
+    behatrix_qrc,
+    version,
+)
 from .behatrix_ui import Ui_MainWindow
 
 # set logging
@@ -62,8 +73,16 @@ logging.basicConfig(
 )
 
 
+# minimum delay (in seconds) between 2 updates of the p-values matrix during the permutations test
+PERMUTATIONS_DISPLAY_DELAY = 0.5
+
+# subcommands of the command line utility
+CLI_SUBCOMMANDS = ("worker", "compare", "index")
+
+
 class MainWindow(QMainWindow, Ui_MainWindow):
-    permutations_finished_signal = Signal(list)
+    permutations_batch_signal = Signal(object)
+    distances_tile_signal = Signal(object)
 
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
@@ -163,7 +182,12 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.pte_excluded_transitions.clear
         )
         self.pb_run_permutations_test.clicked.connect(self.permutation_test)
+        self.pb_cancel_permutations_test.clicked.connect(self.cancel_permutations_test)
+        self.progress_permutations_test.setVisible(False)
         self.pb_save_random.clicked.connect(self.save_permutations_test_results)
+        self.comb_permutations_output.currentIndexChanged.connect(
+            self.permutations_output_changed
+        )
         self.pte_behav_seq.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
         num_available_proc = os.cpu_count()
         self.sb_nb_cores.setMinimum(1)
@@ -172,6 +196,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.sb_nb_cores.setValue(1)
         else:
             self.sb_nb_cores.setValue(num_available_proc - 1)
+        self.sb_nb_cores.valueChanged.connect(self.nb_cores_changed)
+
+        # pool of processes shared by permutations test and distances
+        self.pool = None
+        self.pool_size = 0
 
         # tab distances
         self.pb_levenshtein.clicked.connect(self.levenshtein_distance)
@@ -180,6 +209,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.pte_distances_results.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
 
         self.permutations_test_matrix = None
+        # n-gram value and codes of the tested n-gram transitions of the last permutations test
+        self.permutations_ngram = 1
+        self.permutations_ngram_keys = None
+        # number of distinct permutations of the last permutations test if exact (None if random)
+        self.exact_size = None
 
         self.cb_plot_significativity.setEnabled(False)
 
@@ -203,7 +237,16 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         else:
             self.check_dot_path()
 
-        self.permutations_finished_signal.connect(self.get_permutations_results)
+        self.permutations_batch_signal.connect(self.get_permutations_results)
+        self.permutations_running = False
+        self.permutations_run_id = 0
+        self.permutations_shared_block = None
+        self.permutations_handle = None
+
+        self.distances_tile_signal.connect(self.get_distances_results)
+        self.distances_running = False
+        self.distances_run_id = 0
+        self.distances_shared_block = None
         self.mem_behaviours = ""
 
         self.sb_cutoff_transition_after_behav.setEnabled(
@@ -427,6 +470,74 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         )
         settings.setValue("dot_prog_path", self.le_dot_path.text())
 
+        # release the shared memory of the running tasks before stopping the processes
+        if self.permutations_running:
+            self.stop_permutations_test()
+        if self.distances_running:
+            self.stop_distances()
+        self.shutdown_pool(terminate=True)
+
+    def get_pool(self) -> multiprocessing.pool.Pool:
+        """
+        return the pool of processes shared by the permutations test and the distances computation.
+        The pool is created (or re-created if the number of cores was changed and no task is running)
+        with the number of cores selected in sb_nb_cores
+        """
+        if (
+            self.pool is not None
+            and self.pool_size != self.sb_nb_cores.value()
+            and not self.permutations_running
+            and not self.distances_running
+        ):
+            self.shutdown_pool()
+
+        if self.pool is None:
+            self.pool_size = self.sb_nb_cores.value()
+            self.pool = multiprocessing.Pool(processes=self.pool_size)
+
+        return self.pool
+
+    def shutdown_pool(self, terminate: bool = False):
+        """
+        shutdown the pool of processes
+
+        Args:
+            terminate (bool): stop the running tasks (otherwise wait for their end)
+        """
+        if self.pool is None:
+            return
+        if terminate:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        self.pool = None
+
+    def detach_pool_workers(self, handle: dict):
+        """
+        close the shared memory block of a finished task in the processes of the pool
+        (they keep the last block they attached, see behatrix_functions.attach_shared_arrays).
+        The tasks are queued after the remaining tasks of a cancelled run
+
+        Args:
+            handle (dict): handle of the shared data of the task
+        """
+        if self.pool is None:
+            return
+        self.pool.map_async(
+            behatrix_functions.detach_pool_worker,
+            [handle["name"]] * self.pool_size,
+            chunksize=1,
+        )
+
+    def nb_cores_changed(self):
+        """
+        the number of cores to use was changed: release the pool if no task is running
+        (it will be re-created with the new size)
+        """
+        if not self.permutations_running and not self.distances_running:
+            self.shutdown_pool()
+
     def clear_results(self):
         self.pte_statistics.clear()
         self.tw_observed_transitions.clear()
@@ -778,20 +889,21 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             )
             return
 
-        if self.sb_ngram.value() > 1:
-            tot_trans_after_ngram = {}
-            for transition in results["ngram_transitions"]:
-                if (
-                    self.le_behaviors_separator.text().join(transition[0])
-                    not in tot_trans_after_ngram
-                ):
-                    tot_trans_after_ngram[
-                        self.le_behaviors_separator.text().join(transition[0])
-                    ] = 0
-                tot_trans_after_ngram[
-                    self.le_behaviors_separator.text().join(transition[0])
-                ] += results["ngram_transitions"][transition]
+        if (
+            self.cb_plot_significativity.isChecked()
+            and self.permutations_ngram != self.sb_ngram.value()
+        ):
+            QMessageBox.critical(
+                self,
+                "Behatrix",
+                (
+                    "The permutations test was done with a different n-gram value.<br>"
+                    "Run the permutations test again to add significativity to graph"
+                ),
+            )
+            return
 
+        if self.sb_ngram.value() > 1:
             (header_out, nodes_out, edges_out, graph_out, footer_out, nodes_list) = (
                 behatrix_functions.draw_diagram(
                     cutoff_all=self.sb_cutoff_total_transition.value()
@@ -800,27 +912,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                     cutoff_behavior=self.sb_cutoff_transition_after_behav.value()
                     if self.rb_percent_after_behav.isChecked()
                     else None,
-                    unique_transitions={
-                        tuple(
-                            self.le_behaviors_separator.text().join(x) for x in k
-                        ): results["ngram_transitions"][k]
-                        for k in results["ngram_transitions"]
-                    },
-                    nodes={
-                        self.le_behaviors_separator.text().join(k): results[
-                            "ngram_count"
-                        ][k]
-                        for k in results["ngram_count"]
-                    },
                     starting_nodes=[],
-                    tot_nodes=results["ngrams_total_number"],
-                    tot_trans=sum(
-                        [
-                            results["ngram_transitions"][x]
-                            for x in results["ngram_transitions"]
-                        ]
-                    ),
-                    tot_trans_after_node=tot_trans_after_ngram,
                     edge_label=edge_label,
                     decimals_number=self.sb_decimals.value(),
                     significativity=self.permutations_test_matrix
@@ -828,6 +920,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                     and (self.cb_plot_significativity.isChecked())
                     else None,
                     behaviors=results["behaviours"],
+                    **behatrix_functions.ngram_diagram_data(
+                        results, self.le_behaviors_separator.text()
+                    ),
                 )
             )
 
@@ -1102,54 +1197,188 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         for behavior in results["behaviours"]:
             self.pte_excluded_transitions.insertPlainText(f"{behavior}:{behavior}\n")
 
-    def get_permutations_results(self, results):
+    def display_permutations_results(self):
         """
-        handle results of permutations test
+        display the matrix selected in the output list (p-values or z-scores) of the permutations done
         """
 
-        self.pb_run_permutations_test.setEnabled(True)
-        nb_randomization_done = 0
-        permutation_results = np.zeros((len(self.behaviours), len(self.behaviours)))
-        for n_permut, result in results:
-            nb_randomization_done += n_permut
-            permutation_results += result
-
-        self.permutations_test_matrix = permutation_results / nb_randomization_done
-
-        rows = self.permutations_test_matrix.shape[0]
-        self.tw_random.setRowCount(rows)
-        self.tw_random.setColumnCount(rows)
-        self.tw_random.setHorizontalHeaderLabels(self.behaviours)
-        self.tw_random.setVerticalHeaderLabels(self.behaviours)
-        for row in range(rows):
-            for col in range(rows):
-                item = QTableWidgetItem(
-                    f"{self.permutations_test_matrix[row, col]:8.6f}"
-                )
+        statistics = behatrix_functions.permutations_statistics(
+            self.permutations_results,
+            self.nb_randomization_done,
+            self.permutations_observed_matrix,
+        )
+
+        matrix = statistics[
+            ("p_upper", "p_lower", "z_scores")[
+                self.comb_permutations_output.currentIndex()
+            ]
+        ]
+
+        if self.permutations_ngram > 1:
+            # the upper-tail p-values of the n-gram transitions are used for the flow diagram
+            self.permutations_test_matrix = behatrix_functions.ngram_significativity(
+                self.permutations_ngram_keys,
+                statistics["p_upper"],
+                self.behaviours,
+                self.permutations_ngram,
+                self.le_behaviors_separator.text(),
+            )
+            # only the observed n-gram transitions are tested
+            values = behatrix_functions.ngram_significativity(
+                self.permutations_ngram_keys,
+                matrix,
+                self.behaviours,
+                self.permutations_ngram,
+                self.le_behaviors_separator.text(),
+            )
+            labels = list(dict.fromkeys(itertools.chain.from_iterable(values)))
+            self.tw_random.clear()
+            self.tw_random.setRowCount(len(labels))
+            self.tw_random.setColumnCount(len(labels))
+            self.tw_random.setHorizontalHeaderLabels(labels)
+            self.tw_random.setVerticalHeaderLabels(labels)
+            for (ngram1, ngram2), value in values.items():
+                item = QTableWidgetItem(f"{value:8.6f}")
                 item.setTextAlignment(Qt.AlignCenter)
-                self.tw_random.setItem(row, col, item)
+                self.tw_random.setItem(labels.index(ngram1), labels.index(ngram2), item)
+
+        else:
+            # the upper-tail p-values are used for the flow diagram
+            self.permutations_test_matrix = statistics["p_upper"]
+
+            rows = matrix.shape[0]
+            self.tw_random.setRowCount(rows)
+            self.tw_random.setColumnCount(rows)
+            self.tw_random.setHorizontalHeaderLabels(self.behaviours)
+            self.tw_random.setVerticalHeaderLabels(self.behaviours)
+            for row in range(rows):
+                for col in range(rows):
+                    item = QTableWidgetItem(f"{matrix[row, col]:8.6f}")
+                    item.setTextAlignment(Qt.AlignCenter)
+                    self.tw_random.setItem(row, col, item)
+
+        self.permutations_display_time = time.monotonic()
+
+    def permutations_output_changed(self):
+        """
+        display the selected results of the permutations test
+        """
+        if self.permutations_test_matrix is not None:
+            self.display_permutations_results()
+
+    def permutations_batch_finished(self, run_id: int, result):
+        """
+        a batch of permutations is finished (called from the thread of the pool)
+        """
+        self.permutations_batch_signal.emit((run_id, result))
+
+    def get_permutations_results(self, batch_result):
+        """
+        handle results of a batch of permutations
+        """
+
+        run_id, result = batch_result
+
+        # results of a cancelled test
+        if not self.permutations_running or run_id != self.permutations_run_id:
+            return
+
+        if isinstance(result, Exception):
+            self.stop_permutations_test()
+            QMessageBox.critical(
+                self, "Behatrix", f"Error during the permutations test: {result}"
+            )
+            return
+
+        n_permut, permutation_results = result
+        self.nb_randomization_done += n_permut
+        behatrix_functions.merge_permutations_counters(
+            self.permutations_results, permutation_results
+        )
+        self.nb_batches_done += 1
+
+        self.progress_permutations_test.setValue(self.nb_randomization_done)
 
+        if self.nb_batches_done == self.nb_batches:
+            self.stop_permutations_test()
+            self.permutations_test_finished()
+        elif (
+            time.monotonic() - self.permutations_display_time
+            > PERMUTATIONS_DISPLAY_DELAY
+        ):
+            self.display_permutations_results()
+
+    def stop_permutations_test(self, terminate: bool = False):
+        """
+        reset the widgets at the end of the permutations test
+
+        Args:
+            terminate (bool): stop the running tasks (the pool will be re-created for the next task).
+                              The pool is kept if a distances computation is running: the batches not
+                              yet started are skipped and the results of the others are ignored
+                              (see get_permutations_results)
+        """
+        self.permutations_running = False
+        if terminate and not self.distances_running:
+            self.shutdown_pool(terminate=True)
+
+        if self.permutations_shared_block is not None:
+            if terminate:
+                behatrix_functions.cancel_shared_permutations(
+                    self.permutations_shared_block, self.permutations_handle
+                )
+            self.permutations_shared_block.close()
+            self.permutations_shared_block.unlink()
+            self.permutations_shared_block = None
+            self.detach_pool_workers(self.permutations_handle)
+
+        self.pb_run_permutations_test.setEnabled(True)
+        self.pb_cancel_permutations_test.setEnabled(False)
+        self.progress_permutations_test.setVisible(False)
         self.statusbar.showMessage("", 0)
 
+    def cancel_permutations_test(self):
+        """
+        cancel the running permutations test and keep the partial results
+        """
+        if not self.permutations_running:
+            return
+
+        self.stop_permutations_test(terminate=True)
+
+        if not self.nb_randomization_done:
+            self.tw_random.clear()
+            QMessageBox.information(self, "Behatrix", "Permutations test cancelled")
+            return
+
+        self.permutations_test_finished(cancelled=True)
+
+    def permutations_test_finished(self, cancelled: bool = False):
+        """
+        permutations test finished
+        """
+
+        self.display_permutations_results()
+
         self.cb_plot_significativity.setEnabled(True)
 
         QMessageBox.information(
             self,
             "Behatrix",
             (
-                f"Permutations test finished<br>{nb_randomization_done} permutations done<br><br>"
+                f"Permutations test {'cancelled' if cancelled else 'finished'}<br>"
+                f"{self.nb_randomization_done} permutations done"
+                f"{' (exact test: all the distinct permutations)' if self.exact_size is not None else ''}<br>"
+                f"Seed: {self.seed}<br><br>"
             ),
         )
 
-    def permutations_test_finished(self, results):
-        """
-        permutations test finished
-        """
-        self.permutations_finished_signal.emit(results)
-
     def permutation_test(self):
         """
         execute permutations test
+
+        The permutations are split in small batches distributed to the processes.
+        The p-values matrix is updated when batches are finished.
         """
 
         if not self.pte_behav_seq.toPlainText():
@@ -1157,6 +1386,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             return
 
         self.tw_random.clear()
+        self.permutations_test_matrix = None
 
         results = behatrix_functions.behavioral_sequence_analysis(
             self.pte_behav_seq.toPlainText(),
@@ -1191,40 +1421,99 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 )
                 return
 
+        if self.le_seed.text().strip():
+            try:
+                seed = int(self.le_seed.text())
+            except Exception:
+                QMessageBox.warning(self, "Behatrix", "The seed is not valid")
+                return
+        else:
+            seed = None
+
         if self.nrandom:
             self.statusbar.showMessage("Permutations test running... Be patient", 0)
 
-            num_proc = self.sb_nb_cores.value()
-
-            if num_proc > self.nrandom:
-                num_proc = self.nrandom
-
-            observed_matrix = behatrix_functions.create_observed_transition_matrix(
-                results["sequences"], self.behaviours
-            )
+            self.permutations_ngram = self.sb_ngram.value()
+            if self.permutations_ngram > 1:
+                # transitions between successive n-grams (only the observed transitions are tested)
+                try:
+                    self.permutations_ngram_keys, observed_matrix = (
+                        behatrix_functions.ngram_transitions(
+                            results["corpus"], self.permutations_ngram
+                        )
+                    )
+                except ValueError as exc:
+                    QMessageBox.warning(self, "Behatrix", str(exc))
+                    return
+            else:
+                observed_matrix = behatrix_functions.create_observed_transition_matrix(
+                    results["sequences"], self.behaviours
+                )
 
             self.pb_run_permutations_test.setEnabled(False)
-            self.nb_randomization_done = 0
-            pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
+            self.pb_cancel_permutations_test.setEnabled(True)
+            self.progress_permutations_test.setValue(0)
+            self.progress_permutations_test.setVisible(True)
 
-            n_random_by_proc = round(self.nrandom / num_proc + 1)
-
-            pool.starmap_async(
-                behatrix_functions.permutations_test,
-                [
-                    (
-                        n_random_by_proc,
-                        results["sequences"],
-                        self.behaviours,
-                        exclusion_list,
-                        self.cb_block_first_behavior.isChecked(),
-                        self.cb_block_last_behavior.isChecked(),
-                        observed_matrix,
-                    )
-                ]
-                * num_proc,
-                callback=self.permutations_test_finished,
+            self.nb_randomization_done = 0
+            self.nb_batches_done = 0
+            self.permutations_results = behatrix_functions.permutations_counters(
+                len(self.behaviours), cells=observed_matrix.shape
+            )
+            self.permutations_observed_matrix = observed_matrix
+            self.permutations_display_time = time.monotonic()
+            self.permutations_run_id += 1
+
+            pool = self.get_pool()
+            self.permutations_running = True
+
+            self.exact_size = behatrix_functions.exact_permutations_size(
+                self.nrandom,
+                results["corpus"],
+                exclusion_list,
+                self.cb_block_first_behavior.isChecked(),
+                self.cb_block_last_behavior.isChecked(),
+                within_sequence=self.cb_within_sequence.isChecked(),
             )
+            if self.exact_size is not None:
+                # small permutations space: one batch enumerates all the distinct permutations
+                batches = [self.nrandom]
+                self.progress_permutations_test.setMaximum(self.exact_size)
+            else:
+                # split the permutations in small batches
+                batches = behatrix_functions.permutations_chunks(
+                    self.nrandom, results["corpus"].n_events
+                )
+                self.progress_permutations_test.setMaximum(self.nrandom)
+            self.nb_batches = len(batches)
+
+            # independent random streams for each batch
+            self.seed, seeds = behatrix_functions.spawn_seeds(seed, self.nb_batches)
+
+            # the corpus and the observed matrix are shared with the processes
+            self.permutations_shared_block, self.permutations_handle = (
+                behatrix_functions.share_permutations_data(
+                    results["corpus"],
+                    observed_matrix,
+                    exclusion_list,
+                    self.cb_block_first_behavior.isChecked(),
+                    self.cb_block_last_behavior.isChecked(),
+                    ngram=self.permutations_ngram,
+                    within_sequence=self.cb_within_sequence.isChecked(),
+                )
+            )
+
+            for i in range(self.nb_batches):
+                pool.apply_async(
+                    behatrix_functions.shared_permutations_test,
+                    (batches[i], self.permutations_handle, seeds[i]),
+                    callback=lambda result, run_id=self.permutations_run_id: (
+                        self.permutations_batch_finished(run_id, result)
+                    ),
+                    error_callback=lambda error, run_id=self.permutations_run_id: (
+                        self.permutations_batch_finished(run_id, error)
+                    ),
+                )
 
         else:
             QMessageBox.warning(
@@ -1252,60 +1541,146 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.save_tablewidget_to_tsv(self.tw_random, file_name)
 
-    def levenshtein_distance(self):
+    def distances_sequences(self) -> list:
         """
-        Levenshtein distances between behavioral sequences
+        return the list of sequences for distances computation
         """
-
         seq_list = [
             x.strip() for x in self.pte_behav_seq.toPlainText().split("\n") if x.strip()
         ]
-        n_pad = int(math.log10(len(seq_list))) + 1
 
         if self.le_behaviors_separator.text():
             seq_list = [x.split(self.le_behaviors_separator.text()) for x in seq_list]
 
-        results = behatrix_functions.levenshtein_distance_seq_list(seq_list)
+        return seq_list
 
-        # display results
-        out = "Levenshtein distances:\n"
-        # header
-        out += "\t{}\n".format(
-            "\t".join([f"seq{x + 1:0{n_pad}}" for x, _ in enumerate(seq_list)])
+    def run_distances(self, mode: str, metric: str):
+        """
+        compute the distances between behavioral sequences in the pool of processes
+        (the tiles of the distances matrix are distributed to the processes)
+
+        Args:
+            mode (str): "Levenshtein distances" or "Needleman-Wunsch identities"
+            metric (str): metric of behatrix_functions.pairwise_distances
+        """
+
+        if self.distances_running:
+            return
+
+        seq_list = self.distances_sequences()
+        if not seq_list:
+            QMessageBox.warning(self, "Behatrix", "No behavioral sequences found!")
+            return
+
+        corpus = behatrix_functions.as_corpus(seq_list)
+        tiles = behatrix_functions.distances_tiles(
+            len(corpus), self.sb_nb_cores.value()
         )
-        for r in range(results.shape[0]):
-            out += f"seq{r + 1:0{n_pad}}\t"
-            out += "\t".join([f"{int(x)}" for x in results[r, :]]) + "\n"
 
-        self.pte_distances_results.setPlainText(out)
+        # the sequences are shared with the processes and the tiles are written in the shared matrix
+        self.distances_shared_block, self.distances_handle = (
+            behatrix_functions.share_distances_data(corpus, metric)
+        )
+        # the pool is re-created with the selected number of cores only if no task is running
+        pool = self.get_pool()
+
+        self.distances_running = True
+        self.distances_run_id += 1
+        self.distances_mode = mode
+        self.distances_tiles_remaining = len(tiles)
+        self.pb_levenshtein.setEnabled(False)
+        self.pb_needleman_wunsch.setEnabled(False)
+        self.statusbar.showMessage(f"{mode} computation running... Be patient", 0)
+
+        for tile in tiles:
+            pool.apply_async(
+                behatrix_functions.shared_distances_tile,
+                (tile, self.distances_handle),
+                callback=lambda result, run_id=self.distances_run_id: (
+                    self.distances_tile_signal.emit((run_id, result))
+                ),
+                error_callback=lambda error, run_id=self.distances_run_id: (
+                    self.distances_tile_signal.emit((run_id, error))
+                ),
+            )
 
-    def needleman_wunsch_identity(self):
+    def get_distances_results(self, tile_result):
         """
-        Needleman-Wunsch identities between behavioral sequences
+        handle the end of a tile of the distances matrix
         """
 
-        seq_list = [
-            x.strip() for x in self.pte_behav_seq.toPlainText().split("\n") if x.strip()
-        ]
-        n_pad = int(math.log10(len(seq_list))) + 1
+        run_id, result = tile_result
 
-        if self.le_behaviors_separator.text():
-            seq_list = [x.split(self.le_behaviors_separator.text()) for x in seq_list]
+        # tiles of a stopped computation
+        if not self.distances_running or run_id != self.distances_run_id:
+            return
+
+        if isinstance(result, Exception):
+            self.stop_distances()
+            QMessageBox.critical(
+                self, "Behatrix", f"Error during the distances computation: {result}"
+            )
+            return
 
-        results = behatrix_functions.needleman_wunsch_identity_seq_list(seq_list)
+        self.distances_tiles_remaining -= 1
+        if not self.distances_tiles_remaining:
+            results = behatrix_functions.distances_results(self.distances_handle)
+            self.stop_distances()
+            self.display_distances_results(self.distances_mode, results)
+
+    def stop_distances(self):
+        """
+        reset the widgets and release the shared memory at the end of the distances computation
+        """
+        self.distances_running = False
+        if self.distances_shared_block is not None:
+            self.distances_shared_block.close()
+            self.distances_shared_block.unlink()
+            self.distances_shared_block = None
+            self.detach_pool_workers(self.distances_handle)
+
+        self.pb_levenshtein.setEnabled(True)
+        self.pb_needleman_wunsch.setEnabled(True)
+        self.statusbar.showMessage("", 0)
+
+    def display_distances_results(self, mode: str, results):
+        """
+        display the distances between behavioral sequences
+        """
+
+        n_sequences = results.shape[0]
+
+        n_pad = int(math.log10(n_sequences)) + 1
 
         # display results
-        out = "Needleman-Wunsch identities:\n"
+        out = f"{mode}:\n"
         # header
         out += "\t{}\n".format(
-            "\t".join([f"seq{x + 1:0{n_pad}}" for x, _ in enumerate(seq_list)])
+            "\t".join([f"seq{x + 1:0{n_pad}}" for x in range(n_sequences)])
         )
         for r in range(results.shape[0]):
             out += f"seq{r + 1:0{n_pad}}\t"
-            out += "\t".join([f"{x:.2f}" for x in results[r, :]]) + "\n"
+            if mode == "Levenshtein distances":
+                out += "\t".join([f"{int(x)}" for x in results[r, :]]) + "\n"
+            else:
+                out += "\t".join([f"{x:.2f}" for x in results[r, :]]) + "\n"
 
         self.pte_distances_results.setPlainText(out)
 
+    def levenshtein_distance(self):
+        """
+        Levenshtein distances between behavioral sequences
+        """
+
+        self.run_distances("Levenshtein distances", "levenshtein")
+
+    def needleman_wunsch_identity(self):
+        """
+        Needleman-Wunsch identities between behavioral sequences
+        """
+
+        self.run_distances("Needleman-Wunsch identities", "needleman_wunsch")
+
     def save_distances_results(self):
         """
         Save distances matrix
@@ -1327,6 +1702,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 
 def main():
+    # command line subcommand (behatrix worker ..., behatrix compare ..., behatrix index ...)
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_SUBCOMMANDS:
+        cli()
+        return
+
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
     app = QApplication(sys.argv)
     app.setApplicationName("Behatrix")
@@ -1337,9 +1717,138 @@ def main():
     sys.exit(app.exec())
 
 
+def compare_cli(argv: list) -> None:
+    """
+    command line of the comparison of 2 groups of sequences: behatrix compare --group1 FILE --group2 FILE
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Behatrix compare",
+        usage="\npython3 -m behatrix compare --group1 FILE --group2 FILE [options]",
+        description=(
+            "Permutations test of the differences of transition probabilities between 2 groups of sequences "
+            "(the group labels are permuted between the sequences)"
+        ),
+    )
+    parser.add_argument(
+        "--group1",
+        action="store",
+        dest="group1",
+        required=True,
+        help="Path of file containing the behavioral sequences of group 1",
+    )
+    parser.add_argument(
+        "--group2",
+        action="store",
+        dest="group2",
+        required=True,
+        help="Path of file containing the behavioral sequences of group 2",
+    )
+    parser.add_argument(
+        "--separator",
+        action="store",
+        dest="separator",
+        default="",
+        help="Separator of behaviors",
+    )
+    parser.add_argument(
+        "-o", "--output", action="store", dest="output", help="Path of output files"
+    )
+    parser.add_argument(
+        "--n-random",
+        action="store",
+        dest="nrandom",
+        help="Number of permutations of the group labels (default: 10000)",
+        type=int,
+        default=10000,
+    )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        dest="seed",
+        help="Seed of the random generator (for reproducible results)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        dest="quiet",
+        default=False,
+        help="Do not print results on terminal",
+    )
+    args = parser.parse_args(argv)
+
+    groups = []
+    for file_name in (args.group1, args.group2):
+        if not os.path.isfile(file_name):
+            print(f"{file_name} is not a file\n")
+            sys.exit(1)
+        with open(file_name) as f_in:
+            groups.append(
+                behatrix_functions.behavioral_sequence_analysis(
+                    f_in.read(), behaviors_separator=args.separator
+                )["sequences"]
+            )
+
+    seed, _ = behatrix_functions.spawn_seeds(args.seed, 0)
+    results = behatrix_functions.group_comparison_test(
+        args.nrandom, groups[0], groups[1], seed=seed
+    )
+
+    output = args.output if args.output else args.group1
+    outputs = (
+        ("Transition probabilities of group 1", "probabilities-1", "probabilities_1"),
+        ("Transition probabilities of group 2", "probabilities-2", "probabilities_2"),
+        ("Differences (group 1 - group 2)", "difference", "difference"),
+        ("P-values of the differences", f"p-values.{args.nrandom}", "p_values"),
+    )
+
+    if not args.quiet:
+        print("\nComparison of 2 groups\n======================")
+        print(f"Sequences of group 1: {len(groups[0])}")
+        print(f"Sequences of group 2: {len(groups[1])}")
+        print(f"Number of permutations: {results['count']}")
+        print(f"Seed: {seed}")
+        for title, _, key in outputs:
+            print(f"\n{title}")
+            print(f"{'-' * len(title)}\n")
+            out = "\t" + "\t".join(results["behaviours"]) + "\n"
+            for r, behaviour in enumerate(results["behaviours"]):
+                out += f"{behaviour}\t"
+                out += "\t".join([f"{x:.3f}" for x in results[key][r, :]]) + "\n"
+            print(out)
+
+    for _, suffix, key in outputs:
+        file_name = f"{output}.comparison.{suffix}.tsv"
+        try:
+            behatrix_functions.save_matrix_tsv(
+                file_name, results[key], results["behaviours"]
+            )
+        except Exception:
+            print(f"Error during creation of file: {file_name}")
+
+
 def cli():
     import argparse
 
+    # distributed permutations test worker
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        behatrix_distributed.worker_cli(sys.argv[2:])
+        return
+
+    # comparison of 2 groups of sequences
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare_cli(sys.argv[2:])
+        return
+
+    # index of sequences for the nearest neighbours queries
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        behatrix_index.index_cli(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         prog="Behatrix",
         usage="\npython3 -m behatrix [options]",
@@ -1385,7 +1894,89 @@ def cli():
         "--n-cpu",
         action="store",
         dest="n_cpu",
-        help="Number of CPU to use for permutations test",
+        help="Number of CPU to use for permutations test and distances",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        dest="seed",
+        help="Seed of the random generator for permutations test (default: random seed)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--alpha",
+        action="store",
+        dest="alpha",
+        help=(
+            "Adaptive permutations test: stop when all p-values are resolved relatively to alpha "
+            "(the n-random value is the maximum number of permutations)"
+        ),
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--confidence",
+        action="store",
+        dest="confidence",
+        help="Confidence level of p-values for the adaptive permutations test (default: 0.99)",
+        type=float,
+        default=0.99,
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        dest="workers",
+        help=(
+            "Distribute the permutations test to remote workers "
+            "(HOST:PORT,HOST:PORT,... see: behatrix worker --help)"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--authkey",
+        action="store",
+        dest="authkey",
+        help="Authentication key of the remote workers (required with --workers, default: BEHATRIX_AUTHKEY environment variable)",
+        default=os.environ.get("BEHATRIX_AUTHKEY", ""),
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store",
+        dest="checkpoint",
+        help=(
+            "Save checkpoints of the permutations test in this file "
+            "(default: OUTPUT.checkpoint.json if --checkpoint-interval or --resume is used)"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        action="store",
+        dest="checkpoint_interval",
+        help=(
+            "Save checkpoints of the permutations test with this minimum delay in seconds between 2 checkpoints "
+            f"(default: {behatrix_functions.CHECKPOINT_INTERVAL} if --checkpoint or --resume is used)"
+        ),
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        help="Resume the permutations test from the checkpoint file",
+    )
+    parser.add_argument(
+        "--histogram-bins",
+        action="store",
+        dest="histogram_bins",
+        help=(
+            "Save the histograms of the permuted transitions numbers with this number of bins "
+            f"in a .npz file (0 for no histogram, default: 0, suggested: {behatrix_functions.HISTOGRAM_BINS})"
+        ),
         type=int,
         default=0,
     )
@@ -1401,6 +1992,12 @@ def cli():
         dest="block_last",
         help="block last behavior during permutations test",
     )
+    parser.add_argument(
+        "--within-sequence",
+        action="store_true",
+        dest="within_sequence",
+        help="permute the behaviors only within their sequence during permutations test",
+    )
     parser.add_argument(
         "--no-repetition",
         action="store_true",
@@ -1415,6 +2012,38 @@ def cli():
         help="n-gram value",
         type=int,
     )
+    parser.add_argument(
+        "--levenshtein",
+        action="store_true",
+        dest="levenshtein",
+        help="Compute the Levenshtein distances between sequences",
+    )
+    parser.add_argument(
+        "--needleman-wunsch",
+        action="store_true",
+        dest="needleman_wunsch",
+        help="Compute the Needleman-Wunsch identities between sequences",
+    )
+    parser.add_argument(
+        "--max-distance",
+        action="store",
+        dest="max_distance",
+        help=(
+            "Only find the pairs of sequences with a Levenshtein distance not greater than this value "
+            "(OUTPUT.levenshtein.pairs.MAX_DISTANCE.tsv, the other distances are not computed)"
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--distances-memmap",
+        action="store_true",
+        dest="distances_memmap",
+        help=(
+            "Store the distances in a memory-mapped file (OUTPUT.levenshtein.npy, OUTPUT.needleman-wunsch.npy) "
+            "instead of the memory (for large numbers of sequences)"
+        ),
+    )
 
     parser.add_argument(
         "-q",
@@ -1639,102 +2268,485 @@ def cli():
             f_out.write((results["behaviours"])[c] + "\t" + row)
             c += 1
 
+    if args.n_cpu:
+        num_proc = args.n_cpu
+    else:
+        num_available_proc = os.cpu_count()
+        if num_available_proc <= 2:
+            num_proc = 1
+        else:
+            num_proc = num_available_proc - 1
+
+    if args.max_distance is not None and args.max_distance < 0:
+        print("The maximum distance must be positive")
+        sys.exit(1)
+
+    # pairs of close sequences (the distances greater than the maximum distance are not computed)
+    if args.levenshtein and args.max_distance is not None:
+        pairs = behatrix_functions.levenshtein_pairs(
+            results["corpus"], args.max_distance, num_proc
+        )
+        n_pad = int(math.log10(max(1, len(results["corpus"])))) + 1
+        out = "sequence 1\tsequence 2\tdistance\n" + "".join(
+            f"seq{i + 1:0{n_pad}}\tseq{j + 1:0{n_pad}}\t{distance}\n"
+            for i, j, distance in pairs
+        )
+        if not args.quiet:
+            title = f"Levenshtein distances not greater than {args.max_distance}"
+            print(f"\n{title}\n{'=' * len(title)}\n")
+            print(out)
+
+        file_name = f"{args.output if args.output else args.sequences}.levenshtein.pairs.{args.max_distance}.tsv"
+        try:
+            with open(file_name, mode="w", encoding="utf-8") as f_out:
+                f_out.write(out)
+        except Exception:
+            print(f"Error during creation of file: {file_name}")
+
+    # distances between sequences
+    for selected, title, metric, suffix, fmt in (
+        (
+            args.levenshtein and args.max_distance is None,
+            "Levenshtein distances",
+            "levenshtein",
+            "levenshtein",
+            "%d",
+        ),
+        (
+            args.needleman_wunsch,
+            "Needleman-Wunsch identities",
+            "needleman_wunsch",
+            "needleman-wunsch",
+            "%.2f",
+        ),
+    ):
+        if not selected:
+            continue
+        # condensed upper triangle of the distances (in memory or memory-mapped)
+        distances = behatrix_functions.pairwise_distances(
+            results["corpus"],
+            metric,
+            num_proc,
+            condensed=True,
+            file_name=f"{args.output if args.output else args.sequences}.{suffix}.npy"
+            if args.distances_memmap
+            else "",
+        )
+        n_sequences = len(results["corpus"])
+        n_pad = int(math.log10(max(1, n_sequences))) + 1
+        labels = [f"seq{x + 1:0{n_pad}}" for x in range(n_sequences)]
+
+        if not args.quiet:
+            print(f"\n{title}\n{'=' * len(title)}\n")
+            print("\t" + "\t".join(labels))
+            for i, label in enumerate(labels):
+                row = behatrix_functions.distances_row(distances, i)
+                print(label + "\t" + "\t".join(fmt % x for x in row.tolist()))
+
+        file_name = f"{args.output if args.output else args.sequences}.{suffix}.tsv"
+        try:
+            behatrix_functions.save_distances_tsv(file_name, distances, labels, fmt=fmt)
+        except Exception:
+            print(f"Error during creation of file: {file_name}")
+
     # check if permutations test required
     if nrandom:
-        if args.n_cpu:
-            num_proc = args.n_cpu
+        if args.histogram_bins < 0:
+            print("The number of bins of the histograms must be positive")
+            sys.exit(1)
+
+        if args.ngram > 1:
+            # transitions between successive n-grams (only the observed transitions are tested)
+            if args.histogram_bins:
+                print("The histograms are not available for n-gram transitions")
+                sys.exit(1)
+            try:
+                ngram_keys, tested_matrix = behatrix_functions.ngram_transitions(
+                    results["corpus"], args.ngram
+                )
+            except ValueError as exc:
+                print(exc)
+                sys.exit(1)
         else:
-            num_available_proc = os.cpu_count()
-            if num_available_proc <= 2:
-                num_proc = 1
-            else:
-                num_proc = num_available_proc - 1
+            tested_matrix = observed_matrix
 
-        permutations_results = np.zeros(
-            (len(results["behaviours"]), len(results["behaviours"]))
+        permutations_results = behatrix_functions.permutations_counters(
+            len(results["behaviours"]), args.histogram_bins, tested_matrix.shape
         )
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            lst = []
-            n_required_randomizations = 0
-            for i in range(num_proc):
-                if i < num_proc - 1:
-                    n_random_by_proc = nrandom // num_proc
-                else:
-                    n_random_by_proc = nrandom - n_required_randomizations
+        nb_randomization_done = 0
+        chunks_done = 0
+        next_check = behatrix_functions.ADAPTIVE_ROUND_SIZE
 
-                lst.append(
-                    executor.submit(
-                        behatrix_functions.permutations_test,
-                        n_random_by_proc,
-                        results["sequences"],
-                        results["behaviours"],
+        seed, _ = behatrix_functions.spawn_seeds(args.seed, 0)
+
+        # the checkpoints are saved only if requested
+        checkpoints = bool(
+            args.checkpoint or args.checkpoint_interval is not None or args.resume
+        )
+        checkpoint_file = (
+            args.checkpoint
+            if args.checkpoint
+            else f"{args.output if args.output else args.sequences}.checkpoint.json"
+        )
+        checkpoint_interval = (
+            args.checkpoint_interval
+            if args.checkpoint_interval is not None
+            else behatrix_functions.CHECKPOINT_INTERVAL
+        )
+        fingerprint = behatrix_functions.permutations_fingerprint(
+            results["corpus"],
+            exclusion_list,
+            block_first,
+            block_last,
+            args.no_repetition,
+            args.histogram_bins,
+            args.ngram,
+            args.within_sequence,
+        )
+
+        if args.resume:
+            result = behatrix_functions.load_checkpoint(checkpoint_file, fingerprint)
+            if result["error_code"]:
+                print(f"{result['message']}\nThe permutations test cannot be resumed")
+                sys.exit(1)
+            checkpoint = result["checkpoint"]
+            if args.seed is not None and seed != checkpoint["seed"]:
+                print(
+                    f"The seed of the checkpoint ({checkpoint['seed']}) is different\n"
+                    "The permutations test cannot be resumed"
+                )
+                sys.exit(1)
+            seed = checkpoint["seed"]
+            permutations_results = checkpoint["results"]
+            nb_randomization_done = checkpoint["count"]
+            chunks_done = checkpoint["chunks"]
+            next_check = checkpoint["next_check"]
+
+        def checkpoint_state() -> dict:
+            return {
+                "fingerprint": fingerprint,
+                "seed": seed,
+                "chunks": chunks_done,
+                "count": nb_randomization_done,
+                "results": permutations_results,
+                "next_check": next_check,
+            }
+
+        if not args.quiet:
+            print("\nPermutations test\n=================")
+
+            print(f"\nNumber of required permutations: {nrandom}")
+            print(f"Seed: {seed}")
+            if args.resume:
+                print(f"Resumed from checkpoint: {nb_randomization_done} permutations")
+
+        if args.workers:
+            if not args.authkey:
+                print(
+                    "An authentication key (--authkey or BEHATRIX_AUTHKEY environment variable) "
+                    "is required to distribute the permutations test"
+                )
+                sys.exit(1)
+            # the corpus and the observed matrix are pushed to the remote workers
+            shared_block = None
+            try:
+                executor = behatrix_distributed.Coordinator(
+                    [
+                        behatrix_distributed.parse_address(address)
+                        for address in args.workers.split(",")
+                    ],
+                    behatrix_distributed.permutations_data(
+                        results["corpus"],
+                        tested_matrix,
                         exclusion_list,
                         block_first,
                         block_last,
-                        observed_matrix,
                         args.no_repetition,
-                    )
+                        args.histogram_bins,
+                        args.ngram,
+                        args.within_sequence,
+                    ),
+                    args.authkey,
                 )
-
-                n_required_randomizations += n_random_by_proc
-
+            except (ValueError, ConnectionError) as exc:
+                print(f"{exc}\nThe permutations test cannot be distributed")
+                sys.exit(1)
+            task = behatrix_functions.shared_permutations_test
+            max_pending = 2 * executor.capacity
             if not args.quiet:
-                print("\nPermutations test\n=================")
-
-                print(f"\nNumber of required permutations: {n_required_randomizations}")
+                print(f"Workers: {executor.workers} ({executor.capacity} CPU)")
+        else:
+            # the corpus and the observed matrix are shared with the processes
+            shared_block, handle = behatrix_functions.share_permutations_data(
+                results["corpus"],
+                tested_matrix,
+                exclusion_list,
+                block_first,
+                block_last,
+                args.no_repetition,
+                args.histogram_bins,
+                args.ngram,
+                args.within_sequence,
+            )
+            task = functools.partial(
+                behatrix_functions.shared_permutations_test, handle=handle
+            )
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_proc)
+            max_pending = 2 * num_proc
 
-            nb_randomization_done = 0
+        # the permutations are split in small chunks distributed dynamically to the processes
+        # (the chunks done before the checkpoint are skipped)
+        chunks = behatrix_functions.permutations_chunks(
+            max(0, nrandom - nb_randomization_done), results["corpus"].n_events
+        )
+        if (
+            args.alpha is not None
+            and nb_randomization_done
+            and behatrix_functions.resolved_cells(
+                permutations_results["ge"],
+                nb_randomization_done,
+                args.alpha,
+                args.confidence,
+            ).all()
+        ):
+            chunks = []
+
+        exact_size = behatrix_functions.exact_permutations_size(
+            nrandom,
+            results["corpus"],
+            exclusion_list,
+            block_first,
+            block_last,
+            args.no_repetition,
+            args.within_sequence,
+        )
+        if exact_size is not None:
+            # small permutations space: one task enumerates all the distinct permutations
+            chunks = [] if nb_randomization_done else [nrandom]
+            if not args.quiet:
+                print(f"Exact test: {exact_size} distinct permutations")
 
-            for x in lst:
-                nb_randomization_done += x.result()[0]
-                permutations_results += x.result()[1]
+        try:
+            checkpoint_time = time.monotonic()
+            with executor:
+                with contextlib.closing(
+                    behatrix_functions.scheduled_permutations(
+                        executor,
+                        task,
+                        chunks,
+                        seed,
+                        max_pending=max_pending,
+                        start=chunks_done,
+                    )
+                ) as chunks_results:
+                    for chunk_index, (n_permut, chunk_results) in chunks_results:
+                        nb_randomization_done += n_permut
+                        behatrix_functions.merge_permutations_counters(
+                            permutations_results, chunk_results
+                        )
+                        chunks_done = chunk_index + 1
+
+                        if (
+                            checkpoints
+                            and time.monotonic() - checkpoint_time > checkpoint_interval
+                        ):
+                            behatrix_functions.save_checkpoint(
+                                checkpoint_file, checkpoint_state()
+                            )
+                            checkpoint_time = time.monotonic()
+
+                        # adaptive mode: check if all p-values are resolved
+                        if args.alpha is not None and (
+                            nb_randomization_done >= next_check
+                            or nb_randomization_done == nrandom
+                        ):
+                            resolved = behatrix_functions.resolved_cells(
+                                permutations_results["ge"],
+                                nb_randomization_done,
+                                args.alpha,
+                                args.confidence,
+                            )
+                            if resolved.all():
+                                break
+                            next_check = (
+                                nb_randomization_done
+                                + behatrix_functions.ADAPTIVE_ROUND_SIZE
+                            )
+        finally:
+            if shared_block is not None:
+                shared_block.close()
+                shared_block.unlink()
+
+        if checkpoints:
+            behatrix_functions.save_checkpoint(checkpoint_file, checkpoint_state())
 
         if not args.quiet:
             print(f"Number of permutations done: {nb_randomization_done}")
 
-        permutations_test_matrix = permutations_results / nb_randomization_done
+        statistics = behatrix_functions.permutations_statistics(
+            permutations_results, nb_randomization_done, tested_matrix
+        )
+        permutations_test_matrix = statistics["p_upper"]
 
-        if not args.quiet:
-            print("\nP-value matrix")
-            print("--------------\n")
-            behaviours_str = "\t".join(list(results["behaviours"]))
-            out = f"\t{behaviours_str}\n"
-            for r in range(permutations_test_matrix.shape[0]):
-                out += f"{results['behaviours'][r]}\t"
+        if args.ngram > 1:
+            # sparse results: one row by observed n-gram transition
+            labels = [
+                (args.separator.join(ngram1), args.separator.join(ngram2))
+                for ngram1, ngram2 in behatrix_functions.decode_ngram_transitions(
+                    ngram_keys, results["behaviours"], args.ngram
+                )
+            ]
+            columns = ["observed", "p-value", "p-value lower", "z-score"]
+            if args.alpha is not None:
+                columns.append("resolved")
+                resolved = behatrix_functions.resolved_cells(
+                    permutations_results["ge"],
+                    nb_randomization_done,
+                    args.alpha,
+                    args.confidence,
+                )
+            out = (
+                f"{args.ngram}-gram\tnext {args.ngram}-gram\t"
+                + "\t".join(columns)
+                + "\n"
+            )
+            for i, (ngram1, ngram2) in enumerate(labels):
                 out += (
-                    "\t".join([f"{x:.3f}" for x in permutations_test_matrix[r, :]])
-                    + "\n"
+                    f"{ngram1}\t{ngram2}\t{tested_matrix[i]}\t{statistics['p_upper'][i]:.6f}\t"
+                    f"{statistics['p_lower'][i]:.6f}\t{statistics['z_scores'][i]:.6f}"
                 )
+                if args.alpha is not None:
+                    out += f"\t{'resolved' if resolved[i] else 'undecided'}"
+                out += "\n"
 
-            print(out)
+            if not args.quiet:
+                title = f"{args.ngram}-gram transitions"
+                print(f"\n{title}\n{'-' * len(title)}\n")
+                print(out)
+                if args.alpha is not None:
+                    print(
+                        f"Resolved p-values (alpha={args.alpha}): {int(resolved.sum())} / {resolved.size}\n"
+                    )
 
-        file_name = (
-            f"{args.output if args.output else args.sequences}.p-values.{nrandom}.tsv"
-        )
+            file_name = f"{args.output if args.output else args.sequences}.ngram-transitions.{nrandom}.tsv"
+            try:
+                with open(file_name, mode="w", encoding="utf-8") as f_out:
+                    f_out.write(out)
+            except Exception:
+                print(f"Error during creation of file: {file_name}")
+
+            # upper-tail p-values of the n-gram transitions for the flow diagram
+            permutations_test_matrix = behatrix_functions.ngram_significativity(
+                ngram_keys,
+                statistics["p_upper"],
+                results["behaviours"],
+                args.ngram,
+                args.separator,
+            )
 
-        np.savetxt(
-            file_name,
-            permutations_results / nb_randomization_done,
-            fmt="%f",
-            delimiter="\t",
-        )
+        else:
+            if not args.quiet:
+                for title, matrix in (
+                    ("P-value matrix", statistics["p_upper"]),
+                    ("Lower-tail p-value matrix", statistics["p_lower"]),
+                    ("Z-score matrix", statistics["z_scores"]),
+                ):
+                    print(f"\n{title}")
+                    print(f"{'-' * len(title)}\n")
+                    behaviours_str = "\t".join(list(results["behaviours"]))
+                    out = f"\t{behaviours_str}\n"
+                    for r in range(matrix.shape[0]):
+                        out += f"{results['behaviours'][r]}\t"
+                        out += "\t".join([f"{x:.3f}" for x in matrix[r, :]]) + "\n"
 
-        # add colum and row headers
-        try:
-            with open(
+                    print(out)
+
+            file_name = f"{args.output if args.output else args.sequences}.p-values.{nrandom}.tsv"
+
+            np.savetxt(
                 file_name,
-                mode="r",
-                encoding="utf-8",
-            ) as f:
-                rows = f.readlines()
-            with open(file_name, mode="w", encoding="utf-8") as f:
-                f.write("\t" + "\t".join(list(results["behaviours"])) + "\n")
-                c = 0
-                for row in rows:
-                    f.write((results["behaviours"])[c] + "\t" + row)
-                    c += 1
-        except Exception:
-            print(f"Error during creation of file: {file_name}")
+                permutations_test_matrix,
+                fmt="%f",
+                delimiter="\t",
+            )
+
+            # add colum and row headers
+            try:
+                with open(
+                    file_name,
+                    mode="r",
+                    encoding="utf-8",
+                ) as f:
+                    rows = f.readlines()
+                with open(file_name, mode="w", encoding="utf-8") as f:
+                    f.write("\t" + "\t".join(list(results["behaviours"])) + "\n")
+                    c = 0
+                    for row in rows:
+                        f.write((results["behaviours"])[c] + "\t" + row)
+                        c += 1
+            except Exception:
+                print(f"Error during creation of file: {file_name}")
+
+            # lower-tail p-values and z-scores
+            for suffix, matrix in (
+                ("p-values-lower", statistics["p_lower"]),
+                ("z-scores", statistics["z_scores"]),
+            ):
+                file_name = f"{args.output if args.output else args.sequences}.{suffix}.{nrandom}.tsv"
+                try:
+                    behatrix_functions.save_matrix_tsv(
+                        file_name, matrix, results["behaviours"]
+                    )
+                except Exception:
+                    print(f"Error during creation of file: {file_name}")
+
+            if args.alpha is not None:
+                resolved = behatrix_functions.resolved_cells(
+                    permutations_results["ge"],
+                    nb_randomization_done,
+                    args.alpha,
+                    args.confidence,
+                )
+                if not args.quiet:
+                    print(
+                        f"Resolved p-values (alpha={args.alpha}): {int(resolved.sum())} / {resolved.size}\n"
+                    )
+
+                file_name = f"{args.output if args.output else args.sequences}.resolved.{nrandom}.tsv"
+                try:
+                    behatrix_functions.save_matrix_tsv(
+                        file_name,
+                        np.where(resolved, "resolved", "undecided"),
+                        results["behaviours"],
+                        fmt="%s",
+                    )
+                except Exception:
+                    print(f"Error during creation of file: {file_name}")
+
+        if args.histogram_bins:
+            file_name = f"{args.output if args.output else args.sequences}.histograms.{nrandom}.npz"
+            try:
+                behatrix_functions.save_histograms(
+                    file_name,
+                    permutations_results,
+                    nb_randomization_done,
+                    results["corpus"],
+                    observed_matrix,
+                )
+            except Exception:
+                print(f"Error during creation of file: {file_name}")
+
+    # transitions of the flow diagrams
+    if args.ngram > 1:
+        diagram_data = behatrix_functions.ngram_diagram_data(results, args.separator)
+    else:
+        diagram_data = {
+            "unique_transitions": results["transitions"],
+            "nodes": results["nodes"],
+            "tot_nodes": results["tot_nodes"],
+            "tot_trans": results["tot_trans"],
+            "tot_trans_after_node": results["tot_trans_after_node"],
+        }
 
     # create dot script
     if args.observed_graph:
@@ -1742,15 +2754,11 @@ def cli():
             behatrix_functions.draw_diagram(
                 cutoff_all=args.cutoff_all,
                 cutoff_behavior=args.cutoff_behavior,
-                unique_transitions=results["transitions"],
-                nodes=results["nodes"],
                 starting_nodes=[],
                 edge_label=args.edge_label,
                 decimals_number=args.decimal_number,
-                tot_nodes=results["tot_nodes"],
-                tot_trans=results["tot_trans"],
-                tot_trans_after_node=results["tot_trans_after_node"],
                 behaviors=results["behaviours"],
+                **diagram_data,
                 legend=args.legend,
             )
         )
@@ -1795,16 +2803,12 @@ def cli():
                 behatrix_functions.draw_diagram(
                     cutoff_all=args.cutoff_all,
                     cutoff_behavior=args.cutoff_behavior,
-                    unique_transitions=results["transitions"],
-                    nodes=results["nodes"],
                     starting_nodes=[],
                     edge_label=args.edge_label,
                     decimals_number=args.decimal_number,
-                    tot_nodes=results["tot_nodes"],
-                    tot_trans=results["tot_trans"],
-                    tot_trans_after_node=results["tot_trans_after_node"],
                     significativity=permutations_test_matrix,
                     behaviors=results["behaviours"],
+                    **diagram_data,
                     legend=args.legend,
                 )
             )
@@ -0,0 +1,400 @@
+"""
+Behatrix
+Behavioral sequences analysis with permutations test
+
+Copyright 2017-2026 Olivier Friard
+
+This file is part of Behatrix.
+
+  Behatrix is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 3 of the License, or
+  any later version.
+
+  Behatrix is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not see <http://www.gnu.org/licenses/>.
+
+
+Index of behavioral sequences for the nearest neighbours queries (Levenshtein distance)
+
+The index is a BK-tree: each node is a sequence and its children are indexed by their distance
+to the node. The triangle inequality limits the search to the children whose distance to the node
+is close to the distance between the query and the node, so that only a fraction of the distances
+are computed. The index is saved in a JSON file and new sequences can be added to a saved index.
+
+Command line (see index_cli):
+
+    behatrix index build --index INDEX --sequences FILE
+    behatrix index add --index INDEX --sequences FILE
+    behatrix index query --index INDEX --sequences FILE [--k K | --max-distance D]
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+
+from . import behatrix_functions
+
+# identification of the file format of the index
+INDEX_FORMAT = "behatrix-index"
+INDEX_VERSION = 1
+
+
+class SequencesIndex:
+    """
+    BK-tree of behavioral sequences for the Levenshtein distance
+
+    The nodes are numbered in the order of insertion (node 0 is the root) and identify the sequences
+    in the results of the queries.
+    """
+
+    def __init__(self, sequences: list | None = None, labels: list | None = None):
+        """
+        create an index of the sequences
+
+        Args:
+            sequences (list): list of sequences (list of behaviors)
+            labels (list): labels of the sequences (default: seq1, seq2, ...)
+        """
+        self.sequences: list = []
+        self.labels: list = []
+        # children of each node: {distance: node}
+        self.children: list = []
+        self.extend(sequences or [], labels)
+
+    def __len__(self) -> int:
+        return len(self.sequences)
+
+    def insert(self, sequence: list, label: str = "") -> int:
+        """
+        add a sequence to the index
+
+        Args:
+            sequence (list): sequence (list of behaviors)
+            label (str): label of the sequence (default: seq followed by the number of the sequence)
+
+        Returns:
+            int: node of the sequence
+        """
+        new_node = len(self.sequences)
+        self.sequences.append(list(sequence))
+        self.labels.append(label if label else f"seq{new_node + 1}")
+        self.children.append({})
+        if not new_node:
+            return new_node
+
+        node = 0
+        while True:
+            distance = behatrix_functions.levenshtein_distance(
+                sequence, self.sequences[node]
+            )
+            if distance not in self.children[node]:
+                self.children[node][distance] = new_node
+                return new_node
+            node = self.children[node][distance]
+
+    def extend(self, sequences: list, labels: list | None = None) -> list:
+        """
+        add sequences to the index
+
+        Returns:
+            list: nodes of the sequences
+        """
+        if labels is None:
+            labels = [""] * len(sequences)
+        return [
+            self.insert(sequence, label) for sequence, label in zip(sequences, labels)
+        ]
+
+    def distance(self, query: list, peq: dict, node: int, max_distance: int) -> int:
+        """
+        Levenshtein distance between the query and the sequence of the node if it is not greater than max_distance
+        (see behatrix_functions.levenshtein_distance_bounded), otherwise max_distance + 1
+        """
+        return behatrix_functions.levenshtein_distance_bounded(
+            query, self.sequences[node], max_distance, peq
+        )
+
+    def range_query(self, query: list, max_distance: int) -> list:
+        """
+        find the sequences at a Levenshtein distance not greater than max_distance from the query
+
+        The distance to a node is only computed up to max_distance plus the greatest distance to its children:
+        beyond this limit none of its descendants can be in the range.
+
+        Args:
+            query (list): sequence (list of behaviors)
+            max_distance (int): maximum distance
+
+        Returns:
+            list: (node, distance) tuples sorted by distance and node
+        """
+        if not self.sequences:
+            return []
+        peq = behatrix_functions.levenshtein_pattern(query)
+        results = []
+        nodes = [0]
+        while nodes:
+            node = nodes.pop()
+            children = self.children[node]
+            limit = max_distance + max(children, default=0)
+            distance = self.distance(query, peq, node, limit)
+            if distance <= max_distance:
+                results.append((node, distance))
+            if distance > limit:
+                continue
+            nodes.extend(
+                child
+                for child_distance, child in children.items()
+                if abs(child_distance - distance) <= max_distance
+            )
+        return sorted(results, key=lambda x: (x[1], x[0]))
+
+    def nearest(self, query: list, k: int = 1) -> list:
+        """
+        find the k nearest sequences of the query (Levenshtein distance)
+
+        The nodes are visited by increasing lower bound of their distance to the query (triangle inequality)
+        and the search stops when this bound is greater than the distance of the k-th nearest sequence found.
+        The ties are resolved by the order of insertion.
+
+        Args:
+            query (list): sequence (list of behaviors)
+            k (int): number of neighbours
+
+        Returns:
+            list: (node, distance) tuples sorted by distance and node
+        """
+        if not self.sequences or k < 1:
+            return []
+        peq = behatrix_functions.levenshtein_pattern(query)
+        # k best (distance, node) found (max heap)
+        best: list = []
+        # nodes to visit (lower bound of the distance, node)
+        candidates = [(0, 0)]
+        while candidates:
+            lower_bound, node = heapq.heappop(candidates)
+            radius = -best[0][0] if len(best) == k else None
+            if radius is not None and lower_bound > radius:
+                break
+            children = self.children[node]
+            # the distance is exact up to the limit (no descendant can be closer than radius beyond it)
+            limit = max(len(query), len(self.sequences[node]))
+            if radius is not None:
+                limit = min(limit, radius + max(children, default=0))
+            distance = self.distance(query, peq, node, limit)
+
+            if len(best) < k:
+                heapq.heappush(best, (-distance, -node))
+            elif (distance, node) < (-best[0][0], -best[0][1]):
+                heapq.heapreplace(best, (-distance, -node))
+            if distance > limit:
+                continue
+
+            radius = -best[0][0] if len(best) == k else None
+            for child_distance, child in children.items():
+                child_bound = abs(child_distance - distance)
+                if radius is None or child_bound <= radius:
+                    heapq.heappush(candidates, (child_bound, child))
+
+        return sorted(
+            (
+                (-negative_node, -negative_distance)
+                for negative_distance, negative_node in best
+            ),
+            key=lambda x: (x[1], x[0]),
+        )
+
+    def save(self, file_name: str) -> None:
+        """
+        save the index in a JSON file (written in a temporary file renamed at the end)
+        """
+        data = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "sequences": self.sequences,
+            "labels": self.labels,
+            "children": [sorted(children.items()) for children in self.children],
+        }
+        tmp_file_name = f"{file_name}.tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f_out:
+            json.dump(data, f_out, separators=(",", ":"))
+        os.replace(tmp_file_name, file_name)
+
+    @classmethod
+    def load(cls, file_name: str) -> "SequencesIndex":
+        """
+        load an index saved by SequencesIndex.save
+
+        Raises:
+            ValueError: the file does not contain a Behatrix index
+        """
+        with open(file_name, encoding="utf-8") as f_in:
+            try:
+                data = json.load(f_in)
+            except json.JSONDecodeError:
+                data = {}
+        if not isinstance(data, dict) or data.get("format") != INDEX_FORMAT:
+            raise ValueError(f"{file_name} is not a Behatrix index")
+        if data["version"] > INDEX_VERSION:
+            raise ValueError(
+                f"The index {file_name} was saved by a more recent version of Behatrix"
+            )
+        index = cls()
+        index.sequences = data["sequences"]
+        index.labels = data["labels"]
+        index.children = [
+            {distance: child for distance, child in children}
+            for children in data["children"]
+        ]
+        return index
+
+
+def read_sequences(file_name: str, separator: str = "") -> list:
+    """
+    read the behavioral sequences of a file (see behatrix_functions.behavioral_sequence_analysis)
+    """
+    if not os.path.isfile(file_name):
+        print(f"{file_name} is not a file\n")
+        sys.exit(1)
+    with open(file_name) as f_in:
+        return behatrix_functions.behavioral_sequence_analysis(
+            f_in.read(), behaviors_separator=separator
+        )["sequences"]
+
+
+def load_index(file_name: str) -> SequencesIndex:
+    """
+    load an index or exit with an error message
+    """
+    try:
+        return SequencesIndex.load(file_name)
+    except FileNotFoundError:
+        print(f"{file_name} is not a file\n")
+    except ValueError as exc:
+        print(f"{exc}\n")
+    sys.exit(1)
+
+
+def index_cli(argv: list) -> None:
+    """
+    command line of the index of sequences: behatrix index build|add|query --index INDEX --sequences FILE
+    """
+    parser = argparse.ArgumentParser(
+        prog="Behatrix index",
+        usage="\npython3 -m behatrix index {build,add,query} --index INDEX --sequences FILE [options]",
+        description="Index of behavioral sequences for the nearest neighbours queries (Levenshtein distance)",
+    )
+    parser.add_argument(
+        "action",
+        choices=("build", "add", "query"),
+        help=(
+            "build: create an index of the sequences, add: add the sequences to an index, "
+            "query: find the nearest sequences of the index for each sequence"
+        ),
+    )
+    parser.add_argument(
+        "--index",
+        action="store",
+        dest="index",
+        required=True,
+        help="Path of the index file",
+    )
+    parser.add_argument(
+        "-s",
+        "--sequences",
+        action="store",
+        dest="sequences",
+        required=True,
+        help="Path of file containing behavioral sequences",
+    )
+    parser.add_argument(
+        "--separator",
+        action="store",
+        dest="separator",
+        default="",
+        help="Separator of behaviors",
+    )
+    parser.add_argument(
+        "-k",
+        action="store",
+        dest="k",
+        help="Number of nearest sequences to find for each sequence (query, default: 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--max-distance",
+        action="store",
+        dest="max_distance",
+        help="Find all the sequences with a distance not greater than this value instead of the k nearest (query)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        action="store",
+        dest="output",
+        help="Path of output file (query, default: SEQUENCES.neighbours.tsv)",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        dest="quiet",
+        default=False,
+        help="Do not print results on terminal",
+    )
+    args = parser.parse_args(argv)
+
+    if args.k < 1:
+        parser.error("The number of nearest sequences must be positive")
+    if args.max_distance is not None and args.max_distance < 0:
+        parser.error("The maximum distance must be positive")
+
+    sequences = read_sequences(args.sequences, args.separator)
+
+    if args.action in ("build", "add"):
+        index = SequencesIndex() if args.action == "build" else load_index(args.index)
+        index.extend(sequences)
+        try:
+            index.save(args.index)
+        except Exception:
+            print(f"Error during creation of file: {args.index}")
+            sys.exit(1)
+        if not args.quiet:
+            print(f"{len(sequences)} sequences added to the index {args.index}")
+            print(f"Number of sequences in the index: {len(index)}")
+        return
+
+    index = load_index(args.index)
+    out = "query\tsequence\tdistance\n"
+    for n, query in enumerate(sequences, start=1):
+        if args.max_distance is None:
+            neighbours = index.nearest(query, args.k)
+        else:
+            neighbours = index.range_query(query, args.max_distance)
+        out += "".join(
+            f"query{n}\t{index.labels[node]}\t{distance}\n"
+            for node, distance in neighbours
+        )
+
+    if not args.quiet:
+        title = "Nearest sequences of the index"
+        print(f"\n{title}\n{'=' * len(title)}\n")
+        print(out)
+
+    file_name = args.output if args.output else f"{args.sequences}.neighbours.tsv"
+    try:
+        with open(file_name, mode="w", encoding="utf-8") as f_out:
+            f_out.write(out)
+    except Exception:
+        print(f"Error during creation of file: {file_name}")
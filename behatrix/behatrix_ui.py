@@ -3,7 +3,7 @@
 ################################################################################
 ## Form generated from reading UI file 'behatrix.ui'
 ##
-## Created by: Qt User Interface Compiler version 6.6.3
+## Created by: Qt User Interface Compiler version 6.8.0
 ##
 ## WARNING! All changes made in this file will be lost when recompiling UI file!
 ################################################################################
@@ -19,10 +19,10 @@ from PySide6.QtGui import (QAction, QBrush, QColor, QConicalGradient,
 from PySide6.QtWidgets import (QApplication, QButtonGroup, QCheckBox, QComboBox,
     QDoubleSpinBox, QHBoxLayout, QHeaderView, QLabel,
     QLineEdit, QMainWindow, QMenu, QMenuBar,
-    QPlainTextEdit, QPushButton, QRadioButton, QSizePolicy,
-    QSpacerItem, QSpinBox, QSplitter, QStatusBar,
-    QTabWidget, QTableWidget, QTableWidgetItem, QVBoxLayout,
-    QWidget)
+    QPlainTextEdit, QProgressBar, QPushButton, QRadioButton,
+    QSizePolicy, QSpacerItem, QSpinBox, QSplitter,
+    QStatusBar, QTabWidget, QTableWidget, QTableWidgetItem,
+    QVBoxLayout, QWidget)
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -472,6 +472,11 @@ class Ui_MainWindow(object):
 
         self.verticalLayout.addWidget(self.cb_block_last_behavior)
 
+        self.cb_within_sequence = QCheckBox(self.tab_randomization)
+        self.cb_within_sequence.setObjectName(u"cb_within_sequence")
+
+        self.verticalLayout.addWidget(self.cb_within_sequence)
+
         self.verticalSpacer_2 = QSpacerItem(20, 40, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
 
         self.verticalLayout.addItem(self.verticalSpacer_2)
@@ -510,6 +515,16 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout_3.addWidget(self.label_5)
 
+        self.label_20 = QLabel(self.tab_randomization)
+        self.label_20.setObjectName(u"label_20")
+
+        self.horizontalLayout_3.addWidget(self.label_20)
+
+        self.le_seed = QLineEdit(self.tab_randomization)
+        self.le_seed.setObjectName(u"le_seed")
+
+        self.horizontalLayout_3.addWidget(self.le_seed)
+
         self.horizontalSpacer_4 = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
 
         self.horizontalLayout_3.addItem(self.horizontalSpacer_4)
@@ -524,6 +539,18 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout_7.addWidget(self.pb_run_permutations_test)
 
+        self.pb_cancel_permutations_test = QPushButton(self.tab_randomization)
+        self.pb_cancel_permutations_test.setObjectName(u"pb_cancel_permutations_test")
+        self.pb_cancel_permutations_test.setEnabled(False)
+
+        self.horizontalLayout_7.addWidget(self.pb_cancel_permutations_test)
+
+        self.progress_permutations_test = QProgressBar(self.tab_randomization)
+        self.progress_permutations_test.setObjectName(u"progress_permutations_test")
+        self.progress_permutations_test.setValue(0)
+
+        self.horizontalLayout_7.addWidget(self.progress_permutations_test)
+
         self.horizontalSpacer_3 = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
 
         self.horizontalLayout_7.addItem(self.horizontalSpacer_3)
@@ -531,10 +558,27 @@ class Ui_MainWindow(object):
 
         self.verticalLayout_6.addLayout(self.horizontalLayout_7)
 
+        self.horizontalLayout_23 = QHBoxLayout()
+        self.horizontalLayout_23.setObjectName(u"horizontalLayout_23")
         self.label_15 = QLabel(self.tab_randomization)
         self.label_15.setObjectName(u"label_15")
 
-        self.verticalLayout_6.addWidget(self.label_15)
+        self.horizontalLayout_23.addWidget(self.label_15)
+
+        self.comb_permutations_output = QComboBox(self.tab_randomization)
+        self.comb_permutations_output.addItem("")
+        self.comb_permutations_output.addItem("")
+        self.comb_permutations_output.addItem("")
+        self.comb_permutations_output.setObjectName(u"comb_permutations_output")
+
+        self.horizontalLayout_23.addWidget(self.comb_permutations_output)
+
+        self.horizontalSpacer_16 = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
+
+        self.horizontalLayout_23.addItem(self.horizontalSpacer_16)
+
+
+        self.verticalLayout_6.addLayout(self.horizontalLayout_23)
 
         self.tw_random = QTableWidget(self.tab_randomization)
         self.tw_random.setObjectName(u"tw_random")
@@ -694,12 +738,26 @@ class Ui_MainWindow(object):
         self.pb_clear_excluded_transitions.setText(QCoreApplication.translate("MainWindow", u"Clear excluded transitions", None))
         self.cb_block_first_behavior.setText(QCoreApplication.translate("MainWindow", u"Block first behavior", None))
         self.cb_block_last_behavior.setText(QCoreApplication.translate("MainWindow", u"Block last behavior", None))
+#if QT_CONFIG(tooltip)
+        self.cb_within_sequence.setToolTip(QCoreApplication.translate("MainWindow", u"Permute the behaviors only within their sequence", None))
+#endif // QT_CONFIG(tooltip)
+        self.cb_within_sequence.setText(QCoreApplication.translate("MainWindow", u"Permute within sequence", None))
         self.label.setText(QCoreApplication.translate("MainWindow", u"Number of permutations", None))
         self.leNumberRandomizations.setText(QCoreApplication.translate("MainWindow", u"100", None))
         self.label_3.setText(QCoreApplication.translate("MainWindow", u"Number of cores to use", None))
         self.label_5.setText(QCoreApplication.translate("MainWindow", u" (default: total number of cores -1)", None))
+        self.label_20.setText(QCoreApplication.translate("MainWindow", u"Seed", None))
+#if QT_CONFIG(tooltip)
+        self.le_seed.setToolTip(QCoreApplication.translate("MainWindow", u"Seed of the random generator (leave empty for a random seed)", None))
+#endif // QT_CONFIG(tooltip)
+        self.le_seed.setPlaceholderText(QCoreApplication.translate("MainWindow", u"random", None))
         self.pb_run_permutations_test.setText(QCoreApplication.translate("MainWindow", u"Run random permutations test", None))
-        self.label_15.setText(QCoreApplication.translate("MainWindow", u"P-value matrix", None))
+        self.pb_cancel_permutations_test.setText(QCoreApplication.translate("MainWindow", u"Cancel", None))
+        self.label_15.setText(QCoreApplication.translate("MainWindow", u"Results", None))
+        self.comb_permutations_output.setItemText(0, QCoreApplication.translate("MainWindow", u"Upper-tail p-values (permuted >= observed)", None))
+        self.comb_permutations_output.setItemText(1, QCoreApplication.translate("MainWindow", u"Lower-tail p-values (permuted <= observed)", None))
+        self.comb_permutations_output.setItemText(2, QCoreApplication.translate("MainWindow", u"Z-scores", None))
+
         self.pb_save_random.setText(QCoreApplication.translate("MainWindow", u"Save significativity matrix", None))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_randomization), QCoreApplication.translate("MainWindow", u"Random permutations test", None))
         self.pb_levenshtein.setText(QCoreApplication.translate("MainWindow", u"Levenshtein distances", None))
@@ -0,0 +1,6 @@
+"""
+Behatrix
+Behavioral sequences analysis with permutations test
+
+Benchmarks (run from the root of the repository, e.g. python3 -m benchmarks.bench_suite)
+"""
@@ -0,0 +1,115 @@
+"""
+Behatrix
+Behavioral sequences analysis with permutations test
+
+Microbenchmark of the memory used by the permutations test
+
+For each size of alphabet the permutations test is run on a random corpus and the
+peak of memory traced by tracemalloc during the test, this peak divided by the number of permutations
+of a batch (memory footprint of a permutation in the reused buffers, not a number of allocations)
+and the time per permutation are reported.
+
+Usage (from the root of the repository):
+    python3 -m benchmarks.bench_permutations_allocations [--events N] [--permutations N] [--behaviours 5,50,200]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from behatrix import behatrix_functions
+
+
+def random_corpus(
+    n_behaviours: int, n_events: int, n_sequences: int, rng
+) -> behatrix_functions.Corpus:
+    """
+    random corpus of n_sequences sequences of n_events behaviors in total
+    """
+    behaviours = [f"b{i}" for i in range(n_behaviours)]
+    codes = rng.integers(0, n_behaviours, n_events).astype(
+        behatrix_functions.code_dtype(n_behaviours)
+    )
+    offsets = np.linspace(0, n_events, n_sequences + 1).astype(np.int64)
+    return behatrix_functions.Corpus(codes, offsets, behaviours)
+
+
+def bench(
+    n_behaviours: int, n_events: int, n_permutations: int, exclusions: bool
+) -> dict:
+    """
+    run the permutations test and measure the peak of memory and the time per permutation
+    """
+    rng = np.random.default_rng(0)
+    corpus = random_corpus(n_behaviours, n_events, max(1, n_events // 50), rng)
+    observed_matrix = behatrix_functions.create_observed_transition_matrix(corpus)
+    exclusion_list = {"b0": ["b1"]} if exclusions else {}
+
+    batch_size = behatrix_functions.permutations_batch_size(
+        n_permutations, n_events, n_behaviours**2
+    )
+
+    tracemalloc.start()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    behatrix_functions.permutations_test(
+        n_permutations,
+        corpus,
+        None,
+        exclusion_list,
+        False,
+        False,
+        observed_matrix,
+        seed=0,
+    )
+    duration = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "behaviours": n_behaviours,
+        "batch size": batch_size,
+        "peak bytes / batch permutation": (peak_memory - start_memory) / batch_size,
+        "peak MB": (peak_memory - start_memory) / 2**20,
+        "µs / permutation": duration / n_permutations * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak of memory of the permutations test"
+    )
+    parser.add_argument(
+        "--events", type=int, default=2000, help="Number of events in corpus"
+    )
+    parser.add_argument(
+        "--permutations", type=int, default=5000, help="Number of permutations"
+    )
+    parser.add_argument(
+        "--behaviours", default="5,50,200", help="Sizes of alphabet (comma separated)"
+    )
+    parser.add_argument(
+        "--exclusions",
+        action="store_true",
+        help="Use the constrained sampler (excluded transition)",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'behaviours':>10}  {'batch size':>10}  {'peak bytes / batch permutation':>30}  "
+        f"{'peak MB':>8}  {'µs / permutation':>17}"
+    )
+    for n_behaviours in (int(x) for x in args.behaviours.split(",")):
+        result = bench(n_behaviours, args.events, args.permutations, args.exclusions)
+        print(
+            f"{result['behaviours']:>10}  {result['batch size']:>10}  "
+            f"{result['peak bytes / batch permutation']:>30.0f}  {result['peak MB']:>8.1f}  "
+            f"{result['µs / permutation']:>17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Behatrix
+Behavioral sequences analysis with permutations test
+
+Benchmark suite of the main functions on synthetic corpora (see markov_corpus.py)
+
+For each scale point the throughput (events, permutations or pairs of sequences per second),
+the duration and the peak of memory traced by tracemalloc (separate run) are reported.
+The results can be saved in a JSON file and compared with a baseline saved by a previous version:
+the benchmarks slower than the baseline by more than the tolerance are reported as regressions
+(exit code 1). baseline.json was recorded with version 0.18 (lists of behaviours, see legacy_task).
+
+Usage (from the root of the repository):
+    python3 -m benchmarks.bench_suite [--preset quick|full] [--save results.json]
+    python3 -m benchmarks.bench_suite --compare benchmarks/baseline.json [--tolerance 0.2]
+"""
+
+import argparse
+import datetime as dt
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from behatrix import behatrix_functions, version
+
+from .markov_corpus import markov_corpus
+
+# scale points of each benchmark
+PRESETS = {
+    "quick": {
+        "observed_matrix": [
+            {"behaviours": 10, "sequences": 100, "length": 100},
+            {"behaviours": 50, "sequences": 1000, "length": 100},
+        ],
+        "permutations_test": [
+            {"behaviours": 10, "sequences": 20, "length": 50, "permutations": 5000},
+            {"behaviours": 50, "sequences": 100, "length": 100, "permutations": 1000},
+        ],
+        "permutations_test_exclusions": [
+            {
+                "behaviours": 10,
+                "sequences": 20,
+                "length": 10,
+                "permutations": 200,
+                "exclusion_density": 0.05,
+            },
+        ],
+        "levenshtein_distance_seq_list": [
+            {"behaviours": 10, "sequences": 20, "length": 20},
+        ],
+        "needleman_wunsch_identity_seq_list": [
+            {"behaviours": 10, "sequences": 20, "length": 20},
+        ],
+        "levenshtein_pairs": [
+            {"behaviours": 10, "sequences": 200, "length": 50, "max_distance": 5},
+        ],
+        "sequences_index_nearest": [
+            {"behaviours": 10, "sequences": 1000, "length": 50, "k": 5},
+        ],
+    },
+    "full": {
+        "observed_matrix": [
+            {"behaviours": 10, "sequences": 100, "length": 100},
+            {"behaviours": 50, "sequences": 1000, "length": 100},
+            {"behaviours": 200, "sequences": 10000, "length": 100},
+        ],
+        "permutations_test": [
+            {"behaviours": 10, "sequences": 20, "length": 50, "permutations": 10000},
+            {"behaviours": 50, "sequences": 100, "length": 100, "permutations": 5000},
+            {"behaviours": 200, "sequences": 1000, "length": 100, "permutations": 500},
+        ],
+        "permutations_test_exclusions": [
+            {
+                "behaviours": 10,
+                "sequences": 20,
+                "length": 10,
+                "permutations": 1000,
+                "exclusion_density": 0.05,
+            },
+            {
+                "behaviours": 20,
+                "sequences": 20,
+                "length": 20,
+                "permutations": 200,
+                "exclusion_density": 0.05,
+            },
+        ],
+        "levenshtein_distance_seq_list": [
+            {"behaviours": 10, "sequences": 20, "length": 20},
+            {"behaviours": 10, "sequences": 50, "length": 50},
+        ],
+        "needleman_wunsch_identity_seq_list": [
+            {"behaviours": 10, "sequences": 20, "length": 20},
+            {"behaviours": 10, "sequences": 50, "length": 50},
+        ],
+        "levenshtein_pairs": [
+            {"behaviours": 10, "sequences": 200, "length": 50, "max_distance": 5},
+            {"behaviours": 10, "sequences": 1000, "length": 100, "max_distance": 10},
+        ],
+        "sequences_index_nearest": [
+            {"behaviours": 10, "sequences": 1000, "length": 50, "k": 5},
+            {"behaviours": 10, "sequences": 10000, "length": 50, "k": 5},
+        ],
+    },
+}
+
+# length distribution and seed of the synthetic corpora
+LENGTH_DISTRIBUTION = "poisson"
+SEED = 1
+
+
+def synthetic_corpus(params: dict) -> dict:
+    """
+    synthetic corpus of a scale point
+    """
+    return markov_corpus(
+        params["behaviours"],
+        params["sequences"],
+        params["length"],
+        LENGTH_DISTRIBUTION,
+        params.get("exclusion_density", 0.0),
+        SEED,
+    )
+
+
+def task(benchmark: str, params: dict) -> tuple:
+    """
+    function to benchmark and the number of items it processes
+
+    Returns:
+        function: function without argument
+        int: number of items processed by the function
+        str: unit of the throughput
+    """
+    corpus = synthetic_corpus(params)
+    n_sequences = len(corpus["sequences"])
+
+    if benchmark in (
+        "levenshtein_distance_seq_list",
+        "needleman_wunsch_identity_seq_list",
+    ):
+        function = getattr(behatrix_functions, benchmark)
+        return (
+            lambda: function(corpus["sequences"]),
+            n_sequences * (n_sequences - 1) // 2,
+            "pairs/s",
+        )
+
+    if not hasattr(behatrix_functions, "as_corpus"):
+        return legacy_task(benchmark, params, corpus)
+
+    encoded = behatrix_functions.as_corpus(corpus["sequences"], corpus["behaviours"])
+
+    if benchmark == "observed_matrix":
+        return (
+            lambda: behatrix_functions.create_observed_transition_matrix(encoded),
+            encoded.n_events,
+            "events/s",
+        )
+
+    if benchmark in ("permutations_test", "permutations_test_exclusions"):
+        observed_matrix = behatrix_functions.create_observed_transition_matrix(encoded)
+        return (
+            lambda: behatrix_functions.permutations_test(
+                params["permutations"],
+                encoded,
+                None,
+                {
+                    behaviour: list(excluded)
+                    for behaviour, excluded in corpus["exclusion_list"].items()
+                },
+                False,
+                False,
+                observed_matrix,
+                seed=SEED,
+                exact=False,
+            ),
+            params["permutations"],
+            "permutations/s",
+        )
+
+    if benchmark == "levenshtein_pairs":
+        return (
+            lambda: behatrix_functions.levenshtein_pairs(
+                corpus["sequences"], params["max_distance"]
+            ),
+            n_sequences * (n_sequences - 1) // 2,
+            "pairs/s",
+        )
+
+    if benchmark == "sequences_index_nearest":
+        from behatrix import behatrix_index
+
+        # the last sequences are the queries
+        n_queries = max(1, n_sequences // 10)
+        index = behatrix_index.SequencesIndex(corpus["sequences"][:-n_queries])
+        return (
+            lambda: [
+                index.nearest(query, params["k"])
+                for query in corpus["sequences"][-n_queries:]
+            ],
+            n_queries,
+            "queries/s",
+        )
+
+    raise ValueError(f"Unknown benchmark: {benchmark}")
+
+
+def legacy_task(benchmark: str, params: dict, corpus: dict) -> tuple:
+    """
+    function to benchmark with the lists of behaviours of the versions before the encoded corpus
+    (version 0.18, used to record the baseline)
+
+    Raises:
+        NotImplementedError: the benchmark is not available in this version
+    """
+    behaviours = corpus["behaviours"]
+
+    if benchmark == "observed_matrix":
+        return (
+            lambda: behatrix_functions.create_observed_transition_matrix(
+                corpus["sequences"], behaviours
+            ),
+            sum(len(sequence) for sequence in corpus["sequences"]),
+            "events/s",
+        )
+
+    if benchmark in ("permutations_test", "permutations_test_exclusions"):
+        observed_matrix = behatrix_functions.create_observed_transition_matrix(
+            corpus["sequences"], behaviours
+        )
+
+        def function():
+            # the permutations are drawn with the random module
+            random.seed(SEED)
+            return behatrix_functions.permutations_test(
+                params["permutations"],
+                corpus["sequences"],
+                behaviours,
+                {
+                    behaviour: list(excluded)
+                    for behaviour, excluded in corpus["exclusion_list"].items()
+                },
+                False,
+                False,
+                observed_matrix,
+            )
+
+        return function, params["permutations"], "permutations/s"
+
+    raise NotImplementedError(f"{benchmark} is not available in this version")
+
+
+def bench(benchmark: str, params: dict, memory: bool = True) -> dict:
+    """
+    run a benchmark: one run for the throughput and one traced run for the peak of memory
+    """
+    function, n_items, unit = task(benchmark, params)
+
+    start = time.perf_counter()
+    function()
+    duration = time.perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = (peak_memory - start_memory) / 2**20
+
+    return {
+        "benchmark": benchmark,
+        "params": params,
+        "items": n_items,
+        "seconds": duration,
+        "throughput": n_items / duration,
+        "unit": unit,
+        "peak_mb": peak_mb,
+    }
+
+
+def result_key(result: dict) -> str:
+    """
+    key of a result (benchmark and scale point) to compare with the baseline
+    """
+    return f"{result['benchmark']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> int:
+    """
+    compare the results with the baseline
+
+    Returns:
+        int: number of regressions
+    """
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    print(
+        f"\nComparison with baseline (Behatrix {baseline['behatrix']}, {baseline['date']})"
+    )
+    regressions = 0
+    for result in results:
+        reference = baseline_results.get(result_key(result))
+        if reference is None:
+            print(f"{result_key(result)}: not in baseline")
+            continue
+        ratio = result["throughput"] / reference["throughput"]
+        status = ""
+        if ratio < 1 - tolerance:
+            status = "REGRESSION"
+            regressions += 1
+        elif ratio > 1 + tolerance:
+            status = "faster"
+        print(f"{result_key(result)}: x{ratio:.2f} {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Behatrix benchmark suite")
+    parser.add_argument(
+        "--preset", choices=tuple(PRESETS), default="quick", help="Scale points"
+    )
+    parser.add_argument(
+        "--benchmarks",
+        default="",
+        help=f"Benchmarks to run (comma separated, default all: {','.join(PRESETS['quick'])})",
+    )
+    parser.add_argument("--save", default="", help="Save the results in a JSON file")
+    parser.add_argument(
+        "--compare", default="", help="Compare the results with a baseline JSON file"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown reported as regression (default: 0.2)",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Do not measure the peak of memory (no traced run)",
+    )
+    args = parser.parse_args()
+
+    benchmarks = PRESETS[args.preset]
+    if args.benchmarks:
+        benchmarks = {
+            benchmark: benchmarks[benchmark] for benchmark in args.benchmarks.split(",")
+        }
+
+    print(f"{'benchmark':<36}  {'scale point':<70}  {'throughput':>27}  {'peak MB':>8}")
+    results = []
+    for benchmark, scale_points in benchmarks.items():
+        for params in scale_points:
+            try:
+                result = bench(benchmark, params, memory=not args.no_memory)
+            except NotImplementedError as exc:
+                print(f"{benchmark:<36}  {json.dumps(params):<70}  {exc}")
+                continue
+            results.append(result)
+            peak = "" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+            print(
+                f"{benchmark:<36}  {json.dumps(params):<70}  "
+                f"{result['throughput']:>12.1f} {result['unit']:<14}  {peak:>8}"
+            )
+
+    report = {
+        "behatrix": version.__version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "date": dt.datetime.now().isoformat(timespec="seconds"),
+        "preset": args.preset,
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f_out:
+            json.dump(report, f_out, indent=1)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f_in:
+            baseline = json.load(f_in)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
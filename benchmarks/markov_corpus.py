@@ -0,0 +1,206 @@
+"""
+Behatrix
+Behavioral sequences analysis with permutations test
+
+Synthetic corpus of behavioral sequences sampled from a random Markov chain
+
+The transition probabilities of the chain are drawn from a Dirichlet distribution.
+A fraction of the transitions (exclusion density) can be forbidden: their probability is 0
+and they are returned as exclusion list for the permutations test.
+
+Usage (from the root of the repository, write the sequences and the excluded transitions in files):
+    python3 -m benchmarks.markov_corpus --behaviours 10 --sequences 100 --length 50 \\
+        --length-distribution poisson --exclusion-density 0.1 --seed 1 -o corpus
+"""
+
+import argparse
+import string
+
+import numpy as np
+
+# distributions of the lengths of the sequences
+LENGTH_DISTRIBUTIONS = ("fixed", "poisson", "geometric")
+
+
+def behaviour_names(n_behaviours: int) -> list:
+    """
+    names of the behaviors: letters (single characters) if possible
+    """
+    if n_behaviours <= len(string.ascii_uppercase):
+        return list(string.ascii_uppercase[:n_behaviours])
+    return [f"b{i}" for i in range(n_behaviours)]
+
+
+def markov_chain(
+    n_behaviours: int,
+    rng: np.random.Generator,
+    exclusion_density: float = 0.0,
+    concentration: float = 1.0,
+) -> tuple:
+    """
+    random Markov chain
+
+    Args:
+        n_behaviours (int): number of behaviors (states)
+        rng (np.random.Generator): random generator
+        exclusion_density (float): fraction of forbidden transitions (at least one transition is allowed
+                                   after each behavior)
+        concentration (float): parameter of the Dirichlet distribution (low values give more predictable chains)
+
+    Returns:
+        np.ndarray: transition probabilities (n_behaviours x n_behaviours)
+        np.ndarray: boolean matrix of the allowed transitions
+    """
+    probabilities = rng.dirichlet(np.full(n_behaviours, concentration), n_behaviours)
+    allowed = rng.random((n_behaviours, n_behaviours)) >= exclusion_density
+    # keep at least the most probable transition after each behavior
+    allowed[np.arange(n_behaviours), probabilities.argmax(axis=1)] = True
+    probabilities *= allowed
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return probabilities, allowed
+
+
+def sequence_lengths(
+    n_sequences: int,
+    mean_length: int,
+    rng: np.random.Generator,
+    distribution: str = "poisson",
+) -> np.ndarray:
+    """
+    random lengths of sequences (at least 2 behaviors)
+
+    Args:
+        n_sequences (int): number of sequences
+        mean_length (int): mean length
+        rng (np.random.Generator): random generator
+        distribution (str): fixed, poisson or geometric
+
+    Returns:
+        np.ndarray: lengths of the sequences
+    """
+    if distribution == "fixed":
+        lengths = np.full(n_sequences, mean_length)
+    elif distribution == "poisson":
+        lengths = rng.poisson(mean_length, n_sequences)
+    elif distribution == "geometric":
+        lengths = rng.geometric(1 / max(mean_length, 1), n_sequences)
+    else:
+        raise ValueError(f"Unknown length distribution: {distribution}")
+    return np.maximum(lengths, 2)
+
+
+def markov_corpus(
+    n_behaviours: int,
+    n_sequences: int,
+    mean_length: int,
+    length_distribution: str = "poisson",
+    exclusion_density: float = 0.0,
+    seed=None,
+) -> dict:
+    """
+    sample sequences from a random Markov chain
+
+    All the sequences are sampled together (one vectorized step by position).
+
+    Args:
+        n_behaviours (int): size of the alphabet
+        n_sequences (int): number of sequences
+        mean_length (int): mean length of the sequences
+        length_distribution (str): distribution of the lengths (see LENGTH_DISTRIBUTIONS)
+        exclusion_density (float): fraction of forbidden transitions
+        seed (int): seed of the random generator
+
+    Returns:
+        dict: sequences: list of sequences (list of behaviors)
+              behaviours: alphabet
+              exclusion_list: forbidden transitions (see behatrix_functions.check_exclusion_list)
+              probabilities: transition probabilities of the chain
+    """
+    rng = np.random.default_rng(seed)
+    behaviours = behaviour_names(n_behaviours)
+    probabilities, allowed = markov_chain(n_behaviours, rng, exclusion_density)
+    lengths = sequence_lengths(n_sequences, mean_length, rng, length_distribution)
+
+    cumulative = probabilities.cumsum(axis=1)
+    codes = np.empty((n_sequences, int(lengths.max())), dtype=np.int64)
+    codes[:, 0] = rng.integers(0, n_behaviours, n_sequences)
+    for position in range(1, codes.shape[1]):
+        draws = rng.random(n_sequences)
+        codes[:, position] = np.minimum(
+            (cumulative[codes[:, position - 1]] < draws[:, None]).sum(axis=1),
+            n_behaviours - 1,
+        )
+
+    return {
+        "sequences": [
+            [behaviours[code] for code in row[:length]]
+            for row, length in zip(codes.tolist(), lengths.tolist())
+        ],
+        "behaviours": behaviours,
+        "exclusion_list": {
+            behaviours[code1]: [
+                behaviours[code2] for code2 in np.flatnonzero(~allowed[code1])
+            ]
+            for code1 in range(n_behaviours)
+            if not allowed[code1].all()
+        },
+        "probabilities": probabilities,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Synthetic behavioral sequences sampled from a random Markov chain"
+    )
+    parser.add_argument("--behaviours", type=int, default=10, help="Size of alphabet")
+    parser.add_argument(
+        "--sequences", type=int, default=100, help="Number of sequences"
+    )
+    parser.add_argument(
+        "--length", type=int, default=50, help="Mean length of sequences"
+    )
+    parser.add_argument(
+        "--length-distribution",
+        choices=LENGTH_DISTRIBUTIONS,
+        default="poisson",
+        help="Distribution of the lengths of sequences",
+    )
+    parser.add_argument(
+        "--exclusion-density",
+        type=float,
+        default=0.0,
+        help="Fraction of forbidden transitions",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Prefix of output files (OUTPUT.txt and OUTPUT.exclusions.txt)",
+    )
+    args = parser.parse_args()
+
+    corpus = markov_corpus(
+        args.behaviours,
+        args.sequences,
+        args.length,
+        args.length_distribution,
+        args.exclusion_density,
+        args.seed,
+    )
+    # a separator is required for the behaviors with several characters
+    separator = "" if args.behaviours <= len(string.ascii_uppercase) else ","
+    with open(f"{args.output}.txt", "w", encoding="utf-8") as f_out:
+        f_out.write(
+            "\n".join(separator.join(sequence) for sequence in corpus["sequences"])
+            + "\n"
+        )
+    with open(f"{args.output}.exclusions.txt", "w", encoding="utf-8") as f_out:
+        f_out.writelines(
+            f"{behaviour}:{separator.join(excluded)}\n"
+            for behaviour, excluded in corpus["exclusion_list"].items()
+        )
+
+
+if __name__ == "__main__":
+    main()